@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Command line interface for Dotwork Server Bootstrapper
+"""
+import argparse
+import os
+import sys
+from datetime import timedelta
+
+from core.agent import Agent
+from core.agent_client import AgentClient, file_results_from_dict
+from core.batch_create import BatchCreator, coerce_variables, load_instance_matrix
+from core.drift_scanner import DriftScanner
+from core.instance_bundle import InstanceBundler
+from core.instance_clone import LINK_AUTO, LINK_COPY, CloneStats, InstanceCloner
+from core.instance_discovery import discover_instances, get_search_paths
+from core.io_limiter import configure_io, io_limits
+from core.metrics import REGISTRY
+from core.rollout import RolloutPolicy, RolloutRunner
+from core.template_manager import TemplateManager
+from core.template_packer import pack_template
+from core.tracing import start_tracing, stop_tracing
+from models.result import DriftReport
+from models.template_package import PACKAGE_EXTENSION
+from utils.config import get_config_manager
+from utils.logger import get_logger
+
+
+def select_instances(config, names):
+    instances, _ = discover_instances(get_search_paths(config))
+    if names:
+        instances = [instance for instance in instances if instance.name in names]
+    return instances
+
+
+def get_template_manager(args):
+    return TemplateManager(config_manager=get_config_manager(args.config))
+
+
+def job_io_limits(args):
+    """The --io-* caps of this run, as io_limits() keyword arguments."""
+    limits = {
+        "read_mb_per_s": args.io_read_mbps,
+        "write_mb_per_s": args.io_write_mbps,
+        "read_iops": args.io_read_iops,
+        "write_iops": args.io_write_iops,
+    }
+    return {key: value for key, value in limits.items() if value}
+
+
+def get_agent_client(args, config):
+    url = args.agent if args.agent is not None else config.agent_url
+    return AgentClient.from_config(config, url) if url else None
+
+
+def cmd_drift(args, config) -> int:
+    client = get_agent_client(args, config)
+    if client is not None:
+        data = client.run("drift", {"instances": args.instance})
+        report = DriftReport(
+            processed_files=file_results_from_dict(data),
+            scanned_instances=data["scanned_instances"],
+            drifted_instances=data["drifted_instances"],
+            duration=data["duration"]
+        )
+    else:
+        template_manager = get_template_manager(args)
+        instances = select_instances(config, args.instance)
+        report = DriftScanner(template_manager, args.workers).scan(instances)
+
+    if args.json:
+        print(report.to_json())
+    else:
+        for result in report.processed_files:
+            if result.status != "Unchanged":
+                print(f"{result.status:<9} {result.reason:<16} {result.path}")
+        print(f"Scanned {report.scanned_instances} instances in {report.duration:.2f}s, "
+              f"{len(report.drifted_instances)} drifted")
+
+    return 1 if report.drifted_instances else 0
+
+
+def cmd_update(args, config) -> int:
+    client = get_agent_client(args, config)
+    instances = select_instances(config, args.instance)
+
+    if client is not None:
+        def update(instance, dry_run):
+            return file_results_from_dict(client.run(
+                "update", {"instance": instance.name, "dry_run": dry_run, "io_limits": job_io_limits(args)}))
+    else:
+        template_manager = get_template_manager(args)
+
+        def update(instance, dry_run):
+            return template_manager.update_instance_from_template(instance, dry_run).processed_files
+
+    policy = RolloutPolicy.from_config(config)
+    policy.dry_run = args.dry_run
+    for option in ("canary_count", "batch_size", "concurrency", "max_failure_rate", "pause_seconds"):
+        value = getattr(args, option)
+        if value is not None:
+            setattr(policy, option, value)
+
+    def progress(done, total, instance):
+        print(f"[{done}/{total}] {instance.name}", file=sys.stderr)
+
+    result = RolloutRunner(update).run(instances, policy, progress)
+
+    for file_result in result.processed_files:
+        if file_result.status != "Unchanged":
+            print(f"{file_result.status:<9} {file_result.reason:<16} {file_result.path}")
+    for name, error in result.failed.items():
+        print(f"{name}: failed: {error}", file=sys.stderr)
+    if result.aborted:
+        print(f"Rollout stopped ({result.abort_reason}), {len(result.skipped)} instances not updated",
+              file=sys.stderr)
+    print(f"Updated {len(result.updated)} of {len(instances)} instances, {len(result.failed)} failed")
+
+    return 1 if result.failed or result.aborted else 0
+
+
+def cmd_batch_create(args, config) -> int:
+    template_manager = get_template_manager(args)
+    template = template_manager.get_template_by_name(args.template)
+    specs = load_instance_matrix(args.matrix)
+    output_dir = args.output_dir or config.default_output_dir
+
+    try:
+        instances, result = BatchCreator(template_manager, args.workers).create(
+            template, specs, output_dir, args.dry_run)
+    except ValueError as e:
+        print(f"Invalid instance matrix:\n{e}", file=sys.stderr)
+        return 2
+
+    errors = [r for r in result.processed_files if r.status == "Error"]
+    for error in errors:
+        print(f"{error.path}: failed: {error.reason}", file=sys.stderr)
+    if args.dry_run:
+        print(f"{len(specs)} instances valid, {len(result.processed_files)} files would be created")
+    else:
+        print(f"Created {len(instances)} of {len(specs)} instances "
+              f"({len(result.processed_files) - len(errors)} files)")
+    return 1 if errors else 0
+
+
+def cmd_ports(args, config) -> int:
+    index = get_template_manager(args).variable_index
+
+    if args.check is not None:
+        owners = index.port_owners(args.check)
+        if owners:
+            print(f"Port {args.check} is used by {', '.join(owners)}")
+            return 1
+        print(f"Port {args.check} is free")
+        return 0
+
+    if args.next is not None:
+        reserved = set()
+        for _ in range(args.count):
+            port = index.next_free_port(args.next, reserved)
+            reserved.add(port)
+            print(port)
+        return 0
+
+    for port, owners in index.used_ports().items():
+        marker = "  CONFLICT" if len(owners) > 1 else ""
+        print(f"{port:<6} {', '.join(owners)}{marker}")
+    return 0
+
+
+def cmd_agent(args, config) -> int:
+    Agent(get_config_manager(args.config), args.workers).serve(args.host, args.port)
+    return 0
+
+
+def cmd_scrub(args, config) -> int:
+    scrubber = get_template_manager(args).backup_scrubber
+    if args.all:
+        scrubber.interval = timedelta(0)
+    if args.rate is not None:
+        scrubber.limiter.configure(read_mb_per_s=args.rate)
+
+    result = scrubber.run_once(args.limit)
+    for entry in result.corrupt:
+        print(f"CORRUPT  {entry.path}: {entry.verify_error}")
+    print(f"Verified {result.verified} archives ({result.bytes_read / 1024 / 1024:.1f} MiB) "
+          f"in {result.duration:.1f}s, {len(result.corrupt)} corrupt")
+    return 1 if scrubber.catalog.corrupt_entries() else 0
+
+
+def cmd_clone(args, config) -> int:
+    instances = select_instances(config, [args.source])
+    if not instances:
+        print(f"Instance '{args.source}' not found", file=sys.stderr)
+        return 2
+    source = instances[0]
+
+    template_manager = get_template_manager(args)
+    template = template_manager.get_template_by_name(source.template_name)
+    link_mode = LINK_COPY if args.copy else LINK_AUTO
+    output_dir = args.output_dir or os.path.dirname(source.path)
+
+    overrides = {}
+    for assignment in args.set:
+        key, separator, value = assignment.partition("=")
+        if not separator:
+            print(f"Expected KEY=VALUE, got '{assignment}'", file=sys.stderr)
+            return 2
+        overrides[key.strip()] = value
+    overrides = {key: value for key, value in coerce_variables(template, overrides).items() if key in overrides}
+
+    client = get_agent_client(args, config)
+    if client is not None:
+        data = client.run("clone", {"instance": source.name, "name": args.name, "variables": overrides,
+                                    "keep_ports": args.keep_ports, "output_dir": output_dir, "link": link_mode,
+                                    "io_limits": job_io_limits(args)})
+        print(f"Cloned {source.name} -> {data['instance']['path']}: {CloneStats(**data['stats']).describe()}")
+        return 0
+
+    cloner = InstanceCloner(template_manager, link_mode)
+    variables = {} if args.keep_ports else cloner.suggest_variables(source)
+    variables.update(overrides)
+
+    errors = cloner.check(source, args.name, output_dir, variables)
+    if errors:
+        print("Cannot clone:\n" + "\n".join(errors), file=sys.stderr)
+        return 2
+
+    instance, stats = cloner.clone(source, args.name, output_dir, variables)
+    for key, value in sorted(variables.items()):
+        print(f"{key} = {value}")
+    print(f"Cloned {source.name} -> {instance.path}: {stats.describe()}")
+    return 0
+
+
+def cmd_pack(args, config) -> int:
+    template_dir = args.template_dir.rstrip("/\\")
+    output = args.output or template_dir + PACKAGE_EXTENSION
+    pack_template(template_dir, output, config.hash_algorithm)
+    print(f"Packed {template_dir} -> {output}")
+    return 0
+
+
+def cmd_export(args, config) -> int:
+    instances = select_instances(config, [args.instance])
+    if not instances:
+        print(f"Instance '{args.instance}' not found", file=sys.stderr)
+        return 2
+
+    bundler = InstanceBundler(get_template_manager(args), args.workers)
+    if args.output == "-":
+        count = bundler.export_instance(instances[0], sys.stdout.buffer, args.dedup_template)
+    else:
+        with open(args.output, "wb") as f:
+            count = bundler.export_instance(instances[0], f, args.dedup_template)
+    print(f"Exported {count} files from {instances[0].name}", file=sys.stderr)
+    return 0
+
+
+def cmd_import(args, config) -> int:
+    bundler = InstanceBundler(get_template_manager(args))
+    output_dir = args.output_dir or config.default_output_dir
+    if args.input == "-":
+        instance = bundler.import_instance(sys.stdin.buffer, output_dir, args.name)
+    else:
+        with open(args.input, "rb") as f:
+            instance = bundler.import_instance(f, output_dir, args.name)
+    print(f"Imported {instance.name} -> {instance.path}", file=sys.stderr)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="dotwork", description="Dotwork Server Bootstrapper CLI")
+    parser.add_argument("--config", default="config.yml", help="Path to config file")
+    parser.add_argument("--agent", default=None,
+                        help="Agent URL to submit jobs to (default: agent_url from config, '' for local)")
+    parser.add_argument("--trace", default=None,
+                        help="Record a Chrome trace of the run to this file (open in chrome://tracing or Perfetto)")
+    parser.add_argument("--metrics-textfile", default=None,
+                        help="Write Prometheus metrics to this file after the run, for node_exporter's "
+                             "textfile collector (default: metrics_textfile from config)")
+    parser.add_argument("--io-read-mbps", type=float, default=None,
+                        help="Cap disk reads of this run in MB/s, on top of io_read_mb_per_s from config")
+    parser.add_argument("--io-write-mbps", type=float, default=None,
+                        help="Cap disk writes of this run in MB/s, on top of io_write_mb_per_s from config")
+    parser.add_argument("--io-read-iops", type=float, default=None, help="Cap read operations per second")
+    parser.add_argument("--io-write-iops", type=float, default=None, help="Cap write operations per second")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    drift_parser = subparsers.add_parser("drift", help="Report files that differ from their template render")
+    drift_parser.add_argument("instance", nargs="*", help="Instance names (default: all)")
+    drift_parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    drift_parser.add_argument("--workers", type=int, default=None, help="Number of parallel scans")
+    drift_parser.set_defaults(func=cmd_drift)
+
+    update_parser = subparsers.add_parser("update", help="Update instances from their templates")
+    update_parser.add_argument("instance", nargs="*", help="Instance names (default: all)")
+    update_parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    update_parser.add_argument("--canary", dest="canary_count", type=int, default=None,
+                               help="Instances to update first; any failure among them stops the rollout")
+    update_parser.add_argument("--batch-size", type=int, default=None, help="Instances per batch after the canary")
+    update_parser.add_argument("--concurrency", type=int, default=None, help="Parallel updates within a batch")
+    update_parser.add_argument("--max-failure-rate", type=float, default=None,
+                               help="Stop once this fraction of attempted updates has failed (0-1)")
+    update_parser.add_argument("--pause", dest="pause_seconds", type=float, default=None,
+                               help="Seconds to wait between batches")
+    update_parser.set_defaults(func=cmd_update)
+
+    batch_parser = subparsers.add_parser("batch-create", help="Create many instances from a CSV/YAML matrix")
+    batch_parser.add_argument("template", help="Template name")
+    batch_parser.add_argument("matrix", help="CSV (name column plus one column per variable) or YAML file")
+    batch_parser.add_argument("--output-dir", help="Directory for rows without output_dir (default: default_output_dir)")
+    batch_parser.add_argument("--workers", type=int, default=None, help="Instances created in parallel")
+    batch_parser.add_argument("--dry-run", action="store_true", help="Only validate the matrix")
+    batch_parser.set_defaults(func=cmd_batch_create)
+
+    ports_parser = subparsers.add_parser("ports", help="List ports used across instances or find free ones")
+    ports_parser.add_argument("--check", type=int, default=None, help="Report which instances use this port")
+    ports_parser.add_argument("--next", type=int, default=None, metavar="START",
+                              help="Print the next free port at or above START")
+    ports_parser.add_argument("--count", type=int, default=1, help="Number of free ports to print with --next")
+    ports_parser.set_defaults(func=cmd_ports)
+
+    agent_parser = subparsers.add_parser("agent", help="Run the provisioning agent daemon")
+    agent_parser.add_argument("--host", default=None, help="Bind address (default: agent_host from config)")
+    agent_parser.add_argument("--port", type=int, default=None, help="Port (default: agent_port from config)")
+    agent_parser.add_argument("--workers", type=int, default=None,
+                              help="Concurrent jobs (default: scheduler_workers from config)")
+    agent_parser.set_defaults(func=cmd_agent)
+
+    scrub_parser = subparsers.add_parser("scrub", help="Verify backup archives that are due for a check")
+    scrub_parser.add_argument("--all", action="store_true", help="Verify every archive, not only the due ones")
+    scrub_parser.add_argument("--limit", type=int, default=None, help="Verify at most this many archives")
+    scrub_parser.add_argument("--rate", type=float, default=None, help="Read budget in MB/s (default: config)")
+    scrub_parser.set_defaults(func=cmd_scrub)
+
+    clone_parser = subparsers.add_parser("clone", help="Create an instance from an existing one, data included")
+    clone_parser.add_argument("source", help="Instance to clone")
+    clone_parser.add_argument("name", help="Name of the new instance")
+    clone_parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                              help="Variable to change in the clone (repeatable)")
+    clone_parser.add_argument("--output-dir", help="Directory for the clone (default: next to the source)")
+    clone_parser.add_argument("--keep-ports", action="store_true",
+                              help="Keep the source's ports instead of moving them to the next free ones")
+    clone_parser.add_argument("--copy", action="store_true", help="Copy every file instead of reflinking")
+    clone_parser.set_defaults(func=cmd_clone)
+
+    pack_parser = subparsers.add_parser("pack", help="Pack a template directory into a single indexed file")
+    pack_parser.add_argument("template_dir", help="Template directory to pack")
+    pack_parser.add_argument("-o", "--output", help=f"Output file (default: <template_dir>{PACKAGE_EXTENSION})")
+    pack_parser.set_defaults(func=cmd_pack)
+
+    export_parser = subparsers.add_parser("export", help="Stream an instance into a bundle")
+    export_parser.add_argument("instance", help="Instance name")
+    export_parser.add_argument("-o", "--output", default="-", help="Bundle file, '-' for stdout (default)")
+    export_parser.add_argument("--dedup-template", action="store_true",
+                               help="Reference files identical to the template instead of sending them")
+    export_parser.add_argument("--workers", type=int, default=None, help="Compression threads")
+    export_parser.set_defaults(func=cmd_export)
+
+    import_parser = subparsers.add_parser("import", help="Create an instance from a bundle")
+    import_parser.add_argument("input", nargs="?", default="-", help="Bundle file, '-' for stdin (default)")
+    import_parser.add_argument("--output-dir", help="Directory to import into (default: default_output_dir)")
+    import_parser.add_argument("--name", help="Rename the instance on import")
+    import_parser.set_defaults(func=cmd_import)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    config = get_config_manager(args.config).get_config()
+    get_logger().configure(config)
+    configure_io(config)
+    metrics_textfile = args.metrics_textfile if args.metrics_textfile is not None else config.metrics_textfile
+    if args.trace:
+        start_tracing()
+    try:
+        with io_limits(**job_io_limits(args)):
+            return args.func(args, config)
+    finally:
+        if args.trace:
+            stop_tracing(args.trace)
+        if metrics_textfile:
+            REGISTRY.write_textfile(metrics_textfile)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,453 @@
+import hmac
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import asdict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+from core.drift_scanner import DriftScanner
+from core.instance_clone import LINK_AUTO, InstanceCloner
+from core.instance_discovery import discover_instances, get_search_paths
+from core.io_limiter import configure_io, io_limits
+from core.metrics import REGISTRY
+from core.scheduler import PRIORITY_BACKGROUND, PRIORITY_NORMAL, parse_priority
+from core.template_manager import TemplateManager
+from models.ignore_rules import SECTION_BACKUP
+from models.instance import ServerInstance
+from models.result import ProvisionResult
+from utils.config import ConfigManager
+from utils.logger import get_logger
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# Clients send the per-install token in this header; only /health and /metrics go without it
+TOKEN_HEADER = 'X-Dotwork-Token'
+
+
+def load_agent_token(token_file: str, create: bool = False) -> str:
+    """Reads the agent's API token; with create, generates it first if there is none yet."""
+    try:
+        with open(token_file, 'r', encoding='utf-8') as f:
+            token = f.read().strip()
+        if token:
+            return token
+    except FileNotFoundError:
+        pass
+    if not create:
+        return ''
+
+    token = secrets.token_urlsafe(32)
+    directory = os.path.dirname(token_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Readable by the installing user only
+    fd = os.open(token_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(token)
+    return token
+
+
+# Priority class of each job type unless the job's params give one
+DEFAULT_PRIORITIES = {
+    'backup': PRIORITY_BACKGROUND,
+    'drift': PRIORITY_BACKGROUND,
+}
+
+
+def job_priority(job_type: str, params: Dict[str, Any]) -> int:
+    return parse_priority(params.get('priority'), DEFAULT_PRIORITIES.get(job_type, PRIORITY_NORMAL))
+
+
+def provision_result_to_dict(result: ProvisionResult) -> Dict[str, Any]:
+    return {
+        'template': result.template.name,
+        'template_version': result.template.version,
+        'is_dry_run': result.is_dry_run,
+        'files': [asdict(file_result) for file_result in result.processed_files]
+    }
+
+
+class JobQueue:
+    """Jobs persisted in SQLite so queued work survives an agent restart."""
+
+    def __init__(self, db_path: str):
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, type TEXT NOT NULL, params TEXT NOT NULL,"
+                " status TEXT NOT NULL, result TEXT, error TEXT,"
+                " created_at TEXT NOT NULL, started_at TEXT, finished_at TEXT)"
+            )
+            # Jobs that were running when the agent stopped are started over
+            self._conn.execute("UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?",
+                               (JOB_QUEUED, JOB_RUNNING))
+            self._conn.commit()
+
+    def submit(self, job_type: str, params: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, type, params, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, job_type, json.dumps(params), JOB_QUEUED, datetime.now().isoformat())
+            )
+            self._conn.commit()
+            self._available.notify()
+        return job_id
+
+    def take(self, timeout: float = 1.0) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._next_queued()
+            if row is None:
+                self._available.wait(timeout)
+                row = self._next_queued()
+            if row is None:
+                return None
+
+            self._conn.execute("UPDATE jobs SET status = ?, started_at = ? WHERE id = ?",
+                               (JOB_RUNNING, datetime.now().isoformat(), row[0]))
+            self._conn.commit()
+        return {'id': row[0], 'type': row[1], 'params': json.loads(row[2])}
+
+    def _next_queued(self):
+        rows = self._conn.execute(
+            "SELECT id, type, params FROM jobs WHERE status = ? ORDER BY created_at", (JOB_QUEUED,)
+        ).fetchall()
+        if not rows:
+            return None
+        # Most urgent class first, oldest first within it; unknown priorities fail when the job runs
+        return min(rows, key=lambda row: self._priority(row[1], row[2]))
+
+    @staticmethod
+    def _priority(job_type: str, params: str) -> int:
+        try:
+            return job_priority(job_type, json.loads(params))
+        except ValueError:
+            return PRIORITY_NORMAL
+
+    def finish(self, job_id: str, result: Any = None, error: Optional[str] = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (JOB_FAILED if error else JOB_DONE, json.dumps(result, default=str), error,
+                 datetime.now().isoformat(), job_id)
+            )
+            self._conn.commit()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, type, params, status, result, error, created_at, started_at, finished_at"
+                " FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def list(self, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, type, params, status, NULL, error, created_at, started_at, finished_at"
+                " FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    @staticmethod
+    def _row_to_dict(row) -> Dict[str, Any]:
+        return {
+            'id': row[0],
+            'type': row[1],
+            'params': json.loads(row[2]),
+            'status': row[3],
+            'result': json.loads(row[4]) if row[4] else None,
+            'error': row[5],
+            'created_at': row[6],
+            'started_at': row[7],
+            'finished_at': row[8]
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class Agent:
+    """Long-running provisioning service that keeps templates, renders and the instance index warm."""
+
+    def __init__(self, config_manager: ConfigManager, workers: Optional[int] = None):
+        self.config_manager = config_manager
+        self.config = config_manager.get_config()
+        self.logger = get_logger()
+        self.template_manager = TemplateManager(config_manager=config_manager)
+        configure_io(self.config)
+        self.queue = JobQueue(self.config.agent_db)
+        self.token = load_agent_token(self.config.agent_token_file, create=True)
+        self.scheduler = self.template_manager.scheduler
+        if workers:
+            self.scheduler.workers = workers
+        self._instances: Dict[str, ServerInstance] = {}
+        self._instances_lock = threading.Lock()
+        # Ports claimed by create and clone jobs that are still provisioning: port -> holder
+        self._reserved_ports: Dict[int, str] = {}
+        self._reserve_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._server: Optional[ThreadingHTTPServer] = None
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+            'create': self._run_create,
+            'update': self._run_update,
+            'clone': self._run_clone,
+            'backup': self._run_backup,
+            'drift': self._run_drift,
+            'refresh': self._run_refresh,
+        }
+        self.refresh_instances()
+
+    def refresh_instances(self) -> int:
+        instances, _ = discover_instances(get_search_paths(self.config))
+        with self._instances_lock:
+            self._instances = {instance.name: instance for instance in instances}
+        self.template_manager.variable_index.build(instances)
+        return len(instances)
+
+    def get_instance(self, name: str) -> ServerInstance:
+        with self._instances_lock:
+            instance = self._instances.get(name)
+        if instance is None:
+            # Created outside the agent since the last refresh
+            self.refresh_instances()
+            with self._instances_lock:
+                instance = self._instances.get(name)
+        if instance is None:
+            raise ValueError(f"Instance '{name}' not found")
+        current = self._reload(instance)
+        if current is None:
+            raise ValueError(f"Instance '{name}' no longer exists at {instance.path}")
+        return current
+
+    def _reload(self, instance: ServerInstance) -> Optional[ServerInstance]:
+        """The instance as its metadata file describes it now, so edits made outside the agent win."""
+        current = ServerInstance.load_from_path(instance.path)
+        if current is not None and current != instance:
+            with self._instances_lock:
+                self._instances.pop(instance.name, None)
+                self._instances[current.name] = current
+            self.template_manager.variable_index.update_instance(current)
+        return current
+
+    def _reserve_ports(self, check: Callable[[Dict[int, str]], List[str]]) -> List[int]:
+        """Runs a conflict check against the fleet and the ports of provisioning jobs, and claims
+        the checked ports if it passes, so concurrent jobs can't take the same port."""
+        with self._reserve_lock:
+            reserved = dict(self._reserved_ports)
+            errors = check(reserved)
+            if errors:
+                raise ValueError("; ".join(errors))
+            claimed = [port for port in reserved if port not in self._reserved_ports]
+            self._reserved_ports.update((port, reserved[port]) for port in claimed)
+        return claimed
+
+    def _release_ports(self, ports: List[int]):
+        with self._reserve_lock:
+            for port in ports:
+                self._reserved_ports.pop(port, None)
+
+    def _run_create(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        template = self.template_manager.get_template_by_name(params['template'])
+        variables = params.get('variables', {})
+        output_dir = params.get('output_dir') or self.config.default_output_dir
+        instance_path = os.path.join(output_dir, params['name'])
+        claimed = self._reserve_ports(
+            lambda reserved: self.template_manager.validate_variables(template, variables)
+            + self.template_manager.check_conflicts(template, variables, instance_path, reserved))
+        try:
+            # Creating the instance adds its ports to the variable index
+            instance = self.template_manager.create_instance(template, params['name'], output_dir, variables)
+        finally:
+            self._release_ports(claimed)
+        with self._instances_lock:
+            self._instances[instance.name] = instance
+        return instance.to_dict()
+
+    def _run_update(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        instance = self.get_instance(params['instance'])
+        result = self.template_manager.update_instance_from_template(instance, params.get('dry_run', False))
+        return provision_result_to_dict(result)
+
+    def _run_clone(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        source = self.get_instance(params['instance'])
+        cloner = InstanceCloner(self.template_manager, params.get('link', LINK_AUTO))
+        output_dir = params.get('output_dir') or os.path.dirname(source.path)
+        # Unless told otherwise the clone moves to free ports so it can run next to the source
+        with self._reserve_lock:
+            reserved_ports = set(self._reserved_ports)
+        variables = {} if params.get('keep_ports') else cloner.suggest_variables(source, reserved_ports)
+        variables.update(params.get('variables', {}))
+        claimed = self._reserve_ports(
+            lambda reserved: cloner.check(source, params['name'], output_dir, variables, reserved))
+        try:
+            instance, stats = cloner.clone(source, params['name'], output_dir, variables)
+        finally:
+            self._release_ports(claimed)
+        with self._instances_lock:
+            self._instances[instance.name] = instance
+        return {'instance': instance.to_dict(), 'stats': asdict(stats)}
+
+    def _run_backup(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        instance = self.get_instance(params['instance'])
+        backup_path = self.template_manager.backup_manager.create_backup(
+            instance, params.get('description', ''),
+            ignore=self.template_manager.ignore_rules(instance).matcher(SECTION_BACKUP)
+        )
+        return {'backup_path': backup_path}
+
+    def _run_drift(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        names = params.get('instances') or []
+        with self._instances_lock:
+            instances = list(self._instances.values())
+        if names:
+            instances = [instance for instance in instances if instance.name in names]
+        instances = [current for current in map(self._reload, instances) if current is not None]
+        return DriftScanner(self.template_manager).scan(instances).to_dict()
+
+    def _run_refresh(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {'instances': self.refresh_instances()}
+
+    def _work(self):
+        while not self._stop.is_set():
+            job = self.queue.take()
+            if job is None:
+                continue
+
+            handler = self.handlers.get(job['type'])
+            started = time.perf_counter()
+            try:
+                if handler is None:
+                    raise ValueError(f"Unknown job type '{job['type']}'")
+                params = job['params']
+                priority = job_priority(job['type'], params)
+                # Per-job caps, e.g. {"io_limits": {"write_mb_per_s": 20}}, on top of the agent's own
+                with io_limits(**params.get('io_limits', {})):
+                    # The scheduler orders jobs by priority and runs one job per instance at a time
+                    result = self.scheduler.run(
+                        job['type'], lambda: handler(params), priority,
+                        instance=params.get('instance') or params.get('name'))
+                self.queue.finish(job['id'], result)
+                self.logger.info(f"Job {job['id']} ({job['type']}) done in {time.perf_counter() - started:.2f}s")
+            except Exception as e:
+                self.queue.finish(job['id'], error=str(e))
+                self.logger.error(f"Job {job['id']} ({job['type']}) failed: {e}")
+
+    def start(self):
+        if self.config.scrub_enabled:
+            self.template_manager.backup_scrubber.start()
+        # One taker per scheduler thread, so an interactive job is taken even while every general worker is busy
+        for _ in range(self.scheduler.workers + self.scheduler.interactive_workers):
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def serve(self, host: Optional[str] = None, port: Optional[int] = None):
+        """Runs the JSON API until interrupted."""
+        self.start()
+        self._server = ThreadingHTTPServer((host or self.config.agent_host, port or self.config.agent_port),
+                                           _make_handler(self))
+        self.logger.info(f"Agent listening on http://{self._server.server_address[0]}:{self._server.server_address[1]}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stop.set()
+        self.template_manager.backup_scrubber.stop()
+        self.scheduler.shutdown(wait=False)
+        if self._server is not None:
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self.queue.close()
+
+
+def _make_handler(agent: Agent):
+    class AgentRequestHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, payload: Any):
+            body = json.dumps(payload, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _authorized(self) -> bool:
+            token = self.headers.get(TOKEN_HEADER, '')
+            if hmac.compare_digest(token.encode('utf-8'), agent.token.encode('utf-8')):
+                return True
+            self._send_json(401, {'error': 'missing or wrong token'})
+            return False
+
+        def do_GET(self):
+            if self.path not in ('/health', '/metrics') and not self._authorized():
+                return
+            if self.path == '/health':
+                self._send_json(200, {'status': 'ok'})
+            elif self.path == '/metrics':
+                body = REGISTRY.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            elif self.path == '/jobs':
+                self._send_json(200, agent.queue.list())
+            elif self.path == '/queue':
+                self._send_json(200, [job.to_dict() for job in agent.scheduler.jobs()])
+            elif self.path.startswith('/jobs/'):
+                job = agent.queue.get(self.path[len('/jobs/'):])
+                if job is None:
+                    self._send_json(404, {'error': 'job not found'})
+                else:
+                    self._send_json(200, job)
+            else:
+                self._send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/jobs':
+                self._send_json(404, {'error': 'not found'})
+                return
+            if not self._authorized():
+                return
+            # Browsers can't send this cross-site without a preflight, unlike text/plain
+            content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            if content_type != 'application/json':
+                self._send_json(415, {'error': 'expected Content-Type: application/json'})
+                return
+
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length).decode('utf-8'))
+                job_type = request['type']
+            except (ValueError, KeyError) as e:
+                self._send_json(400, {'error': f"invalid request: {e}"})
+                return
+
+            if job_type not in agent.handlers:
+                self._send_json(400, {'error': f"unknown job type '{job_type}'"})
+                return
+
+            job_id = agent.queue.submit(job_type, request.get('params', {}))
+            self._send_json(202, {'id': job_id})
+
+        def log_message(self, format, *args):
+            agent.logger.debug(f"agent http: {format % args}")
+
+    return AgentRequestHandler
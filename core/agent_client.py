@@ -0,0 +1,74 @@
+import json
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+from core.agent import JOB_DONE, JOB_FAILED, TOKEN_HEADER, load_agent_token
+from models.result import FileResult
+
+
+class AgentError(Exception):
+    pass
+
+
+class AgentClient:
+    """Submits jobs to a running agent over its local JSON API."""
+
+    def __init__(self, base_url: str, timeout: float = 10.0, token: str = ''):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.token = token
+
+    @classmethod
+    def from_config(cls, config, base_url: Optional[str] = None) -> 'AgentClient':
+        """Client for the configured agent, authenticated with the token the agent wrote."""
+        return cls(base_url or config.agent_url, token=load_agent_token(config.agent_token_file))
+
+    def _request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None) -> Any:
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                         headers={'Content-Type': 'application/json', TOKEN_HEADER: self.token})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            raise AgentError(f"Agent returned {e.code}: {e.read().decode('utf-8', 'replace')}")
+        except urllib.error.URLError as e:
+            raise AgentError(f"Agent not reachable at {self.base_url}: {e.reason}")
+
+    def is_available(self) -> bool:
+        try:
+            return self._request('GET', '/health').get('status') == 'ok'
+        except AgentError:
+            return False
+
+    def submit(self, job_type: str, params: Dict[str, Any]) -> str:
+        return self._request('POST', '/jobs', {'type': job_type, 'params': params})['id']
+
+    def get_job(self, job_id: str) -> Dict[str, Any]:
+        return self._request('GET', f'/jobs/{job_id}')
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        return self._request('GET', '/jobs')
+
+    def wait(self, job_id: str, timeout: Optional[float] = None, poll_interval: float = 0.2) -> Dict[str, Any]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get_job(job_id)
+            if job['status'] in (JOB_DONE, JOB_FAILED):
+                return job
+            if deadline is not None and time.monotonic() > deadline:
+                raise AgentError(f"Timed out waiting for job {job_id}")
+            time.sleep(poll_interval)
+
+    def run(self, job_type: str, params: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        """Submits a job, waits for it and returns its result, raising AgentError if it failed."""
+        job = self.wait(self.submit(job_type, params), timeout)
+        if job['status'] == JOB_FAILED:
+            raise AgentError(job['error'])
+        return job['result']
+
+
+def file_results_from_dict(data: Dict[str, Any]) -> List[FileResult]:
+    return [FileResult(**row) for row in data.get('files', [])]
@@ -0,0 +1,195 @@
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+BACKUP_EXTENSION = '.zip'
+TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+# Verification results of the scrubber, kept next to the archives
+VERIFY_FILE = '.dotwork_verify.json'
+
+VERIFY_OK = 'ok'
+VERIFY_CORRUPT = 'corrupt'
+
+# <instance>_<YYYYmmdd>_<HHMMSS>[_<n>].zip; the instance name may itself contain underscores
+_BACKUP_NAME = re.compile(r'^(?P<instance>.+)_(?P<timestamp>\d{8}_\d{6})(?:_\d+)?\.zip$')
+
+
+@dataclass
+class BackupEntry:
+    path: str
+    instance_name: str
+    created: datetime
+    size: int
+    verified_at: Optional[datetime] = None
+    verify_status: str = ''
+    verify_error: str = ''
+
+    @property
+    def is_corrupt(self) -> bool:
+        return self.verify_status == VERIFY_CORRUPT
+
+    @property
+    def filename(self) -> str:
+        return os.path.basename(self.path)
+
+
+def parse_backup_filename(path: str) -> Optional[BackupEntry]:
+    match = _BACKUP_NAME.match(os.path.basename(path))
+    if match is None:
+        return None
+    try:
+        created = datetime.strptime(match.group('timestamp'), TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+    return BackupEntry(path=path, instance_name=match.group('instance'), created=created, size=0)
+
+
+class BackupCatalog:
+    """In-memory index of the archives in the backup directory, grouped by exact instance name.
+
+    The directory is listed once; after that the catalog is kept current by
+    the backup manager's own adds and deletes, and re-listed only when the
+    directory's mtime shows that something else changed it.
+    """
+
+    def __init__(self, backup_dir: str):
+        self.backup_dir = backup_dir
+        self._lock = threading.RLock()
+        # instance name -> entries, newest first
+        self._entries: Dict[str, List[BackupEntry]] = {}
+        self._directory_mtime_ns: Optional[int] = None
+        # filename -> verification result, survives rescans and restarts
+        self._verifications: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def _directory_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.backup_dir).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def refresh(self, force: bool = False):
+        with self._lock:
+            mtime = self._directory_mtime()
+            if not force and self._directory_mtime_ns is not None and mtime == self._directory_mtime_ns:
+                return
+
+            if self._verifications is None:
+                self._verifications = self._load_verifications()
+            entries: Dict[str, List[BackupEntry]] = {}
+            if mtime is not None:
+                with os.scandir(self.backup_dir) as scan:
+                    for item in scan:
+                        if not item.name.endswith(BACKUP_EXTENSION) or not item.is_file():
+                            continue
+                        entry = parse_backup_filename(item.path)
+                        if entry is None:
+                            continue
+                        entry.size = item.stat().st_size
+                        self._apply_verification(entry)
+                        entries.setdefault(entry.instance_name, []).append(entry)
+            for instance_entries in entries.values():
+                instance_entries.sort(key=lambda entry: (entry.created, entry.filename), reverse=True)
+            self._entries = entries
+            self._directory_mtime_ns = mtime
+
+    def _load_verifications(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.backup_dir, VERIFY_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _apply_verification(self, entry: BackupEntry):
+        result = self._verifications.get(entry.filename)
+        if result is None or result.get('size') != entry.size:
+            return  # never verified, or replaced since
+        entry.verified_at = datetime.fromisoformat(result['verified_at'])
+        entry.verify_status = result['status']
+        entry.verify_error = result.get('error', '')
+
+    def record_verification(self, path: str, status: str, error: str = ''):
+        """Stores a scrub result on the entry; save_verifications() writes them out."""
+        entry = parse_backup_filename(path)
+        if entry is None:
+            return
+        with self._lock:
+            self.refresh()
+            for item in self._entries.get(entry.instance_name, ()):
+                if item.path == path:
+                    item.verified_at = datetime.now()
+                    item.verify_status = status
+                    item.verify_error = error
+                    self._verifications[item.filename] = {
+                        'verified_at': item.verified_at.isoformat(),
+                        'status': status,
+                        'error': error,
+                        'size': item.size
+                    }
+                    return
+
+    def save_verifications(self):
+        with self._lock:
+            self.refresh()
+            # Drop results of archives that no longer exist
+            names = {entry.filename for entries in self._entries.values() for entry in entries}
+            self._verifications = {name: result for name, result in self._verifications.items() if name in names}
+            verify_file = os.path.join(self.backup_dir, VERIFY_FILE)
+            temp_file = verify_file + '.tmp'
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._verifications, f, separators=(',', ':'))
+            os.replace(temp_file, verify_file)
+            self._touched()
+
+    def corrupt_entries(self) -> List[BackupEntry]:
+        return [entry for entry in self.entries() if entry.is_corrupt]
+
+    def _touched(self):
+        # Our own change moved the directory mtime; don't mistake it for an outside one.
+        # Before the first listing there is nothing to keep current, so it must still happen.
+        if self._verifications is not None:
+            self._directory_mtime_ns = self._directory_mtime()
+
+    def add(self, entry: BackupEntry):
+        with self._lock:
+            # Only a catalog that was never listed needs a listing; the new archive moved the
+            # directory mtime, which must not trigger a full re-list
+            if self._verifications is None:
+                self.refresh()
+            entries = self._entries.setdefault(entry.instance_name, [])
+            entries[:] = [item for item in entries if item.path != entry.path]
+            entries.append(entry)
+            entries.sort(key=lambda item: (item.created, item.filename), reverse=True)
+            self._touched()
+
+    def remove(self, path: str):
+        entry = parse_backup_filename(path)
+        if entry is None:
+            return
+        with self._lock:
+            entries = self._entries.get(entry.instance_name, [])
+            entries[:] = [item for item in entries if item.path != path]
+            if not entries:
+                self._entries.pop(entry.instance_name, None)
+            self._touched()
+
+    def entries(self, instance_name: Optional[str] = None) -> List[BackupEntry]:
+        """Backups of one instance (exact name) or of all instances, newest first."""
+        with self._lock:
+            self.refresh()
+            if instance_name is not None:
+                return list(self._entries.get(instance_name, ()))
+            all_entries = [entry for entries in self._entries.values() for entry in entries]
+        all_entries.sort(key=lambda entry: (entry.created, entry.filename), reverse=True)
+        return all_entries
+
+    def by_instance(self) -> Dict[str, List[BackupEntry]]:
+        with self._lock:
+            self.refresh()
+            return {name: list(entries) for name, entries in self._entries.items()}
+
+    def total_size(self, instance_name: Optional[str] = None) -> int:
+        return sum(entry.size for entry in self.entries(instance_name))
@@ -1,33 +1,59 @@
 import os
 import shutil
+import time
 import zipfile
 from datetime import datetime
 from typing import List, Optional
 from pathlib import Path
+from core.backup_catalog import TIMESTAMP_FORMAT, BackupCatalog, BackupEntry
+from core.backup_retention import RetentionPolicy
+from core.io_limiter import copy_stream
+from core.scheduler import checkpoint
+from core.metrics import BACKUP_BYTES, BACKUP_SECONDS, BACKUPS
+from core.tracing import span
+from models.ignore_rules import SECTION_BACKUP, IgnoreMatcher, IgnoreRules
 from models.instance import ServerInstance
 from utils.logger import get_logger
 
 class BackupManager:
-    def __init__(self, backup_dir: str = "backups", max_backups: int = 5):
+    def __init__(self, backup_dir: str = "backups", max_backups: int = 5,
+                 policy: Optional[RetentionPolicy] = None):
         self.backup_dir = backup_dir
         self.max_backups = max_backups
+        self.policy = policy or RetentionPolicy(keep_last=max_backups)
         self.logger = get_logger()
         
         # Ensure backup directory exists
         os.makedirs(backup_dir, exist_ok=True)
+        self.catalog = BackupCatalog(backup_dir)
     
-    def create_backup(self, instance: ServerInstance, description: str = "") -> str:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_name = f"{instance.name}_{timestamp}.zip"
-        backup_path = os.path.join(self.backup_dir, backup_name)
+    def create_backup(self, instance: ServerInstance, description: str = "",
+                      ignore: Optional[IgnoreMatcher] = None) -> str:
+        """Zips the instance, leaving out paths under the [backup] ignore rules.
+
+        Without explicit rules the instance's own .dotworkignore is used.
+        """
+        if ignore is None:
+            ignore = IgnoreRules.load(instance.path).matcher(SECTION_BACKUP)
+        created = datetime.now().replace(microsecond=0)
+        timestamp = created.strftime(TIMESTAMP_FORMAT)
+        backup_path = os.path.join(self.backup_dir, f"{instance.name}_{timestamp}.zip")
+        sequence = 1
+        while os.path.exists(backup_path):
+            # Two backups of one instance within a second
+            backup_path = os.path.join(self.backup_dir, f"{instance.name}_{timestamp}_{sequence}.zip")
+            sequence += 1
+        started = time.perf_counter()
         
         try:
-            with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            with span("backup_zip", instance=instance.name), \
+                    zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
                 for root, dirs, files in os.walk(instance.path):
+                    files = ignore.prune(os.path.relpath(root, instance.path), dirs, files)
                     for file in files:
                         file_path = os.path.join(root, file)
                         arcname = os.path.relpath(file_path, instance.path)
-                        zipf.write(file_path, arcname)
+                        self._write_member(zipf, file_path, arcname)
                 
                 # Add backup metadata
                 backup_info = {
@@ -41,7 +67,12 @@ class BackupManager:
                 import json
                 zipf.writestr("backup_info.json", json.dumps(backup_info, indent=2))
             
-            self.logger.info(f"Backup created: {backup_path}")
+            size = os.path.getsize(backup_path)
+            BACKUP_SECONDS.observe(time.perf_counter() - started)
+            BACKUP_BYTES.observe(size)
+            BACKUPS.labels('created').inc()
+            self.logger.info(f"Backup created: {backup_path}", file=backup_path, instance=instance.name, size=size)
+            self.catalog.add(BackupEntry(path=backup_path, instance_name=instance.name, created=created, size=size))
             
             # Clean up old backups
             self._cleanup_old_backups(instance.name)
@@ -49,17 +80,41 @@ class BackupManager:
             return backup_path
             
         except Exception as e:
+            BACKUPS.labels('failed').inc()
             self.logger.error(f"Failed to create backup: {e}")
             if os.path.exists(backup_path):
                 os.remove(backup_path)
             raise e
     
+    @staticmethod
+    def _write_member(zipf: zipfile.ZipFile, file_path: str, arcname: str):
+        # Streams the file in chunks so the shared I/O limits apply to backups
+        checkpoint()
+        info = zipfile.ZipInfo.from_file(file_path, arcname)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with open(file_path, 'rb') as src, zipf.open(info, 'w') as dst:
+            copy_stream(src, dst)
+
+    @staticmethod
+    def _extract_member(zipf: zipfile.ZipFile, member: zipfile.ZipInfo, restore_path: str):
+        checkpoint()
+        root = os.path.realpath(restore_path)
+        target = os.path.realpath(os.path.join(root, *member.filename.split('/')))
+        if os.path.commonpath([root, target]) != root:
+            raise ValueError(f"Backup member escapes the restore directory: {member.filename}")
+        if member.is_dir():
+            os.makedirs(target, exist_ok=True)
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with zipf.open(member) as src, open(target, 'wb') as dst:
+            copy_stream(src, dst)
+
     def restore_backup(self, backup_path: str, restore_path: str = None) -> ServerInstance:
         if not os.path.exists(backup_path):
             raise FileNotFoundError(f"Backup file not found: {backup_path}")
         
         try:
-            with zipfile.ZipFile(backup_path, 'r') as zipf:
+            with span("backup_restore", backup=backup_path), zipfile.ZipFile(backup_path, 'r') as zipf:
                 # Read backup info
                 backup_info = None
                 if "backup_info.json" in zipf.namelist():
@@ -80,9 +135,9 @@ class BackupManager:
                 os.makedirs(restore_path, exist_ok=True)
                 
                 # Extract files
-                for member in zipf.namelist():
-                    if member != "backup_info.json":  # Skip metadata file
-                        zipf.extract(member, restore_path)
+                for member in zipf.infolist():
+                    if member.filename != "backup_info.json":  # Skip metadata file
+                        self._extract_member(zipf, member, restore_path)
                 
                 # Load instance metadata
                 instance = ServerInstance.load_from_path(restore_path)
@@ -105,38 +160,28 @@ class BackupManager:
     def list_backups(self, instance_name: str = None) -> List[dict]:
         backups = []
         
-        for backup_file in os.listdir(self.backup_dir):
-            if backup_file.endswith('.zip'):
-                if instance_name is None or backup_file.startswith(f"{instance_name}_"):
-                    backup_path = os.path.join(self.backup_dir, backup_file)
-                    
-                    try:
-                        with zipfile.ZipFile(backup_path, 'r') as zipf:
-                            backup_info = {"filename": backup_file, "path": backup_path}
-                            
-                            if "backup_info.json" in zipf.namelist():
-                                import json
-                                metadata = json.loads(zipf.read("backup_info.json").decode('utf-8'))
-                                backup_info.update(metadata)
-                            else:
-                                # Parse from filename
-                                parts = backup_file.replace('.zip', '').split('_')
-                                if len(parts) >= 3:
-                                    backup_info["instance_name"] = '_'.join(parts[:-2])
-                                    backup_info["backup_date"] = '_'.join(parts[-2:])
-                            
-                            # Add file stats
-                            stat = os.stat(backup_path)
-                            backup_info["size"] = stat.st_size
-                            backup_info["created"] = datetime.fromtimestamp(stat.st_ctime)
-                            
-                            backups.append(backup_info)
-                            
-                    except Exception as e:
-                        self.logger.warning(f"Could not read backup info from {backup_file}: {e}")
+        # The catalog matches the instance name exactly and is already sorted, newest first
+        for entry in self.catalog.entries(instance_name):
+            backup_info = {
+                "filename": entry.filename,
+                "path": entry.path,
+                "instance_name": entry.instance_name,
+                "backup_date": entry.created.strftime(TIMESTAMP_FORMAT)
+            }
+            try:
+                with zipfile.ZipFile(entry.path, 'r') as zipf:
+                    if "backup_info.json" in zipf.namelist():
+                        import json
+                        metadata = json.loads(zipf.read("backup_info.json").decode('utf-8'))
+                        backup_info.update(metadata)
+            except Exception as e:
+                self.logger.warning(f"Could not read backup info from {entry.filename}: {e}")
+                continue
+            
+            backup_info["size"] = entry.size
+            backup_info["created"] = entry.created
+            backups.append(backup_info)
         
-        # Sort by creation date, newest first
-        backups.sort(key=lambda x: x.get("created", datetime.min), reverse=True)
         return backups
     
     def delete_backup(self, backup_path: str):
@@ -145,22 +190,35 @@ class BackupManager:
             self.logger.info(f"Backup deleted: {backup_path}")
         else:
             self.logger.warning(f"Backup file not found: {backup_path}")
+        self.catalog.remove(backup_path)
     
     def _cleanup_old_backups(self, instance_name: str):
-        backups = self.list_backups(instance_name)
+        if self.policy.max_total_bytes:
+            # The global size limit can expire backups of any instance
+            self.prune()
+        else:
+            self.prune(instance_name)
+    
+    def prune(self, instance_name: Optional[str] = None) -> List[BackupEntry]:
+        """Deletes the backups the retention policy no longer keeps and returns them.
+
+        Decided from the in-memory catalog, so only the deleted archives touch the disk.
+        """
+        if instance_name is None:
+            entries_by_instance = self.catalog.by_instance()
+        else:
+            entries_by_instance = {instance_name: self.catalog.entries(instance_name)}
         
-        if len(backups) > self.max_backups:
-            # Remove oldest backups
-            backups_to_remove = backups[self.max_backups:]
-            for backup in backups_to_remove:
-                self.delete_backup(backup["path"])
-                self.logger.info(f"Cleaned up old backup: {backup['filename']}")
+        expired = self.policy.select_expired(entries_by_instance)
+        for entry in expired:
+            try:
+                self.delete_backup(entry.path)
+            except OSError as e:
+                self.logger.warning(f"Could not delete old backup {entry.filename}: {e}")
+                continue
+            BACKUPS.labels('pruned').inc()
+            self.logger.info(f"Cleaned up old backup: {entry.filename}", instance=entry.instance_name)
+        return expired
     
     def get_backup_size(self, instance_name: str = None) -> int:
-        total_size = 0
-        backups = self.list_backups(instance_name)
-        
-        for backup in backups:
-            total_size += backup.get("size", 0)
-        
-        return total_size
\ No newline at end of file
+        return self.catalog.total_size(instance_name)
\ No newline at end of file
@@ -0,0 +1,99 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Hashable, List, Set
+
+from core.backup_catalog import BackupEntry
+from utils.config import AppConfig
+
+MB = 1024 * 1024
+
+# Grandfather-father-son buckets: one backup is kept per distinct key, newest first
+_BUCKETS: Dict[str, Callable[[datetime], Hashable]] = {
+    'hourly': lambda created: (created.year, created.month, created.day, created.hour),
+    'daily': lambda created: (created.year, created.month, created.day),
+    'weekly': lambda created: tuple(created.isocalendar()[:2]),
+    'monthly': lambda created: (created.year, created.month),
+}
+
+
+@dataclass
+class RetentionPolicy:
+    keep_last: int = 5
+    keep_hourly: int = 0
+    keep_daily: int = 0
+    keep_weekly: int = 0
+    keep_monthly: int = 0
+    # 0 means no limit
+    max_instance_bytes: int = 0
+    max_total_bytes: int = 0
+
+    @classmethod
+    def from_config(cls, config: AppConfig) -> 'RetentionPolicy':
+        return cls(
+            keep_last=config.max_backups,
+            keep_hourly=config.backup_keep_hourly,
+            keep_daily=config.backup_keep_daily,
+            keep_weekly=config.backup_keep_weekly,
+            keep_monthly=config.backup_keep_monthly,
+            max_instance_bytes=int(config.backup_max_instance_mb * MB),
+            max_total_bytes=int(config.backup_max_total_mb * MB)
+        )
+
+    def _bucket_counts(self) -> Dict[str, int]:
+        return {
+            'hourly': self.keep_hourly,
+            'daily': self.keep_daily,
+            'weekly': self.keep_weekly,
+            'monthly': self.keep_monthly,
+        }
+
+    def keep(self, entries: List[BackupEntry]) -> List[BackupEntry]:
+        """The backups of one instance (newest first) that the count and size limits keep."""
+        counts = {name: count for name, count in self._bucket_counts().items() if count > 0}
+        seen: Dict[str, Set[Hashable]] = {name: set() for name in counts}
+        kept = []
+        kept_bytes = 0
+
+        for index, entry in enumerate(entries):
+            wanted = index < self.keep_last
+            for name, count in counts.items():
+                bucket = _BUCKETS[name](entry.created)
+                if bucket not in seen[name] and len(seen[name]) < count:
+                    seen[name].add(bucket)
+                    wanted = True
+            if not wanted:
+                continue
+            # The newest backup survives any size limit
+            if kept and self.max_instance_bytes and kept_bytes + entry.size > self.max_instance_bytes:
+                continue
+            kept.append(entry)
+            kept_bytes += entry.size
+        return kept
+
+    def select_expired(self, entries_by_instance: Dict[str, List[BackupEntry]]) -> List[BackupEntry]:
+        """Every backup the policy drops, across all instances, in one pass per instance."""
+        expired: List[BackupEntry] = []
+        kept_all: List[BackupEntry] = []
+        newest: Set[str] = set()
+
+        for entries in entries_by_instance.values():
+            kept = self.keep(entries)
+            kept_paths = {entry.path for entry in kept}
+            expired.extend(entry for entry in entries if entry.path not in kept_paths)
+            kept_all.extend(kept)
+            if kept:
+                newest.add(kept[0].path)
+
+        if self.max_total_bytes:
+            # Every instance's newest backup counts first, then older ones fill the rest newest first
+            total = sum(entry.size for entry in kept_all if entry.path in newest)
+            full = False
+            for entry in sorted(kept_all, key=lambda item: item.created, reverse=True):
+                if entry.path in newest:
+                    continue
+                full = full or total + entry.size > self.max_total_bytes
+                if full:
+                    expired.append(entry)
+                else:
+                    total += entry.size
+        return expired
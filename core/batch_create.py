@@ -0,0 +1,186 @@
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+from core.io_limiter import propagate_context
+from core.template_manager import TemplateManager
+from models.instance import ServerInstance
+from models.result import FileResult, ProvisionResult
+from models.template import Template
+
+# Value of a port variable that asks for the next free port
+AUTO_PORT = 'auto'
+DEFAULT_START_PORT = 25565
+
+
+@dataclass
+class InstanceSpec:
+    name: str
+    variables: Dict[str, Any] = field(default_factory=dict)
+    output_dir: Optional[str] = None
+
+
+def _spec_from_row(row: Dict[str, Any], defaults: Dict[str, Any]) -> InstanceSpec:
+    row = dict(row)
+    name = str(row.pop('name', '') or '').strip()
+    output_dir = row.pop('output_dir', None) or None
+    variables = dict(defaults)
+    # Rows can list variables flat or under a 'variables' key
+    variables.update(row.pop('variables', None) or {})
+    variables.update({key: value for key, value in row.items() if value not in (None, '')})
+    return InstanceSpec(name=name, variables=variables, output_dir=output_dir)
+
+
+def load_instance_matrix(path: str) -> List[InstanceSpec]:
+    """Reads instance rows from a CSV file (one column per variable) or a YAML file.
+
+    The YAML form is either a list of rows or a mapping with 'defaults'
+    (variables shared by every row) and 'instances' (the rows).
+    """
+    if path.lower().endswith('.csv'):
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            return [_spec_from_row(row, {}) for row in csv.DictReader(f)]
+
+    with open(path, 'r', encoding='utf-8') as f:
+        data = yaml.safe_load(f) or []
+    defaults = {}
+    if isinstance(data, dict):
+        defaults = data.get('defaults') or {}
+        data = data.get('instances') or []
+    return [_spec_from_row(row, defaults) for row in data]
+
+
+def coerce_variables(template: Template, variables: Dict[str, Any]) -> Dict[str, Any]:
+    """Fills template defaults and converts text values (e.g. from CSV) to the variable's type."""
+    result = dict(variables)
+    for var in template.variables:
+        if var.name not in result:
+            if var.default_value is not None:
+                result[var.name] = var.default_value
+            continue
+
+        value = result[var.name]
+        if not isinstance(value, str):
+            continue
+        if var.type in ('int', 'port'):
+            try:
+                result[var.name] = int(value.strip())
+            except ValueError:
+                pass  # validate_variables reports it
+        elif var.type == 'boolean':
+            result[var.name] = value.strip().lower() in ('1', 'true', 'yes', 'y', 'on')
+    return result
+
+
+class BatchCreator:
+    """Creates many instances of one template from a variable matrix.
+
+    Every row is validated before anything is written. The instances are
+    then materialized in parallel through one TemplateManager, so template
+    reads and compiled renders are shared between them.
+    """
+
+    def __init__(self, template_manager: TemplateManager, max_workers: Optional[int] = None):
+        self.template_manager = template_manager
+        self.max_workers = max_workers or min(8, (os.cpu_count() or 1) + 2)
+
+    def prepare(self, template: Template, specs: List[InstanceSpec], output_dir: str) -> List[InstanceSpec]:
+        """Returns the rows with defaults and types applied, raising ValueError listing every invalid row."""
+        prepared = []
+        errors = []
+        seen_paths = set()
+        # Ports claimed by earlier rows, which are not in the fleet index yet
+        reserved: Dict[int, str] = {}
+        for index, spec in enumerate(specs, start=1):
+            label = f"Row {index} ({spec.name or 'unnamed'})"
+            spec = InstanceSpec(spec.name, coerce_variables(template, spec.variables), spec.output_dir or output_dir)
+            self._allocate_ports(template, spec, reserved)
+            prepared.append(spec)
+
+            if not spec.name:
+                errors.append(f"{label}: instance name is missing")
+                continue
+            instance_path = os.path.abspath(os.path.join(spec.output_dir, spec.name))
+            if instance_path in seen_paths:
+                errors.append(f"{label}: duplicate instance {instance_path}")
+            elif os.path.exists(instance_path):
+                errors.append(f"{label}: instance directory already exists: {instance_path}")
+            seen_paths.add(instance_path)
+
+            for error in self.template_manager.validate_variables(template, spec.variables):
+                errors.append(f"{label}: {error}")
+            for error in self.template_manager.check_conflicts(template, spec.variables, instance_path, reserved):
+                errors.append(f"{label}: {error}")
+
+        if errors:
+            raise ValueError("\n".join(errors))
+        return prepared
+
+    def _allocate_ports(self, template: Template, spec: InstanceSpec, reserved: Dict[int, str]):
+        index = self.template_manager.variable_index
+        # check_conflicts reserves the allocated ports once the row is validated
+        taken = set(reserved)
+        for var in template.variables:
+            value = spec.variables.get(var.name)
+            if var.type != 'port' or not isinstance(value, str) or value.strip().lower() != AUTO_PORT:
+                continue
+            start = int(var.default_value) if var.default_value else DEFAULT_START_PORT
+            port = index.next_free_port(start, taken)
+            spec.variables[var.name] = port
+            taken.add(port)
+
+    def create(self, template: Template, specs: List[InstanceSpec], output_dir: str,
+               is_dry_run: bool = False) -> Tuple[List[ServerInstance], ProvisionResult]:
+        specs = self.prepare(template, specs, output_dir)
+        template_files = template.walk_tree()[1]
+        processed_files: List[FileResult] = []
+
+        if is_dry_run:
+            for spec in specs:
+                processed_files.extend(
+                    self._file_results(template, template_files, spec, "Skipped", "dry-run")
+                )
+            return [], ProvisionResult(template=template, is_dry_run=True, processed_files=processed_files)
+
+        self.template_manager.preload_template(template)
+
+        def create_one(spec: InstanceSpec) -> ServerInstance:
+            return self.template_manager.create_instance(template, spec.name, spec.output_dir, spec.variables)
+
+        instances = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [(spec, executor.submit(propagate_context(create_one), spec)) for spec in specs]
+            for spec, future in futures:
+                try:
+                    instances.append(future.result())
+                    processed_files.extend(
+                        self._file_results(template, template_files, spec, "Created", "batch-create")
+                    )
+                except Exception as e:
+                    processed_files.append(FileResult(
+                        path=os.path.join(spec.output_dir, spec.name),
+                        status="Error",
+                        reason=str(e),
+                        template=template.name,
+                        variables_used=spec.variables
+                    ))
+
+        return instances, ProvisionResult(template=template, is_dry_run=False, processed_files=processed_files)
+
+    def _file_results(self, template: Template, template_files: List[str], spec: InstanceSpec,
+                      status: str, reason: str) -> List[FileResult]:
+        instance_path = os.path.join(spec.output_dir, spec.name)
+        return [
+            FileResult(
+                path=os.path.join(instance_path, relative_path),
+                status=status,
+                reason=reason,
+                template=template.name,
+                variables_used=spec.variables
+            )
+            for relative_path in template_files
+        ]
@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional, Tuple, TypeVar
+
+from core.io_limiter import propagate_context
+from core.metrics import COPY_THROUGHPUT
+from core.scheduler import checkpoint
+
+T = TypeVar('T')
+
+# Below this many files a thread pool costs more than it saves
+PARALLEL_THRESHOLD = 8
+# Files handed to the pool at once per worker; the caller may yield between waves
+WAVE_FILES_PER_WORKER = 4
+
+
+@dataclass
+class CopyStats:
+    files: int = 0
+    bytes: int = 0
+    duration: float = 0.0
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files / self.duration if self.duration > 0 else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.duration if self.duration > 0 else 0.0
+
+    def describe(self) -> str:
+        return (f"{self.files} files, {self.bytes / 1024 / 1024:.1f} MiB in {self.duration:.2f}s "
+                f"({self.files_per_second:.0f} files/s, {self.bytes_per_second / 1024 / 1024:.1f} MiB/s)")
+
+
+class CopyEngine:
+    """Materializes a file tree on a bounded thread pool.
+
+    The directory tree is created once up front, so workers never race on
+    or repeat makedirs. Files are submitted largest first, which keeps one
+    big file from being the tail of the run. The pool is shared by every
+    caller, so parallel instance creations stay within max_workers.
+
+    A scheduled job yields to interactive work on its own thread, between
+    waves of files, never inside a pool thread: a paused pool thread would
+    hold up the interactive job's files queued behind it.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='dotwork-copy')
+            return self._executor
+
+    @staticmethod
+    def create_directories(dest_root: str, directories: Iterable[str], files: Iterable[str]):
+        # Parents of files are included in case the listing leaves out implicit directories
+        needed = set(directories)
+        needed.update(os.path.dirname(relative_path) for relative_path in files)
+        needed.discard('')
+        for relative_root in sorted(needed):
+            os.makedirs(os.path.join(dest_root, relative_root), exist_ok=True)
+
+    def run(self, files: List[Tuple[str, int]], copy_file: Callable[[str], T]) -> Tuple[List[Tuple[str, T]], CopyStats]:
+        """Calls copy_file for each (relative path, size) and returns its results with the copy stats.
+
+        The first failure is raised once every submitted file has finished.
+        """
+        ordered = sorted(files, key=lambda item: item[1], reverse=True)
+        started = time.perf_counter()
+
+        results = []
+        if self.max_workers <= 1 or len(ordered) < PARALLEL_THRESHOLD:
+            for relative_path, _ in ordered:
+                checkpoint()
+                results.append((relative_path, copy_file(relative_path)))
+        else:
+            executor = self._get_executor()
+            task = propagate_context(copy_file)
+            wave_size = self.max_workers * WAVE_FILES_PER_WORKER
+            error = None
+            for start in range(0, len(ordered), wave_size):
+                checkpoint()
+                futures = [(relative_path, executor.submit(task, relative_path))
+                           for relative_path, _ in ordered[start:start + wave_size]]
+                for relative_path, future in futures:
+                    try:
+                        results.append((relative_path, future.result()))
+                    except Exception as e:
+                        error = error or e
+                if error is not None:
+                    break
+            if error is not None:
+                raise error
+
+        stats = CopyStats(files=len(ordered), bytes=sum(size for _, size in ordered),
+                          duration=time.perf_counter() - started)
+        COPY_THROUGHPUT.set(stats.bytes_per_second)
+        return results, stats
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
@@ -0,0 +1,110 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from core.template_manager import TemplateManager
+from models.file_state import InstanceFileState, compute_variables_digest
+from models.ignore_rules import SECTION_SCAN
+from models.instance import ServerInstance
+from models.result import DriftReport, FileResult
+from models.template import Template
+
+
+class DriftScanner:
+    """Compares instances against an in-memory render of their template. Never writes to instances."""
+
+    def __init__(self, template_manager: TemplateManager, max_workers: Optional[int] = None):
+        self.template_manager = template_manager
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4)
+
+    def scan(self, instances: List[ServerInstance]) -> DriftReport:
+        started = time.perf_counter()
+        templates = {template.name: template for template in self.template_manager.discover_templates()}
+        template_files: Dict[str, List[str]] = {
+            name: template.get_files() for name, template in templates.items()
+        }
+
+        def scan_one(instance: ServerInstance) -> List[FileResult]:
+            template = templates.get(instance.template_name)
+            if template is None:
+                return [FileResult(
+                    path=instance.path,
+                    status="Error",
+                    reason=f"template '{instance.template_name}' not found",
+                    template=instance.template_name,
+                    variables_used={}
+                )]
+            try:
+                return self.scan_instance(instance, template, template_files[template.name])
+            except Exception as e:
+                return [FileResult(
+                    path=instance.path,
+                    status="Error",
+                    reason=str(e),
+                    template=template.name,
+                    variables_used={}
+                )]
+
+        report = DriftReport(scanned_instances=len(instances))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for instance, rows in zip(instances, executor.map(scan_one, instances)):
+                report.processed_files.extend(rows)
+                if any(row.status != "Unchanged" for row in rows):
+                    report.drifted_instances.append(instance.name)
+
+        report.duration = time.perf_counter() - started
+        return report
+
+    def scan_instance(self, instance: ServerInstance, template: Template,
+                      relative_paths: Optional[List[str]] = None) -> List[FileResult]:
+        if relative_paths is None:
+            relative_paths = template.get_files()
+
+        # Files under the [scan] ignore rules are never read
+        ignore = self.template_manager.ignore_rules(instance, template).matcher(SECTION_SCAN)
+        relative_paths = ignore.filter(relative_paths)
+
+        file_state = InstanceFileState.load_from_path(instance.path)
+        state_valid = (file_state.algorithm == self.template_manager.comparator.algorithm
+                       and file_state.variables_digest == compute_variables_digest(instance.variables))
+
+        rows = []
+        for relative_path in relative_paths:
+            dest_file = os.path.join(instance.path, relative_path)
+            status, reason = self._compare(instance, template, file_state if state_valid else None,
+                                           relative_path, dest_file)
+            rows.append(FileResult(
+                path=dest_file,
+                status=status,
+                reason=reason,
+                template=template.name,
+                variables_used={}
+            ))
+        return rows
+
+    def _compare(self, instance: ServerInstance, template: Template, file_state: Optional[InstanceFileState],
+                 relative_path: str, dest_file: str):
+        try:
+            dest_stat = os.stat(dest_file)
+        except FileNotFoundError:
+            return "Drifted", "missing"
+
+        src_stat = template.source_stat(relative_path)
+        if file_state is not None:
+            state = file_state.files.get(relative_path)
+            if state is not None and state.matches_source(src_stat) and state.matches_stat(dest_stat):
+                return "Unchanged", "same-state"
+
+        rendered = self.template_manager.render_source_bytes(template, relative_path, instance.variables)
+        if rendered is None:
+            if self.template_manager.source_equals(template, relative_path, src_stat, dest_file, dest_stat):
+                return "Unchanged", "same-hash"
+            return "Drifted", "content-differs"
+
+        if len(rendered) != dest_stat.st_size:
+            return "Drifted", "content-differs"
+        with open(dest_file, 'rb') as f:
+            if f.read() != rendered:
+                return "Drifted", "content-differs"
+        return "Unchanged", "same-content"
@@ -0,0 +1,95 @@
+import hashlib
+import mmap
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from core.metrics import record_cache
+from core.tracing import span
+from models.template import Template
+
+DEFAULT_ALGORITHM = 'blake2b'
+BUFFER_SIZE = 1024 * 1024
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+
+class FileComparator:
+    """Compares files by size first and by digest only when sizes match.
+
+    Digests of template-side files are cached by path and stat, so a bulk run
+    hashes each template file once no matter how many instances use it.
+    """
+
+    def __init__(self, algorithm: str = DEFAULT_ALGORITHM, buffer_size: int = BUFFER_SIZE):
+        # Fail early on algorithms hashlib doesn't know
+        hashlib.new(algorithm)
+        self.algorithm = algorithm
+        self.buffer_size = buffer_size
+        self._cache: Dict[str, Tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+
+    def digest(self, path: str, stat: Optional[os.stat_result] = None) -> str:
+        size = stat.st_size if stat is not None else os.path.getsize(path)
+        hasher = hashlib.new(self.algorithm)
+
+        with span("hash", file=path, size=size), open(path, 'rb') as f:
+            if size >= MMAP_THRESHOLD:
+                # hashlib drops the GIL on large buffers, so one update over the mapping is I/O bound
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    hasher.update(mapped)
+            else:
+                buffer = bytearray(self.buffer_size)
+                view = memoryview(buffer)
+                while True:
+                    read = f.readinto(buffer)
+                    if not read:
+                        break
+                    hasher.update(view[:read])
+
+        return hasher.hexdigest()
+
+    def digest_bytes(self, data: bytes) -> str:
+        return hashlib.new(self.algorithm, data).hexdigest()
+
+    def cached_digest(self, path: str, stat: Optional[os.stat_result] = None) -> str:
+        if stat is None:
+            stat = os.stat(path)
+        key = os.path.abspath(path)
+
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            record_cache('digest', True)
+            return cached[2]
+        record_cache('digest', False)
+
+        digest = self.digest(path, stat)
+        with self._lock:
+            self._cache[key] = (stat.st_size, stat.st_mtime_ns, digest)
+        return digest
+
+    def source_digest(self, template: Template, relative_path: str, stat=None) -> str:
+        """Digest of a template member, taken from the package index when possible."""
+        if template.package is None:
+            return self.cached_digest(os.path.join(template.path, relative_path), stat)
+
+        if template.package.algorithm == self.algorithm:
+            return template.package.entries[relative_path].hash
+        return self.digest_bytes(template.package.read(relative_path))
+
+    def files_equal(self, src_path: str, dest_path: str,
+                    src_stat: Optional[os.stat_result] = None,
+                    dest_stat: Optional[os.stat_result] = None) -> bool:
+        if src_stat is None:
+            src_stat = os.stat(src_path)
+        if dest_stat is None:
+            dest_stat = os.stat(dest_path)
+
+        if src_stat.st_size != dest_stat.st_size:
+            return False
+
+        return self.cached_digest(src_path, src_stat) == self.digest(dest_path, dest_stat)
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,275 @@
+import ctypes
+import json
+import os
+import shutil
+import sys
+import threading
+from typing import Dict, List, Optional, Any, Set
+
+from core.sparse_copy import copy_sparse
+
+STAGING_DIR = '.dotwork_staging'
+JOURNAL_FILE = '.dotwork_journal.json'
+
+STATE_COMMITTING = 'committing'
+
+# Instance roots with a commit running in this process; their journals are not stale
+_committing_roots: Set[str] = set()
+_committing_lock = threading.Lock()
+
+
+def _root_key(root: str) -> str:
+    return os.path.normcase(os.path.abspath(root))
+
+
+def _process_alive(pid: int) -> bool:
+    if sys.platform == 'win32':
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def fsync_file(path: str):
+    # Windows' FlushFileBuffers needs a handle with write access
+    with open(path, 'r+b') as f:
+        os.fsync(f.fileno())
+
+
+def fsync_directory(path: str):
+    # Directory fsync is not available on every platform (e.g. Windows)
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class FileTransaction:
+    """Stages file writes under the instance directory and commits them with os.replace.
+
+    Files are rendered into ``.dotwork_staging/new`` on the same filesystem as
+    the instance. ``commit`` fsyncs every staged file once, preserves the
+    originals in ``.dotwork_staging/old``, writes a journal and then swaps each
+    file into place. If the process dies mid-commit, ``recover`` rolls the
+    journal forward (default) or back.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.staging_path = os.path.join(root, STAGING_DIR)
+        self.new_path = os.path.join(self.staging_path, 'new')
+        self.old_path = os.path.join(self.staging_path, 'old')
+        self.journal_path = os.path.join(root, JOURNAL_FILE)
+        self.entries: List[str] = []
+        self.removals: List[str] = []
+        self.directories: List[str] = []
+        self._started = False
+
+    def __enter__(self) -> 'FileTransaction':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.abort()
+        return False
+
+    def _ensure_started(self):
+        if self._started:
+            return
+
+        # Finish whatever an interrupted transaction left behind first
+        FileTransaction.recover(self.root)
+        if os.path.exists(self.staging_path):
+            shutil.rmtree(self.staging_path)
+        os.makedirs(self.new_path)
+        os.makedirs(self.old_path)
+        self._started = True
+
+    def add_directory(self, relative_path: str):
+        self.directories.append(relative_path)
+
+    def stage(self, relative_path: str) -> str:
+        self._ensure_started()
+        staged_file = os.path.join(self.new_path, relative_path)
+        os.makedirs(os.path.dirname(staged_file), exist_ok=True)
+        self.entries.append(relative_path)
+        return staged_file
+
+    def remove(self, relative_path: str):
+        self._ensure_started()
+        self.removals.append(relative_path)
+
+    def commit(self):
+        for relative_path in self.directories:
+            os.makedirs(os.path.join(self.root, relative_path), exist_ok=True)
+
+        if not self.entries and not self.removals:
+            self.abort()
+            return
+
+        journal_entries: List[Dict[str, Any]] = []
+        for relative_path in self.entries:
+            staged_file = os.path.join(self.new_path, relative_path)
+            dest_file = os.path.join(self.root, relative_path)
+            had_original = os.path.exists(dest_file)
+
+            if had_original:
+                # Keep the original file mode (e.g. executable start scripts)
+                shutil.copymode(dest_file, staged_file)
+                self._preserve_original(relative_path, dest_file)
+
+            fsync_file(staged_file)
+            journal_entries.append({'path': relative_path, 'had_original': had_original})
+
+        for relative_path in self.removals:
+            dest_file = os.path.join(self.root, relative_path)
+            if os.path.exists(dest_file):
+                self._preserve_original(relative_path, dest_file)
+                journal_entries.append({'path': relative_path, 'had_original': True, 'delete': True})
+
+        with _committing_lock:
+            _committing_roots.add(_root_key(self.root))
+        try:
+            self._write_journal(journal_entries)
+
+            # From here on the journal can roll the commit forward or back
+            try:
+                _apply_entries(self.root, self.new_path, journal_entries)
+            except Exception:
+                FileTransaction.recover(self.root, roll_forward=False)
+                raise
+            _fsync_parents(self.root, journal_entries)
+
+            self._finish()
+        finally:
+            with _committing_lock:
+                _committing_roots.discard(_root_key(self.root))
+
+    def abort(self):
+        if os.path.exists(self.journal_path):
+            # A commit is in flight; leave the staging area for recover()
+            return
+        if os.path.exists(self.staging_path):
+            shutil.rmtree(self.staging_path, ignore_errors=True)
+        self.entries.clear()
+        self.removals.clear()
+        self._started = False
+
+    def _preserve_original(self, relative_path: str, dest_file: str):
+        old_file = os.path.join(self.old_path, relative_path)
+        os.makedirs(os.path.dirname(old_file), exist_ok=True)
+        try:
+            os.link(dest_file, old_file)
+        except OSError:
+            copy_sparse(dest_file, old_file)
+
+    def _write_journal(self, journal_entries: List[Dict[str, Any]]):
+        temp_journal = self.journal_path + '.tmp'
+        with open(temp_journal, 'w', encoding='utf-8') as f:
+            json.dump({'state': STATE_COMMITTING, 'pid': os.getpid(), 'entries': journal_entries}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_journal, self.journal_path)
+        fsync_directory(self.root)
+
+    def _finish(self):
+        os.remove(self.journal_path)
+        fsync_directory(self.root)
+        self.abort()
+        self.directories.clear()
+
+    @staticmethod
+    def is_committing(root: str) -> bool:
+        """Whether the journal under root belongs to a commit that is still running,
+        in this process or another live one, rather than an interrupted one."""
+        with _committing_lock:
+            if _root_key(root) in _committing_roots:
+                return True
+        try:
+            with open(os.path.join(root, JOURNAL_FILE), 'r', encoding='utf-8') as f:
+                pid = json.load(f).get('pid')
+        except (json.JSONDecodeError, OSError, AttributeError):
+            return False
+        return isinstance(pid, int) and pid != os.getpid() and _process_alive(pid)
+
+    @classmethod
+    def recover(cls, root: str, roll_forward: bool = True) -> Optional[str]:
+        """Completes or reverts an interrupted commit. Returns the action taken, if any."""
+        transaction = cls(root)
+        if not os.path.exists(transaction.journal_path):
+            return None
+
+        try:
+            with open(transaction.journal_path, 'r', encoding='utf-8') as f:
+                journal = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            journal = None
+
+        if not journal or journal.get('state') != STATE_COMMITTING:
+            # The journal never became valid, so no destination file was touched
+            os.remove(transaction.journal_path)
+            transaction.abort()
+            return None
+
+        entries = journal.get('entries', [])
+        if roll_forward:
+            _apply_entries(root, transaction.new_path, entries)
+            action = 'rolled-forward'
+        else:
+            _revert_entries(root, transaction.old_path, entries)
+            action = 'rolled-back'
+
+        _fsync_parents(root, entries)
+        transaction._finish()
+        return action
+
+
+def _apply_entries(root: str, new_path: str, entries: List[Dict[str, Any]]):
+    for entry in entries:
+        if entry.get('delete'):
+            dest_file = os.path.join(root, entry['path'])
+            if os.path.exists(dest_file):
+                os.remove(dest_file)
+            continue
+
+        staged_file = os.path.join(new_path, entry['path'])
+        if not os.path.exists(staged_file):
+            # Already swapped in before an interruption
+            continue
+        dest_file = os.path.join(root, entry['path'])
+        os.makedirs(os.path.dirname(dest_file), exist_ok=True)
+        os.replace(staged_file, dest_file)
+
+
+def _revert_entries(root: str, old_path: str, entries: List[Dict[str, Any]]):
+    for entry in entries:
+        dest_file = os.path.join(root, entry['path'])
+        if entry.get('had_original'):
+            old_file = os.path.join(old_path, entry['path'])
+            if os.path.exists(old_file):
+                os.replace(old_file, dest_file)
+        elif os.path.exists(dest_file):
+            os.remove(dest_file)
+
+
+def _fsync_parents(root: str, entries: List[Dict[str, Any]]):
+    parents = {os.path.dirname(os.path.join(root, entry['path'])) for entry in entries}
+    for parent in parents:
+        fsync_directory(parent)
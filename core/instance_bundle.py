@@ -0,0 +1,290 @@
+import json
+import os
+import shutil
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, Iterator, Optional
+
+from core.file_compare import FileComparator
+from core.file_transaction import JOURNAL_FILE, STAGING_DIR
+from core.sparse_copy import copy_sparse, data_regions
+from core.template_manager import TemplateManager
+from models.file_state import STATE_FILE
+from models.instance import ServerInstance
+from models.template import Template
+
+BUNDLE_MAGIC = b'DWBUNDL1'
+# frame type, payload length
+FRAME_HEADER = struct.Struct('<cI')
+FRAME_INSTANCE = b'I'
+FRAME_DIRECTORY = b'D'
+FRAME_FILE = b'F'
+FRAME_CHUNK = b'C'
+FRAME_HOLE = b'H'
+FRAME_END_FILE = b'E'
+FRAME_END = b'Z'
+# length of a hole in a sparse file
+HOLE_PAYLOAD = struct.Struct('<Q')
+
+CHUNK_SIZE = 1024 * 1024
+METADATA_FILE = '.dotwork_instance.json'
+# Bookkeeping of the source instance; stats in the file state don't hold on another host
+EXCLUDED_NAMES = {STAGING_DIR, JOURNAL_FILE, METADATA_FILE, STATE_FILE}
+
+
+def _frame(frame_type: bytes, payload: bytes) -> bytes:
+    return FRAME_HEADER.pack(frame_type, len(payload)) + payload
+
+
+def _json_frame(frame_type: bytes, data: Dict[str, Any]) -> bytes:
+    return _frame(frame_type, json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise ValueError("Unexpected end of bundle")
+        data.extend(chunk)
+    return bytes(data)
+
+
+def _safe_join(root: str, relative_path: str) -> str:
+    normalized = os.path.normpath(relative_path.replace('/', os.sep))
+    if os.path.isabs(normalized) or normalized.startswith('..'):
+        raise ValueError(f"Unsafe path in bundle: {relative_path}")
+    return os.path.join(root, normalized)
+
+
+class InstanceBundler:
+    """Streams instances to and from a single-pass bundle.
+
+    The bundle is a sequence of frames: instance metadata, then a frame per
+    directory (so empty ones survive) and per file a header frame,
+    zlib-compressed data chunks and an end marker. Holes of sparse files are
+    sent as their length only and stay holes on import. Chunks are
+    compressed on a thread pool while earlier ones are being written, so the
+    output can go straight to a pipe (e.g. ``ssh host dotwork import -``).
+    Files identical to the template can be sent as references and
+    re-materialized from the target's copy of the template on import.
+    """
+
+    def __init__(self, template_manager: TemplateManager, workers: Optional[int] = None,
+                 compression_level: int = 6):
+        self.template_manager = template_manager
+        self.workers = workers or (os.cpu_count() or 1)
+        self.compression_level = compression_level
+
+    def export_instance(self, instance: ServerInstance, stream: BinaryIO, dedup_template: bool = False) -> int:
+        """Writes the instance to stream and returns the number of files exported."""
+        template = None
+        if dedup_template:
+            template = self.template_manager.get_template_by_name(instance.template_name)
+
+        stream.write(BUNDLE_MAGIC)
+        stream.write(_json_frame(FRAME_INSTANCE, {
+            'instance': instance.to_dict(),
+            'algorithm': self.template_manager.comparator.algorithm
+        }))
+
+        exported = 0
+        window = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for item in self._iter_frames(instance, template, executor):
+                if isinstance(item, bytes) and item[:1] == FRAME_FILE:
+                    exported += 1
+                window.append(item)
+                # Keep a bounded number of chunks in flight, written in order
+                while len(window) > self.workers * 2:
+                    self._write_item(stream, window.popleft())
+            while window:
+                self._write_item(stream, window.popleft())
+
+        stream.write(_frame(FRAME_END, b''))
+        stream.flush()
+        return exported
+
+    def _write_item(self, stream: BinaryIO, item):
+        if isinstance(item, bytes):
+            stream.write(item)
+        else:
+            stream.write(_frame(FRAME_CHUNK, item.result()))
+
+    def _iter_frames(self, instance: ServerInstance, template: Optional[Template],
+                     executor: ThreadPoolExecutor) -> Iterator:
+        template_files = set(template.get_files()) if template is not None else set()
+
+        for root, dirs, files in os.walk(instance.path):
+            if root == instance.path:
+                # Leave out metadata and any in-flight update of the source instance
+                dirs[:] = [d for d in dirs if d not in EXCLUDED_NAMES]
+                files = [f for f in files if f not in EXCLUDED_NAMES]
+
+            for directory in dirs:
+                dir_path = os.path.join(root, directory)
+                if os.path.islink(dir_path):
+                    continue
+                stat = os.stat(dir_path)
+                yield _json_frame(FRAME_DIRECTORY, {
+                    'path': os.path.relpath(dir_path, instance.path).replace(os.sep, '/'),
+                    'mode': stat.st_mode,
+                    'mtime_ns': stat.st_mtime_ns
+                })
+
+            for file in files:
+                file_path = os.path.join(root, file)
+                relative_path = os.path.relpath(file_path, instance.path)
+                stat = os.stat(file_path)
+                header = {
+                    'path': relative_path.replace(os.sep, '/'),
+                    'mode': stat.st_mode,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'size': stat.st_size
+                }
+
+                if relative_path in template_files:
+                    src_stat = template.source_stat(relative_path)
+                    if self.template_manager.source_equals(template, relative_path, src_stat, file_path, stat):
+                        header['ref'] = self.template_manager.comparator.source_digest(
+                            template, relative_path, src_stat)
+                        yield _json_frame(FRAME_FILE, header)
+                        yield _frame(FRAME_END_FILE, b'')
+                        continue
+
+                yield _json_frame(FRAME_FILE, header)
+                yield from self._iter_data(file_path, stat, executor)
+                yield _frame(FRAME_END_FILE, b'')
+
+    def _iter_data(self, file_path: str, stat: os.stat_result, executor: ThreadPoolExecutor) -> Iterator:
+        with open(file_path, 'rb') as f:
+            position = 0
+            for offset, length in data_regions(f.fileno(), stat):
+                if offset > position:
+                    yield _frame(FRAME_HOLE, HOLE_PAYLOAD.pack(offset - position))
+                f.seek(offset)
+                end = offset + length
+                while offset < end:
+                    chunk = f.read(min(CHUNK_SIZE, end - offset))
+                    if not chunk:
+                        break  # truncated while exporting
+                    offset += len(chunk)
+                    yield executor.submit(zlib.compress, chunk, self.compression_level)
+                position = offset
+            if stat.st_size > position:
+                yield _frame(FRAME_HOLE, HOLE_PAYLOAD.pack(stat.st_size - position))
+
+    def import_instance(self, stream: BinaryIO, output_dir: str, name: Optional[str] = None) -> ServerInstance:
+        """Reads a bundle into output_dir, rewriting the instance path (and optionally its name)."""
+        if _read_exact(stream, len(BUNDLE_MAGIC)) != BUNDLE_MAGIC:
+            raise ValueError("Not an instance bundle")
+
+        frame_type, length = FRAME_HEADER.unpack(_read_exact(stream, FRAME_HEADER.size))
+        if frame_type != FRAME_INSTANCE:
+            raise ValueError("Bundle is missing instance metadata")
+        metadata = json.loads(_read_exact(stream, length).decode('utf-8'))
+
+        instance = ServerInstance.from_dict(metadata['instance'])
+        instance.name = name or instance.name
+        instance.path = os.path.join(output_dir, instance.name)
+        if os.path.exists(instance.path):
+            raise ValueError(f"Instance directory already exists: {instance.path}")
+        self._check_conflicts(instance)
+        os.makedirs(instance.path)
+
+        template = None
+        template_files = set()
+        directories = []
+        try:
+            while True:
+                frame_type, length = FRAME_HEADER.unpack(_read_exact(stream, FRAME_HEADER.size))
+                if frame_type == FRAME_END:
+                    break
+                if frame_type == FRAME_DIRECTORY:
+                    header = json.loads(_read_exact(stream, length).decode('utf-8'))
+                    dest_dir = _safe_join(instance.path, header['path'])
+                    os.makedirs(dest_dir, exist_ok=True)
+                    os.chmod(dest_dir, header['mode'] & 0o7777)
+                    directories.append((dest_dir, header['mtime_ns']))
+                    continue
+                if frame_type != FRAME_FILE:
+                    raise ValueError(f"Unexpected frame {frame_type!r} in bundle")
+
+                header = json.loads(_read_exact(stream, length).decode('utf-8'))
+                dest_file = _safe_join(instance.path, header['path'])
+                os.makedirs(os.path.dirname(dest_file), exist_ok=True)
+
+                if 'ref' in header:
+                    if template is None:
+                        template = self.template_manager.get_template_by_name(instance.template_name)
+                        template_files = set(template.get_files())
+                    self._restore_reference(template, template_files, header, dest_file, metadata['algorithm'])
+                    self._expect_end_of_file(stream)
+                else:
+                    self._restore_data(stream, dest_file)
+
+                os.chmod(dest_file, header['mode'] & 0o7777)
+                os.utime(dest_file, ns=(header['mtime_ns'], header['mtime_ns']))
+
+            # Deepest first, once their contents are in place, as those moved the mtimes
+            for dest_dir, mtime_ns in reversed(directories):
+                os.utime(dest_dir, ns=(mtime_ns, mtime_ns))
+        except Exception:
+            shutil.rmtree(instance.path, ignore_errors=True)
+            raise
+
+        instance.save_metadata()
+        self.template_manager.register_instance(instance)
+        return instance
+
+    def _check_conflicts(self, instance: ServerInstance):
+        try:
+            template = self.template_manager.get_template_by_name(instance.template_name)
+        except ValueError:
+            # Without the template there is no telling which variables are ports
+            self.template_manager.logger.warning("Template not found, not checking ports of the imported instance",
+                                                 instance=instance.name, template=instance.template_name)
+            return
+        errors = self.template_manager.check_conflicts(template, instance.variables, instance.path)
+        if errors:
+            raise ValueError("\n".join(errors))
+
+    def _restore_data(self, stream: BinaryIO, dest_file: str):
+        with open(dest_file, 'wb') as f:
+            while True:
+                frame_type, length = FRAME_HEADER.unpack(_read_exact(stream, FRAME_HEADER.size))
+                if frame_type == FRAME_END_FILE:
+                    break
+                if frame_type == FRAME_HOLE:
+                    # Skipped, never written, so the filesystem leaves it unallocated
+                    f.seek(HOLE_PAYLOAD.unpack(_read_exact(stream, length))[0], os.SEEK_CUR)
+                    continue
+                if frame_type != FRAME_CHUNK:
+                    raise ValueError(f"Unexpected frame {frame_type!r} in file data")
+                f.write(zlib.decompress(_read_exact(stream, length)))
+            # Extends the file over a trailing hole
+            f.truncate()
+
+    def _expect_end_of_file(self, stream: BinaryIO):
+        frame_type, length = FRAME_HEADER.unpack(_read_exact(stream, FRAME_HEADER.size))
+        if frame_type != FRAME_END_FILE:
+            raise ValueError(f"Unexpected frame {frame_type!r} after template reference")
+
+    def _restore_reference(self, template: Template, template_files: set, header: Dict[str, Any],
+                           dest_file: str, algorithm: str):
+        relative_path = header['path'].replace('/', os.sep)
+        if relative_path not in template_files:
+            raise ValueError(f"Template '{template.name}' on this host has no file {header['path']}")
+
+        comparator = self.template_manager.comparator
+        if algorithm != comparator.algorithm:
+            comparator = FileComparator(algorithm)
+        if comparator.source_digest(template, relative_path) != header['ref']:
+            raise ValueError(f"Template file {header['path']} differs on this host")
+
+        if template.package is not None:
+            template.package.extract_file(relative_path, dest_file)
+        else:
+            copy_sparse(os.path.join(template.path, relative_path), dest_file, preserve_metadata=False)
@@ -0,0 +1,266 @@
+import os
+import shutil
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from core.file_transaction import JOURNAL_FILE, STAGING_DIR
+from core.io_limiter import get_io_limiter
+from core.sparse_copy import copy_sparse, data_size, reflink
+from core.structured_patch import PatchError, patch_format, patch_text
+from core.template_manager import TemplateManager
+from core.tracing import span
+from models.file_state import STATE_FILE, FileState, InstanceFileState, compute_variables_digest
+from models.ignore_rules import SECTION_OVERWRITE
+from models.instance import ServerInstance
+from models.template import Template
+
+METADATA_FILE = '.dotwork_instance.json'
+# Bookkeeping of the source instance; the clone gets its own
+EXCLUDED_NAMES = {STAGING_DIR, JOURNAL_FILE, METADATA_FILE, STATE_FILE}
+
+LINK_AUTO = 'auto'
+LINK_COPY = 'copy'
+LINK_MODES = (LINK_AUTO, LINK_COPY)
+
+# How each file got into the clone
+METHOD_REFLINK = 'reflinked'
+METHOD_COPY = 'copied'
+METHOD_RENDER = 'rendered'
+METHOD_PATCH = 'patched'
+
+
+@dataclass
+class CloneStats:
+    files: int = 0
+    bytes_copied: int = 0
+    duration: float = 0.0
+    reflinked: int = 0
+    copied: int = 0
+    rendered: int = 0
+    patched: int = 0
+
+    def describe(self) -> str:
+        return (f"{self.files} files in {self.duration:.2f}s: {self.reflinked} reflinked, "
+                f"{self.copied} copied "
+                f"({self.bytes_copied / 1024 / 1024:.1f} MiB), {self.rendered} rendered, {self.patched} patched")
+
+
+class InstanceCloner:
+    """Creates an instance from an existing one, world data and local changes included.
+
+    Files are reflinked where the filesystem supports it, so the clone
+    shares extents with the source until either side writes, and copied
+    otherwise. Hardlinks are never used: restores and operators write files
+    in place, which would change both instances. Only template files that
+    render one of the changed variables are rendered again; if the source
+    had local edits in such a file they are kept by key-level patching
+    where the update mode allows, and replaced otherwise. The clone gets
+    fresh metadata and file state of its own.
+    """
+
+    def __init__(self, template_manager: TemplateManager, link_mode: str = LINK_AUTO):
+        if link_mode not in LINK_MODES:
+            raise ValueError(f"Unknown link mode '{link_mode}', expected one of {', '.join(LINK_MODES)}")
+        self.template_manager = template_manager
+        self.link_mode = link_mode
+        self.logger = template_manager.logger
+        self._reflink_supported = link_mode == LINK_AUTO
+
+    def suggest_variables(self, source: ServerInstance, reserved: Set[int] = frozenset()) -> Dict[str, Any]:
+        """Moves every port of the source that may not be shared to the next free port."""
+        template = self.template_manager.get_template_by_name(source.template_name)
+        index = self.template_manager.variable_index
+        shared = set(self.template_manager.config.shared_port_variables)
+        taken = set(reserved)
+        variables = {}
+        for name in sorted(var.name for var in template.variables if var.type == 'port'):
+            if name in shared or name not in source.variables:
+                continue
+            try:
+                port = index.next_free_port(int(source.variables[name]), taken)
+            except (TypeError, ValueError):
+                continue
+            taken.add(port)
+            variables[name] = port
+        return variables
+
+    def check(self, source: ServerInstance, name: str, output_dir: str, variables: Dict[str, Any],
+              reserved: Optional[Dict[int, str]] = None) -> List[str]:
+        """Validation and port conflict errors the clone would have, empty if it can go ahead."""
+        template = self.template_manager.get_template_by_name(source.template_name)
+        dest_path = os.path.join(output_dir, name)
+        merged = dict(source.variables, **variables)
+        errors = self.template_manager.validate_variables(template, merged)
+        errors += self.template_manager.check_conflicts(template, merged, dest_path, reserved)
+        if os.path.exists(dest_path):
+            errors.append(f"Instance directory already exists: {dest_path}")
+        return errors
+
+    def clone(self, source: ServerInstance, name: str, output_dir: str,
+              variables: Optional[Dict[str, Any]] = None) -> Tuple[ServerInstance, CloneStats]:
+        """Clones source to output_dir/name with variables overriding the source's values."""
+        with self.logger.operation("clone_instance", instance=name, source=source.name), \
+                span("clone_instance", instance=name, source=source.name):
+            return self._clone(source, name, output_dir, variables or {})
+
+    def _clone(self, source: ServerInstance, name: str, output_dir: str,
+               overrides: Dict[str, Any]) -> Tuple[ServerInstance, CloneStats]:
+        template = self.template_manager.get_template_by_name(source.template_name)
+        dest_path = os.path.join(output_dir, name)
+        if os.path.exists(dest_path):
+            raise ValueError(f"Instance directory already exists: {dest_path}")
+
+        variables = dict(source.variables, **overrides)
+        changed = {key for key in set(source.variables) | set(variables)
+                   if source.variables.get(key) != variables.get(key)}
+        rerender = self._files_to_render(template, source, changed)
+
+        comparator = self.template_manager.comparator
+        source_state = InstanceFileState.load_from_path(source.path)
+        if source_state.algorithm != comparator.algorithm:
+            source_state = InstanceFileState(algorithm=comparator.algorithm)
+        file_state = InstanceFileState(algorithm=comparator.algorithm,
+                                       variables_digest=compute_variables_digest(variables))
+
+        directories, files, symlinks = self._walk(source.path)
+        patching = self.template_manager.patches_structured_files(template)
+        started = time.perf_counter()
+        stats = CloneStats(files=len(files))
+
+        def clone_file(relative_path: str):
+            source_file = os.path.join(source.path, relative_path)
+            dest_file = os.path.join(dest_path, relative_path)
+            if relative_path in rerender:
+                return self._render_file(template, relative_path, source_file, dest_file, variables,
+                                         source_state.files.get(relative_path), patching)
+            return self._link_file(source_file, dest_file), None
+
+        os.makedirs(dest_path)
+        try:
+            engine = self.template_manager.copy_engine
+            engine.create_directories(dest_path, directories, files)
+            for relative_path, target in symlinks.items():
+                os.symlink(target, os.path.join(dest_path, relative_path))
+
+            results, _ = engine.run(
+                [(relative_path, data_size(stat)) for relative_path, stat in files.items()], clone_file)
+
+            for relative_path, (method, keys) in results:
+                setattr(stats, method, getattr(stats, method) + 1)
+                if method == METHOD_COPY:
+                    stats.bytes_copied += data_size(files[relative_path])
+                self._record_state(file_state, source_state, template, relative_path, files[relative_path],
+                                   os.path.join(dest_path, relative_path), method, keys)
+            file_state.save(dest_path)
+
+            instance = source.derive(name, dest_path, variables)
+            instance.save_metadata()
+        except Exception:
+            shutil.rmtree(dest_path, ignore_errors=True)
+            raise
+
+        self.template_manager.register_instance(instance)
+        stats.duration = time.perf_counter() - started
+        self.logger.info(f"Cloned {source.name} to {name}: {stats.describe()}",
+                         duration_ms=round(stats.duration * 1000, 2))
+        return instance, stats
+
+    def _files_to_render(self, template: Template, source: ServerInstance, changed: Set[str]) -> Set[str]:
+        if not changed:
+            return set()
+        protected = self.template_manager.ignore_rules(source, template).matcher(SECTION_OVERWRITE)
+        rerender = set()
+        for relative_path in template.walk_tree()[1]:
+            if not self.template_manager.referenced_variables(template, relative_path) & changed:
+                continue
+            if protected.matches(relative_path):
+                self.logger.warning("Not rendering protected file again, it keeps the source's values",
+                                    file=relative_path, instance=source.name)
+                continue
+            rerender.add(relative_path)
+        return rerender
+
+    @staticmethod
+    def _walk(root: str):
+        """Directories, files (with lstat) and symlinks (with target) of an instance, relative to root."""
+        directories = []
+        files: Dict[str, os.stat_result] = {}
+        symlinks: Dict[str, str] = {}
+        for current, dirs, names in os.walk(root):
+            relative_root = os.path.relpath(current, root)
+            if relative_root == '.':
+                relative_root = ''
+                dirs[:] = [d for d in dirs if d not in EXCLUDED_NAMES]
+                names = [n for n in names if n not in EXCLUDED_NAMES]
+            for entry in list(dirs):
+                path = os.path.join(current, entry)
+                if os.path.islink(path):
+                    dirs.remove(entry)
+                    symlinks[os.path.join(relative_root, entry)] = os.readlink(path)
+                else:
+                    directories.append(os.path.join(relative_root, entry))
+            for entry in names:
+                path = os.path.join(current, entry)
+                relative_path = os.path.join(relative_root, entry)
+                stat = os.lstat(path)
+                if os.path.islink(path):
+                    symlinks[relative_path] = os.readlink(path)
+                else:
+                    files[relative_path] = stat
+        return directories, files, symlinks
+
+    def _link_file(self, source_file: str, dest_file: str) -> str:
+        # Reflinks move no data, but still count as an operation against the I/O limits
+        if self._reflink_supported:
+            if reflink(source_file, dest_file):
+                get_io_limiter().write(0)
+                return METHOD_REFLINK
+            self._reflink_supported = False
+        copy_sparse(source_file, dest_file)
+        return METHOD_COPY
+
+    def _render_file(self, template: Template, relative_path: str, source_file: str, dest_file: str,
+                     variables: Dict[str, Any], state: Optional[FileState], patching: bool):
+        edited = state is None or not state.matches_stat(os.stat(source_file))
+        format = patch_format(relative_path)
+        if edited and patching and format is not None and state is not None:
+            # Keep the source's local edits and change only the keys the new variables render differently
+            try:
+                rendered = self.template_manager.render_source_bytes(template, relative_path, variables)
+                if rendered is None:
+                    raise PatchError("not a text file")
+                with open(source_file, 'rb') as f:
+                    live_text = f.read().decode('utf-8')
+                patched, _, rendered_keys = patch_text(format, live_text, rendered.decode('utf-8'), state.keys)
+                self.template_manager.substitution.write_patched(dest_file, patched.encode('utf-8'))
+                shutil.copymode(source_file, dest_file)
+                return METHOD_PATCH, rendered_keys
+            except (PatchError, UnicodeDecodeError) as e:
+                self.logger.debug(f"Rendering whole file: {e}", file=relative_path)
+
+        if edited:
+            self.logger.warning("Local edits of the source are replaced by a fresh render", file=relative_path)
+        self.template_manager.materialize_file(template, relative_path, dest_file, variables)
+        keys = self.template_manager.rendered_keys(relative_path, dest_file) if patching else None
+        return METHOD_RENDER, keys
+
+    def _record_state(self, file_state: InstanceFileState, source_state: InstanceFileState, template: Template,
+                      relative_path: str, source_stat: os.stat_result, dest_file: str, method: str,
+                      keys: Optional[Dict[str, Any]]):
+        if method in (METHOD_RENDER, METHOD_PATCH):
+            dest_stat = os.stat(dest_file)
+            file_state.record(relative_path, self.template_manager.comparator.digest(dest_file, dest_stat),
+                              dest_stat, template.source_stat(relative_path), keys=keys)
+            return
+
+        state = source_state.files.get(relative_path)
+        if state is None:
+            return  # not provisioned from the template
+        if not state.matches_stat(source_stat):
+            # Edited in the source: the stale stat makes the next update hash it and see the edit
+            file_state.files[relative_path] = state
+            return
+        dest_stat = os.stat(dest_file)
+        file_state.files[relative_path] = replace(state, size=dest_stat.st_size, mtime_ns=dest_stat.st_mtime_ns,
+                                                  inode=dest_stat.st_ino)
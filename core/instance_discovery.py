@@ -0,0 +1,74 @@
+import os
+from typing import List, Tuple
+
+from core.file_transaction import JOURNAL_FILE, FileTransaction
+from models.instance import ServerInstance
+from utils.config import AppConfig
+from utils.logger import get_logger
+
+
+def get_search_paths(config: AppConfig) -> List[str]:
+    search_paths = [
+        config.instances_dir,
+        config.default_output_dir,
+        os.path.join(os.getcwd(), "instances"),
+        os.path.join(os.getcwd(), "output"),
+        os.getcwd()
+    ]
+
+    # Remove duplicates while preserving order
+    unique_paths = []
+    for path in search_paths:
+        if path and path not in unique_paths:
+            unique_paths.append(path)
+    return unique_paths
+
+
+def recover_instance(instance_path: str):
+    """Finishes a commit that was interrupted in this instance, so it isn't left half-applied."""
+    if not os.path.exists(os.path.join(instance_path, JOURNAL_FILE)) or FileTransaction.is_committing(instance_path):
+        return
+    logger = get_logger()
+    try:
+        action = FileTransaction.recover(instance_path)
+    except OSError as e:
+        logger.warning(f"Could not recover interrupted update: {e}", instance=instance_path)
+        return
+    if action:
+        logger.info(f"Interrupted update {action}", instance=instance_path)
+
+
+def find_instances_in_directory(directory: str) -> List[ServerInstance]:
+    instances = []
+
+    try:
+        for item in os.listdir(directory):
+            item_path = os.path.join(directory, item)
+            if os.path.isdir(item_path):
+                instance = ServerInstance.load_from_path(item_path)
+                if instance:
+                    recover_instance(item_path)
+                    instances.append(instance)
+    except PermissionError:
+        pass
+
+    return instances
+
+
+def discover_instances(search_paths: List[str]) -> Tuple[List[ServerInstance], List[str]]:
+    """Returns the instances found under search_paths and the paths that exist."""
+    found_instances = []
+    searched_paths = []
+    found_paths = set()  # Track unique instance paths to avoid duplicates
+
+    for search_path in search_paths:
+        if os.path.exists(search_path):
+            # Filter out duplicates based on normalized instance path
+            for instance in find_instances_in_directory(search_path):
+                normalized_path = os.path.normpath(os.path.abspath(instance.path))
+                if normalized_path not in found_paths:
+                    found_instances.append(instance)
+                    found_paths.add(normalized_path)
+            searched_paths.append(search_path)
+
+    return found_instances, searched_paths
@@ -0,0 +1,212 @@
+import contextvars
+import ctypes
+import ctypes.util
+import os
+import platform
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Optional
+
+from utils.config import AppConfig
+
+MB = 1024 * 1024
+# How far ahead of its rate a bucket may run after sitting idle
+BURST_SECONDS = 0.25
+
+IO_PRIORITY_NORMAL = ''
+IO_PRIORITY_LOW = 'low'
+IO_PRIORITY_IDLE = 'idle'
+
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_SHIFT = 13
+_IOPRIO_CLASS_BE = 2
+_IOPRIO_CLASS_IDLE = 3
+_IOPRIO_SET_SYSCALL = {'x86_64': 251, 'amd64': 251, 'aarch64': 30, 'arm64': 30, 'i386': 289, 'i686': 289}
+
+
+class TokenBucket:
+    """Rate limit in units per second, shared by every thread that consumes from it.
+
+    A request larger than the bucket goes into debt and the caller sleeps it
+    off, so large chunks are throttled as precisely as small ones.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = rate * BURST_SECONDS
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: float):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if delay > 0:
+            time.sleep(delay)
+
+
+class IOLimiter:
+    """Read/write bandwidth and IOPS caps for file I/O in core.
+
+    A cap of 0 means unlimited. A limiter with a parent (e.g. a job limit
+    under the process-wide one) charges both, so a job can only be stricter.
+    """
+
+    def __init__(self, read_mb_per_s: float = 0, write_mb_per_s: float = 0,
+                 read_iops: float = 0, write_iops: float = 0, parent: Optional['IOLimiter'] = None):
+        self.parent = parent
+        self.configure(read_mb_per_s, write_mb_per_s, read_iops, write_iops)
+
+    def configure(self, read_mb_per_s: float = 0, write_mb_per_s: float = 0,
+                  read_iops: float = 0, write_iops: float = 0):
+        self._read_bytes = TokenBucket(read_mb_per_s * MB) if read_mb_per_s > 0 else None
+        self._write_bytes = TokenBucket(write_mb_per_s * MB) if write_mb_per_s > 0 else None
+        self._read_ops = TokenBucket(read_iops) if read_iops > 0 else None
+        self._write_ops = TokenBucket(write_iops) if write_iops > 0 else None
+        self._own_limits = any((self._read_bytes, self._write_bytes, self._read_ops, self._write_ops))
+
+    @property
+    def unlimited(self) -> bool:
+        return not self._own_limits and (self.parent is None or self.parent.unlimited)
+
+    def read(self, size: int):
+        """Charges one read operation of size bytes, sleeping if over budget."""
+        if self._own_limits:
+            if self._read_ops is not None:
+                self._read_ops.consume(1)
+            if self._read_bytes is not None and size > 0:
+                self._read_bytes.consume(size)
+        if self.parent is not None:
+            self.parent.read(size)
+
+    def write(self, size: int):
+        """Charges one write operation of size bytes, sleeping if over budget."""
+        if self._own_limits:
+            if self._write_ops is not None:
+                self._write_ops.consume(1)
+            if self._write_bytes is not None and size > 0:
+                self._write_bytes.consume(size)
+        if self.parent is not None:
+            self.parent.write(size)
+
+
+_process_limiter = IOLimiter()
+_process_priority = IO_PRIORITY_NORMAL
+_job_limiter: contextvars.ContextVar[Optional[IOLimiter]] = contextvars.ContextVar('dotwork_io_limiter', default=None)
+
+
+def get_io_limiter() -> IOLimiter:
+    """The limiter for the current job, or the process-wide one outside of jobs."""
+    return _job_limiter.get() or _process_limiter
+
+
+def configure_io(config: AppConfig):
+    """Applies the io_* settings of the config to the process-wide limiter and I/O priority."""
+    global _process_priority
+    _process_limiter.configure(config.io_read_mb_per_s, config.io_write_mb_per_s,
+                               config.io_read_iops, config.io_write_iops)
+    if config.io_priority != _process_priority:
+        set_io_priority(config.io_priority, whole_process=True)
+        _process_priority = config.io_priority
+
+
+@contextmanager
+def io_limits(read_mb_per_s: float = 0, write_mb_per_s: float = 0, read_iops: float = 0, write_iops: float = 0):
+    """Applies extra caps to the I/O of the enclosed job, on top of the process-wide ones.
+
+    Work handed to thread pools keeps the caps when submitted through
+    propagate_context().
+    """
+    limiter = IOLimiter(read_mb_per_s, write_mb_per_s, read_iops, write_iops, parent=get_io_limiter())
+    token = _job_limiter.set(limiter)
+    try:
+        yield limiter
+    finally:
+        _job_limiter.reset(token)
+
+
+def propagate_context(fn: Callable) -> Callable:
+    """Wraps fn to run in a copy of the caller's context, so job limits and log context follow it into pools."""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return run
+
+
+class LimitedWriter:
+    """File-like wrapper that charges every write to a limiter.
+
+    With copy=True each write is also charged as the read that produced it,
+    for copies whose source side is not a plain file read (e.g. an mmap).
+    """
+
+    def __init__(self, stream: BinaryIO, limiter: IOLimiter, copy: bool = False):
+        self.stream = stream
+        self.limiter = limiter
+        self.copy = copy
+
+    def write(self, data) -> int:
+        if self.copy:
+            self.limiter.read(len(data))
+        self.limiter.write(len(data))
+        return self.stream.write(data)
+
+
+def copy_stream(source: BinaryIO, dest: BinaryIO, chunk_size: int = MB, limiter: Optional[IOLimiter] = None) -> int:
+    """Copies source to dest in chunks, charging reads and writes to the limiter."""
+    limiter = limiter or get_io_limiter()
+    copied = 0
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return copied
+        limiter.read(len(chunk))
+        limiter.write(len(chunk))
+        dest.write(chunk)
+        copied += len(chunk)
+
+
+def set_io_priority(priority: str, whole_process: bool = False) -> bool:
+    """Lowers the disk I/O priority on Linux via ioprio_set; a no-op elsewhere.
+
+    'low' is the lowest best-effort level, 'idle' only gets disk time nobody
+    else wants, '' goes back to the default. Linux keeps the priority per
+    thread and new threads inherit it from the thread that starts them. By
+    default only the calling thread changes; whole_process changes every
+    thread that exists now. Returns whether the priority was applied.
+    """
+    if priority not in (IO_PRIORITY_NORMAL, IO_PRIORITY_LOW, IO_PRIORITY_IDLE) or not sys.platform.startswith('linux'):
+        return False
+    syscall_number = _IOPRIO_SET_SYSCALL.get(platform.machine().lower())
+    if syscall_number is None:
+        return False
+
+    if priority == IO_PRIORITY_NORMAL:
+        value = 0  # IOPRIO_CLASS_NONE: derived from the CPU nice level again
+    elif priority == IO_PRIORITY_IDLE:
+        value = _IOPRIO_CLASS_IDLE << _IOPRIO_CLASS_SHIFT
+    else:
+        value = (_IOPRIO_CLASS_BE << _IOPRIO_CLASS_SHIFT) | 7
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    except (OSError, AttributeError):
+        return False
+
+    # With IOPRIO_WHO_PROCESS a thread id targets just that thread, 0 the caller
+    thread_ids = [0]
+    if whole_process:
+        try:
+            thread_ids = [int(tid) for tid in os.listdir('/proc/self/task')]
+        except OSError:
+            pass
+    applied = True
+    for tid in thread_ids:
+        applied = libc.syscall(syscall_number, _IOPRIO_WHO_PROCESS, tid, value) == 0 and applied
+    return applied
@@ -0,0 +1,262 @@
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DURATION_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+SIZE_BUCKETS = (1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2, 500 * 1024 ** 2, 1024 ** 3, 5 * 1024 ** 3)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, values: Sequence[str]) -> LabelValues:
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(values)}")
+        return tuple(str(value) for value in values)
+
+    def labels(self, *values: str) -> '_Child':
+        return _Child(self, self._key(values))
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class _Child:
+    """A metric bound to one set of label values."""
+
+    def __init__(self, metric: _Metric, key: LabelValues):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount: float = 1.0):
+        self._metric._inc(self._key, amount)
+
+    def set(self, value: float):
+        self._metric._set(self._key, value)
+
+    def observe(self, value: float):
+        self._metric._observe(self._key, value)
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0):
+        self._inc((), amount)
+
+    def _inc(self, key: LabelValues, amount: float):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *values: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(values), 0.0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value: float):
+        self._set((), value)
+
+    def _inc(self, key: LabelValues, amount: float):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _set(self, key: LabelValues, value: float):
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> (per-bucket counts, sum, count)
+        self._values: Dict[LabelValues, List] = {}
+
+    def observe(self, value: float):
+        self._observe((), value)
+
+    def time(self):
+        return _Child(self, ()).time()
+
+    def _observe(self, key: LabelValues, value: float):
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def count(self, *values: str) -> int:
+        with self._lock:
+            state = self._values.get(self._key(values))
+            return state[2] if state else 0
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        bucket_labels = self.labelnames + ('le',)
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(bucket_labels, key + (_format_value(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide set of metrics rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path: str):
+        """Writes the metrics for node_exporter's textfile collector, replacing the file atomically."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+REGISTRY = MetricsRegistry()
+
+FILES_PROCESSED = REGISTRY.counter(
+    'dotwork_files_total', 'Template files handled, by result (rendered, copied, unchanged)', ['result'])
+BYTES_WRITTEN = REGISTRY.counter(
+    'dotwork_bytes_written_total', 'Bytes written into instances from templates')
+FILE_RENDER_SECONDS = REGISTRY.histogram(
+    'dotwork_file_render_seconds', 'Time spent rendering one template file')
+FILE_WRITE_SECONDS = REGISTRY.histogram(
+    'dotwork_file_write_seconds', 'Time spent writing or copying one file into an instance')
+
+BACKUPS = REGISTRY.counter(
+    'dotwork_backups_total', 'Instance backups created, by result', ['result'])
+BACKUP_SECONDS = REGISTRY.histogram(
+    'dotwork_backup_duration_seconds', 'Time spent creating one instance backup', buckets=DURATION_BUCKETS)
+BACKUP_BYTES = REGISTRY.histogram(
+    'dotwork_backup_size_bytes', 'Size of created backup archives', buckets=SIZE_BUCKETS)
+BACKUP_VERIFICATIONS = REGISTRY.counter(
+    'dotwork_backup_verifications_total', 'Backup archives verified by the scrubber, by result (ok, corrupt)',
+    ['result'])
+BACKUP_VERIFY_BYTES = REGISTRY.counter(
+    'dotwork_backup_verify_bytes_total', 'Archive bytes read by the backup scrubber')
+BACKUPS_CORRUPT = REGISTRY.gauge(
+    'dotwork_backups_corrupt', 'Backup archives whose last verification failed')
+
+ROLLOUT_INSTANCES = REGISTRY.counter(
+    'dotwork_rollout_instances_total', 'Instances handled by bulk updates, by result', ['result'])
+ROLLOUT_SECONDS = REGISTRY.histogram(
+    'dotwork_rollout_duration_seconds', 'Wall time of one bulk update', buckets=DURATION_BUCKETS)
+ROLLOUT_THROUGHPUT = REGISTRY.gauge(
+    'dotwork_rollout_instances_per_second', 'Instances updated per second in the last bulk update')
+COPY_THROUGHPUT = REGISTRY.gauge(
+    'dotwork_copy_bytes_per_second', 'Template bytes materialized per second in the last instance creation')
+
+JOBS_QUEUED = REGISTRY.gauge(
+    'dotwork_jobs_queued', 'Scheduled jobs waiting to start, by priority class', ['priority'])
+JOB_WAIT_SECONDS = REGISTRY.histogram(
+    'dotwork_job_wait_seconds', 'Time scheduled jobs waited before starting, by priority class', ['priority'],
+    buckets=DURATION_BUCKETS)
+JOBS_YIELDED = REGISTRY.counter(
+    'dotwork_jobs_yielded_total', 'Pauses of running jobs for interactive work, by priority class', ['priority'])
+
+CACHE_REQUESTS = REGISTRY.counter(
+    'dotwork_cache_requests_total', 'Cache lookups, by cache and result (hit, miss)', ['cache', 'result'])
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
@@ -0,0 +1,115 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from core.io_limiter import propagate_context
+from core.metrics import ROLLOUT_INSTANCES, ROLLOUT_SECONDS, ROLLOUT_THROUGHPUT
+from models.instance import ServerInstance
+from models.result import FileResult, RolloutResult
+from utils.config import AppConfig
+
+# Updates one instance and returns its file results
+UpdateFunction = Callable[[ServerInstance, bool], List[FileResult]]
+
+
+@dataclass
+class RolloutPolicy:
+    canary_count: int = 1
+    batch_size: int = 10
+    concurrency: int = 4
+    max_failure_rate: float = 0.2
+    pause_seconds: float = 0.0
+    dry_run: bool = False
+
+    @classmethod
+    def from_config(cls, config: AppConfig) -> 'RolloutPolicy':
+        return cls(
+            canary_count=config.rollout_canary_count,
+            batch_size=config.rollout_batch_size,
+            concurrency=config.rollout_concurrency,
+            max_failure_rate=config.rollout_max_failure_rate,
+            pause_seconds=config.rollout_pause_seconds
+        )
+
+    def plan(self, instances: List[ServerInstance]) -> List[List[ServerInstance]]:
+        """Splits instances into the canary batch followed by regular batches."""
+        batches = []
+        canary_count = max(0, min(self.canary_count, len(instances)))
+        if canary_count:
+            batches.append(instances[:canary_count])
+
+        batch_size = max(1, self.batch_size)
+        for start in range(canary_count, len(instances), batch_size):
+            batches.append(instances[start:start + batch_size])
+        return batches
+
+
+class RolloutRunner:
+    """Runs an update across instances batch by batch, stopping when failures pile up.
+
+    The canary batch has to pass without a single failure. After that, every
+    batch runs with ``concurrency`` parallel updates, and the rollout stops as
+    soon as the failure rate so far exceeds ``max_failure_rate``.
+    """
+
+    def __init__(self, update: UpdateFunction):
+        self.update = update
+
+    def run(self, instances: List[ServerInstance], policy: RolloutPolicy,
+            progress: Optional[Callable[[int, int, ServerInstance], None]] = None,
+            should_continue: Optional[Callable[[int, int], bool]] = None) -> RolloutResult:
+        result = RolloutResult()
+        started = time.perf_counter()
+        batches = policy.plan(instances)
+        done = 0
+        has_canary = policy.canary_count > 0 and bool(instances)
+
+        for batch_index, batch in enumerate(batches):
+            if batch_index > 0:
+                if should_continue is not None and not should_continue(batch_index, len(batches)):
+                    self._stop(result, batches[batch_index:], "cancelled")
+                    break
+                if policy.pause_seconds > 0:
+                    time.sleep(policy.pause_seconds)
+
+            with ThreadPoolExecutor(max_workers=max(1, policy.concurrency)) as executor:
+                update = propagate_context(self.update)
+                futures = {executor.submit(update, instance, policy.dry_run): instance for instance in batch}
+                for future in as_completed(futures):
+                    instance = futures[future]
+                    try:
+                        result.processed_files.extend(future.result())
+                        result.updated.append(instance.name)
+                    except Exception as e:
+                        result.failed[instance.name] = str(e)
+                    done += 1
+                    if progress is not None:
+                        progress(done, len(instances), instance)
+
+            is_canary = has_canary and batch_index == 0
+            if is_canary and result.failed:
+                self._stop(result, batches[batch_index + 1:], "canary failed")
+                break
+
+            attempted = len(result.updated) + len(result.failed)
+            if attempted and len(result.failed) / attempted > policy.max_failure_rate:
+                self._stop(result, batches[batch_index + 1:],
+                           f"failure rate {len(result.failed)}/{attempted} exceeded {policy.max_failure_rate:.0%}")
+                break
+
+        elapsed = time.perf_counter() - started
+        ROLLOUT_SECONDS.observe(elapsed)
+        ROLLOUT_INSTANCES.labels('updated').inc(len(result.updated))
+        ROLLOUT_INSTANCES.labels('failed').inc(len(result.failed))
+        ROLLOUT_INSTANCES.labels('skipped').inc(len(result.skipped))
+        if elapsed > 0:
+            ROLLOUT_THROUGHPUT.set(len(result.updated) / elapsed)
+        return result
+
+    @staticmethod
+    def _stop(result: RolloutResult, remaining: List[List[ServerInstance]], reason: str):
+        result.aborted = True
+        result.abort_reason = reason
+        for batch in remaining:
+            result.skipped.extend(instance.name for instance in batch)
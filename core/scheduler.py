@@ -0,0 +1,294 @@
+import contextvars
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+
+from core.io_limiter import propagate_context
+from core.metrics import JOB_WAIT_SECONDS, JOBS_QUEUED, JOBS_YIELDED
+from utils.logger import get_logger
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_NORMAL: 'normal',
+    PRIORITY_BACKGROUND: 'background',
+}
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_PAUSED = "paused"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# A queued job moves up one priority class for every this many seconds it waits
+AGING_SECONDS = 300
+# Finished jobs kept for the queue view
+HISTORY_SIZE = 50
+
+_current_job: contextvars.ContextVar[Optional['ScheduledJob']] = contextvars.ContextVar(
+    'dotwork_scheduled_job', default=None)
+
+
+def parse_priority(value: Any, default: int = PRIORITY_NORMAL) -> int:
+    """Accepts a priority class number or name; None gives the default."""
+    if value is None or value == '':
+        return default
+    if isinstance(value, int) and value in PRIORITY_NAMES:
+        return value
+    for priority, name in PRIORITY_NAMES.items():
+        if name == value:
+            return priority
+    raise ValueError(f"Unknown priority '{value}', expected one of {', '.join(PRIORITY_NAMES.values())}")
+
+
+@dataclass
+class ScheduledJob:
+    id: str
+    kind: str
+    priority: int
+    instance: Optional[str]
+    group: str
+    fn: Callable[[], Any] = field(repr=False)
+    sequence: int = 0
+    status: str = JOB_QUEUED
+    error: str = ''
+    submitted: float = field(default_factory=time.monotonic)
+    created_at: datetime = field(default_factory=datetime.now)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    # Times the job paused at a file boundary for interactive work
+    yields: int = 0
+    future: Future = field(default_factory=Future, repr=False)
+    scheduler: Optional['JobScheduler'] = field(default=None, repr=False)
+
+    @property
+    def priority_name(self) -> str:
+        return PRIORITY_NAMES[self.priority]
+
+    @property
+    def waited(self) -> float:
+        return (self.started or time.monotonic()) - self.submitted
+
+    @property
+    def ran(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'priority': self.priority_name,
+            'instance': self.instance,
+            'status': self.status,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'waited': round(self.waited, 3),
+            'ran': round(self.ran, 3),
+            'yields': self.yields,
+        }
+
+
+class JobScheduler:
+    """Runs jobs by priority class with one job per instance at a time.
+
+    Interactive jobs go before normal ones and normal before background;
+    within a class, jobs of different groups (e.g. two bulk updates) take
+    turns so one large group cannot hold every worker. A queued job moves up
+    a class for every AGING_SECONDS it waits, so background work is delayed
+    but never starved. ``interactive_workers`` extra threads take only
+    interactive jobs, so an operator's job starts even while every general
+    worker is busy. Running lower-priority jobs pause at their next
+    checkpoint() (between files or waves of files, on the job's own thread)
+    while interactive work is running.
+    """
+
+    def __init__(self, workers: int = 2, interactive_workers: int = 1):
+        self.workers = max(1, workers)
+        self.interactive_workers = max(0, interactive_workers)
+        self.logger = get_logger()
+        self._cond = threading.Condition()
+        self._queued: List[ScheduledJob] = []
+        self._running: List[ScheduledJob] = []
+        self._history: Deque[ScheduledJob] = deque(maxlen=HISTORY_SIZE)
+        self._locked_instances: Set[str] = set()
+        # Turn at which each group last started a job, for round-robin within a class
+        self._group_turns: Dict[str, int] = {}
+        self._turns = itertools.count()
+        self._sequence = itertools.count()
+        self._idle = {True: 0, False: 0}  # idle threads by "interactive only"
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+
+    def start(self):
+        with self._cond:
+            if self._threads:
+                return
+            self._stopping = False
+            for index in range(self.workers + self.interactive_workers):
+                interactive_only = index >= self.workers
+                thread = threading.Thread(target=self._work, args=(interactive_only,),
+                                          name=f"dotwork-job-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def shutdown(self, wait: bool = True):
+        """Stops the workers after their current job; queued jobs are cancelled."""
+        with self._cond:
+            self._stopping = True
+            for job in self._queued:
+                job.future.cancel()
+            self._queued.clear()
+            self._update_queue_metrics()
+            self._cond.notify_all()
+            threads, self._threads = self._threads, []
+        if wait:
+            for thread in threads:
+                thread.join(timeout=10)
+
+    def submit(self, kind: str, fn: Callable[[], Any], priority: int = PRIORITY_NORMAL,
+               instance: Optional[str] = None, group: Optional[str] = None) -> ScheduledJob:
+        """Queues fn; its result or exception ends up in the returned job's future.
+
+        fn runs in a copy of the caller's context, so job I/O limits and log
+        context carry over.
+        """
+        job = ScheduledJob(id=uuid.uuid4().hex, kind=kind, priority=priority, instance=instance,
+                           group='', fn=fn, scheduler=self)
+        job.group = group or job.id
+
+        def run_job():
+            _current_job.set(job)
+            return fn()
+        job.fn = propagate_context(run_job)
+        self.start()
+        with self._cond:
+            job.sequence = next(self._sequence)
+            self._queued.append(job)
+            self._update_queue_metrics()
+            self._cond.notify_all()
+        return job
+
+    def run(self, kind: str, fn: Callable[[], Any], priority: int = PRIORITY_NORMAL,
+            instance: Optional[str] = None, group: Optional[str] = None) -> Any:
+        """Submits fn and waits for its result."""
+        return self.submit(kind, fn, priority, instance, group).future.result()
+
+    def jobs(self) -> List[ScheduledJob]:
+        """Running jobs, then queued ones in the order they would start, then recently finished ones."""
+        with self._cond:
+            now = time.monotonic()
+            queued = sorted(self._queued, key=lambda job: self._sort_key(job, now))
+            return list(self._running) + queued + list(reversed(self._history))
+
+    def checkpoint(self, job: ScheduledJob):
+        """Blocks a non-interactive job while interactive work is running or about to start."""
+        if job.priority == PRIORITY_INTERACTIVE:
+            return
+        with self._cond:
+            if not self._interactive_pending():
+                return
+            job.status = JOB_PAUSED
+            job.yields += 1
+            JOBS_YIELDED.labels(job.priority_name).inc()
+            self.logger.debug(f"Job {job.kind} paused for interactive work", instance=job.instance)
+            while not self._stopping and self._interactive_pending():
+                self._cond.wait(1.0)
+            job.status = JOB_RUNNING
+
+    def _interactive_pending(self) -> bool:
+        if any(job.priority == PRIORITY_INTERACTIVE for job in self._running):
+            return True
+        # Queued interactive jobs only count if a thread is free to start them
+        if not (self._idle[True] or self._idle[False]):
+            return False
+        return any(job.priority == PRIORITY_INTERACTIVE and self._can_start(job) for job in self._queued)
+
+    def _can_start(self, job: ScheduledJob) -> bool:
+        return job.instance is None or job.instance not in self._locked_instances
+
+    def _sort_key(self, job: ScheduledJob, now: float):
+        effective = max(PRIORITY_INTERACTIVE, job.priority - int((now - job.submitted) // AGING_SECONDS))
+        return effective, self._group_turns.get(job.group, -1), job.sequence
+
+    def _next_job(self, interactive_only: bool) -> Optional[ScheduledJob]:
+        now = time.monotonic()
+        candidates = [job for job in self._queued if self._can_start(job)
+                      and (not interactive_only or job.priority == PRIORITY_INTERACTIVE)]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda job: self._sort_key(job, now))
+
+    def _work(self, interactive_only: bool):
+        while True:
+            with self._cond:
+                self._idle[interactive_only] += 1
+                job = self._next_job(interactive_only)
+                while job is None and not self._stopping:
+                    self._cond.wait()
+                    job = self._next_job(interactive_only)
+                self._idle[interactive_only] -= 1
+                if job is None:
+                    return
+                self._queued.remove(job)
+                if job.instance is not None:
+                    self._locked_instances.add(job.instance)
+                self._group_turns[job.group] = next(self._turns)
+                job.status = JOB_RUNNING
+                job.started = time.monotonic()
+                self._running.append(job)
+                self._update_queue_metrics()
+                if not job.future.set_running_or_notify_cancel():
+                    self._finish(job, JOB_FAILED, 'cancelled')
+                    continue
+            JOB_WAIT_SECONDS.labels(job.priority_name).observe(job.waited)
+
+            try:
+                result = job.fn()
+            except BaseException as e:
+                with self._cond:
+                    self._finish(job, JOB_FAILED, str(e) or type(e).__name__)
+                job.future.set_exception(e)
+            else:
+                with self._cond:
+                    self._finish(job, JOB_DONE)
+                job.future.set_result(result)
+
+    def _finish(self, job: ScheduledJob, status: str, error: str = ''):
+        job.status = status
+        job.error = error
+        job.finished = time.monotonic()
+        self._running.remove(job)
+        if job.instance is not None:
+            self._locked_instances.discard(job.instance)
+        if not any(queued.group == job.group for queued in self._queued):
+            self._group_turns.pop(job.group, None)
+        self._history.append(job)
+        self._cond.notify_all()
+
+    def _update_queue_metrics(self):
+        for priority, name in PRIORITY_NAMES.items():
+            JOBS_QUEUED.labels(name).set(sum(1 for job in self._queued if job.priority == priority))
+
+
+def current_job() -> Optional[ScheduledJob]:
+    return _current_job.get()
+
+
+def checkpoint():
+    """Called by core between files; lets a lower-priority scheduled job yield to interactive work.
+
+    Does nothing outside scheduled jobs.
+    """
+    job = _current_job.get()
+    if job is not None and job.scheduler is not None:
+        job.scheduler.checkpoint(job)
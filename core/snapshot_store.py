@@ -0,0 +1,147 @@
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from core.file_compare import FileComparator
+from models.template import Template
+from models.template_snapshot import TemplateDelta, TemplateSnapshot
+from utils.logger import get_logger
+
+SNAPSHOT_DIR = '.snapshots'
+# How long a computed delta is reused, e.g. across the instances of one rollout,
+# before the template tree is walked again to notice edits
+DELTA_CACHE_SECONDS = 60
+
+
+@dataclass
+class CachedDelta:
+    delta: TemplateDelta
+    # Template tree the delta was computed against
+    directories: List[str]
+    files: List[str]
+    template: Template
+    computed: float
+
+
+def _safe_name(value: str) -> str:
+    return re.sub(r'[^\w.-]', '_', value)
+
+
+class SnapshotStore:
+    """Per-version template manifests stored under ``<templates_dir>/.snapshots``."""
+
+    def __init__(self, templates_dir: str, comparator: FileComparator):
+        self.snapshots_dir = os.path.join(templates_dir, SNAPSHOT_DIR)
+        self.comparator = comparator
+        self.logger = get_logger()
+        self._loaded: Dict[Tuple[str, str], Optional[TemplateSnapshot]] = {}
+        self._captured: Dict[Tuple[str, str], TemplateSnapshot] = {}
+        # (template path, from version, to version) -> delta
+        self._deltas: Dict[Tuple[str, str, str], CachedDelta] = {}
+        self._lock = threading.Lock()
+
+    def _snapshot_file(self, template_name: str, version: str) -> str:
+        return os.path.join(self.snapshots_dir, _safe_name(template_name), f"{_safe_name(version)}.json")
+
+    def exists(self, template: Template) -> bool:
+        return os.path.exists(self._snapshot_file(template.name, template.version))
+
+    def load(self, template_name: str, version: str) -> Optional[TemplateSnapshot]:
+        key = (template_name, version)
+        with self._lock:
+            if key in self._loaded:
+                return self._loaded[key]
+
+        snapshot = TemplateSnapshot.load(self._snapshot_file(template_name, version))
+        with self._lock:
+            self._loaded[key] = snapshot
+        return snapshot
+
+    def _save(self, snapshot: TemplateSnapshot):
+        snapshot.save(self._snapshot_file(snapshot.template_name, snapshot.version))
+        with self._lock:
+            self._loaded[(snapshot.template_name, snapshot.version)] = snapshot
+
+    def capture(self, template: Template) -> TemplateSnapshot:
+        """Manifest of the current template tree.
+
+        Only files whose size or mtime differ from the last capture (or the
+        stored manifest) are hashed again. If the tree no longer matches the
+        stored manifest of its version, the manifest is rewritten; when the
+        content itself changed it is marked as edited, so deltas from that
+        version fall back to a full update.
+        """
+        key = (template.path, template.version)
+        stored = self.load(template.name, template.version)
+        with self._lock:
+            known = self._captured.get(key)
+        if known is None:
+            known = stored
+        if known is not None and known.algorithm != self.comparator.algorithm:
+            known = None
+
+        snapshot = TemplateSnapshot(
+            template_name=template.name,
+            version=template.version,
+            algorithm=self.comparator.algorithm,
+            edited=stored.edited if stored is not None else False
+        )
+        for relative_path in template.get_files():
+            src_stat = template.source_stat(relative_path)
+            stat = [src_stat.st_size, src_stat.st_mtime_ns]
+            if known is not None and known.stats.get(relative_path) == stat and relative_path in known.files:
+                snapshot.files[relative_path] = known.files[relative_path]
+            else:
+                snapshot.files[relative_path] = self.comparator.source_digest(template, relative_path, src_stat)
+            snapshot.stats[relative_path] = stat
+
+        if (stored is not None and stored.algorithm == snapshot.algorithm
+                and (stored.stats != snapshot.stats or stored.files != snapshot.files)):
+            if stored.files != snapshot.files and not snapshot.edited:
+                snapshot.edited = True
+                self.logger.warning("Template changed without a version bump, instances of this version "
+                                    "get a full update", template=template.name, version=template.version)
+            self._save(snapshot)
+
+        with self._lock:
+            self._captured[key] = snapshot
+        return snapshot
+
+    def delta(self, template: Template, from_version: str) -> Optional[CachedDelta]:
+        """Changes from a stored version to the current template, or None if they can't be trusted.
+
+        Computed once and shared by every instance updated from the same
+        version within DELTA_CACHE_SECONDS, so a rollout walks the template once.
+        """
+        key = (template.path, from_version, template.version)
+        with self._lock:
+            cached = self._deltas.get(key)
+        if (cached is not None and cached.template is template
+                and time.monotonic() - cached.computed < DELTA_CACHE_SECONDS):
+            return cached
+
+        previous = self.load(template.name, from_version)
+        if previous is None or previous.algorithm != self.comparator.algorithm or previous.edited:
+            return None
+        current = self.capture(template)
+        cached = CachedDelta(delta=previous.diff(current), directories=template.walk_tree()[0],
+                             files=list(current.files), template=template, computed=time.monotonic())
+        with self._lock:
+            self._deltas[key] = cached
+        return cached
+
+    def record(self, template: Template) -> TemplateSnapshot:
+        """Captures the template and stores it as its version's snapshot unless one exists."""
+        snapshot = self.capture(template)
+        if self.load(template.name, template.version) is None:
+            self._save(snapshot)
+        return snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded.clear()
+            self._captured.clear()
+            self._deltas.clear()
@@ -0,0 +1,141 @@
+import errno
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from core.io_limiter import IOLimiter, copy_stream, get_io_limiter
+
+# Filesystems report holes at block granularity, so smaller files are never worth the seeks
+MIN_SPARSE_SIZE = 64 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+_HAS_SEEK_HOLE = hasattr(os, 'SEEK_DATA') and hasattr(os, 'SEEK_HOLE')
+# ioctl that makes dest share source's extents (Btrfs, XFS with reflink, bcachefs)
+_FICLONE = 0x40049409
+
+
+def is_sparse(stat: os.stat_result) -> bool:
+    """True if the file allocates fewer blocks than its apparent size needs."""
+    blocks = getattr(stat, 'st_blocks', None)
+    if blocks is None or stat.st_size < MIN_SPARSE_SIZE:
+        return False
+    return blocks * 512 < stat.st_size
+
+
+def data_size(stat) -> int:
+    """Bytes a copy actually moves: the allocated size for sparse files, the apparent size otherwise."""
+    if is_sparse(stat):
+        return stat.st_blocks * 512
+    return stat.st_size
+
+
+def _data_ranges(fd: int, size: int):
+    """Yields (offset, length) of every data region, skipping holes."""
+    offset = 0
+    while offset < size:
+        try:
+            data_start = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                return  # only a hole remains
+            raise
+        data_end = os.lseek(fd, data_start, os.SEEK_HOLE)
+        yield data_start, data_end - data_start
+        offset = data_end
+
+
+def data_regions(fd: int, stat: os.stat_result):
+    """(offset, length) of the data regions of an open file: the whole file unless it is sparse
+    and the platform and filesystem report holes."""
+    if not _HAS_SEEK_HOLE or not is_sparse(stat):
+        return [(0, stat.st_size)]
+    try:
+        return list(_data_ranges(fd, stat.st_size))
+    except OSError as e:
+        if e.errno not in (errno.EINVAL, errno.EOPNOTSUPP):
+            raise
+        return [(0, stat.st_size)]  # the filesystem does not report holes
+
+
+def _copy_range(src_fd: int, dst_fd: int, offset: int, length: int, limiter: IOLimiter):
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    end = offset + length
+    while offset < end:
+        count = min(CHUNK_SIZE, end - offset)
+        if copy_file_range is not None:
+            try:
+                copied = copy_file_range(src_fd, dst_fd, count, offset, offset)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                    raise
+                copy_file_range = None
+                continue
+        else:
+            data = os.pread(src_fd, count, offset)
+            copied = os.pwrite(dst_fd, data, offset) if data else 0
+        if copied == 0:
+            break
+        # Charged once per chunk actually copied, also when copy_file_range fell back
+        limiter.read(copied)
+        limiter.write(copied)
+        offset += copied
+
+
+def copy_sparse(source_path: str, dest_path: str, preserve_metadata: bool = True) -> int:
+    """Copies a file like shutil.copy2, keeping holes in sparse files as holes.
+
+    Data regions are found with SEEK_DATA/SEEK_HOLE and only they are read
+    and written; the destination is then extended to the full size, so its
+    holes are never allocated. Dense files, and platforms or filesystems
+    without hole reporting, go through shutil, or through a chunked copy
+    while I/O limits are set. Returns the number of data bytes copied, which
+    is less than the file size for sparse files.
+    """
+    stat = os.stat(source_path)
+    limiter = get_io_limiter()
+    if not _HAS_SEEK_HOLE or not is_sparse(stat):
+        if limiter.unlimited:
+            shutil.copyfile(source_path, dest_path)
+        else:
+            with open(source_path, 'rb') as src, open(dest_path, 'wb') as dst:
+                copy_stream(src, dst, CHUNK_SIZE, limiter)
+        if preserve_metadata:
+            shutil.copystat(source_path, dest_path)
+        return stat.st_size
+
+    copied = 0
+    with open(source_path, 'rb') as src, open(dest_path, 'wb') as dst:
+        src_fd, dst_fd = src.fileno(), dst.fileno()
+        for offset, length in data_regions(src_fd, stat):
+            _copy_range(src_fd, dst_fd, offset, length, limiter)
+            copied += length
+        os.ftruncate(dst_fd, stat.st_size)
+
+    if preserve_metadata:
+        shutil.copystat(source_path, dest_path)
+    return copied
+
+
+def reflink(source_path: str, dest_path: str) -> bool:
+    """Clones the file copy-on-write: no data is copied until either side is written.
+
+    Returns False, leaving no dest file behind, where the platform or
+    filesystem can't do it (or source and dest are on different filesystems).
+    """
+    if fcntl is None:
+        return False
+    try:
+        with open(source_path, 'rb') as src, open(dest_path, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+    except OSError as e:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        if e.errno in (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.ENOSYS, errno.EPERM):
+            return False
+        raise
+    shutil.copystat(source_path, dest_path)
+    return True
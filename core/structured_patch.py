@@ -0,0 +1,371 @@
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+# How updates treat structured files: rewrite them whole, or apply changed keys only
+UPDATE_MODE_OVERWRITE = 'overwrite'
+UPDATE_MODE_PATCH = 'patch'
+
+FORMAT_PROPERTIES = 'properties'
+FORMAT_YAML = 'yaml'
+
+PATCHABLE_FORMATS = {
+    '.properties': FORMAT_PROPERTIES,
+    '.yml': FORMAT_YAML,
+    '.yaml': FORMAT_YAML,
+}
+
+_MISSING = object()
+
+
+class PatchError(ValueError):
+    """The file can't be patched key by key and has to be rewritten whole."""
+
+
+def patch_format(relative_path: str) -> Optional[str]:
+    return PATCHABLE_FORMATS.get(os.path.splitext(relative_path)[1].lower())
+
+
+def _normalize(value: Any) -> Any:
+    # Keys are stored in the instance state, so values are kept JSON-shaped
+    return json.loads(json.dumps(value, default=str))
+
+
+def _display_key(format: str, key: str) -> str:
+    return '.'.join(str(part) for part in json.loads(key)) if format == FORMAT_YAML else key
+
+
+def _newline(text: str) -> str:
+    return '\r\n' if '\r\n' in text else '\n'
+
+
+# --- .properties ------------------------------------------------------------
+
+_PROPERTY_SEPARATOR = re.compile(r'(?<!\\)(?:\\\\)*[=:\s]')
+
+
+def _properties_entries(text: str) -> Dict[str, Tuple[int, int, str]]:
+    """Maps each key to (first line, line after the entry, raw value) of its logical line."""
+    lines = text.splitlines(keepends=True)
+    entries: Dict[str, Tuple[int, int, str]] = {}
+    index = 0
+    while index < len(lines):
+        start = index
+        logical = lines[index].rstrip('\r\n').lstrip()
+        # A value continues on the next line after an odd number of trailing backslashes
+        while (len(logical) - len(logical.rstrip('\\'))) % 2 == 1 and index + 1 < len(lines):
+            index += 1
+            logical = logical[:-1] + lines[index].rstrip('\r\n').lstrip()
+        index += 1
+
+        if not logical or logical[0] in '#!':
+            continue
+        separator = _PROPERTY_SEPARATOR.search(logical)
+        if separator is None:
+            key, value = logical, ''
+        else:
+            key = logical[:separator.end() - 1]
+            value = logical[separator.end():].lstrip()
+            if separator.group()[-1].isspace() and value[:1] in ('=', ':'):
+                value = value[1:].lstrip()
+        entries[key] = (start, index, value)
+    return entries
+
+
+def _patch_properties(live_text: str, rendered_text: str,
+                      changes: List[Tuple[str, Any]]) -> str:
+    live_lines = live_text.splitlines(keepends=True)
+    rendered_lines = rendered_text.splitlines(keepends=True)
+    live_entries = _properties_entries(live_text)
+    rendered_entries = _properties_entries(rendered_text)
+    newline = _newline(live_text)
+
+    replacements: Dict[int, Tuple[int, List[str]]] = {}
+    appended: List[str] = []
+    for key, value in changes:
+        new_lines = []
+        if value is not _MISSING:
+            start, end, _ = rendered_entries[key]
+            new_lines = [line.rstrip('\r\n') + newline for line in rendered_lines[start:end]]
+        if key in live_entries:
+            start, end, _ = live_entries[key]
+            replacements[start] = (end, new_lines)
+        else:
+            appended.extend(new_lines)
+
+    result = []
+    index = 0
+    while index < len(live_lines):
+        if index in replacements:
+            end, new_lines = replacements[index]
+            result.extend(new_lines)
+            index = end
+            continue
+        result.append(live_lines[index])
+        index += 1
+    if appended:
+        if result and not result[-1].endswith(('\n', '\r')):
+            result[-1] += newline
+        result.extend(appended)
+    return ''.join(result)
+
+
+# --- YAML -------------------------------------------------------------------
+
+_YAML_KEY = re.compile(r'''^(\s*)("(?:[^"\\]|\\.)*"|'(?:[^']|'')*'|[^\s#'"\-?][^#]*?|-[^\s#][^#]*?)\s*:(?:\s+|$)(.*)$''')
+
+
+def _split_comment(rest: str) -> Tuple[str, str]:
+    """Splits an inline value from its trailing comment, which keeps its leading whitespace."""
+    quote = None
+    for index, char in enumerate(rest):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char == '#' and (index == 0 or rest[index - 1].isspace()):
+            value = rest[:index].rstrip()
+            return value, rest[len(value):]
+    return rest.rstrip(), ''
+
+
+class _YamlEntry:
+    __slots__ = ('line', 'end', 'indent', 'value_text', 'comment')
+
+    def __init__(self, line: int, indent: int, value_text: str, comment: str):
+        self.line = line
+        self.end = line + 1
+        self.indent = indent
+        self.value_text = value_text
+        self.comment = comment
+
+
+def _indent_of(line: str) -> int:
+    return len(line) - len(line.lstrip(' '))
+
+
+def _yaml_entries(lines: List[str]) -> Dict[Tuple, _YamlEntry]:
+    """Locates every block-mapping key by path, with the lines its value spans."""
+    entries: Dict[Tuple, _YamlEntry] = {}
+    stack: List[Tuple[int, Tuple]] = []  # (indent, path) of the open mappings
+    skip_indent = None
+    skip_sequence = False
+
+    for number, raw in enumerate(lines):
+        line = raw.rstrip('\r\n')
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#') or stripped in ('---', '...'):
+            continue
+        indent = _indent_of(line)
+
+        if skip_indent is not None:
+            if indent > skip_indent or (skip_sequence and indent == skip_indent and stripped.startswith('-')):
+                continue
+            skip_indent = None
+
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+
+        if stripped.startswith('- ') or stripped == '-':
+            # Sequence items belong to the enclosing key's value
+            skip_indent, skip_sequence = indent, True
+            continue
+
+        match = _YAML_KEY.match(line)
+        if match is None:
+            continue
+        try:
+            key = yaml.safe_load(match.group(2))
+        except yaml.YAMLError:
+            continue
+        value_text, comment = _split_comment(match.group(3))
+        path = (stack[-1][1] if stack else ()) + (key,)
+        entries[path] = _YamlEntry(number, indent, value_text, comment)
+
+        if value_text[:1] in ('|', '>'):
+            skip_indent, skip_sequence = indent, False
+        elif not value_text or value_text.startswith('&'):
+            stack.append((indent, path))
+
+    # A key's value spans every deeper line, and a block sequence may sit at the key's own indent
+    for entry in entries.values():
+        for number in range(entry.line + 1, len(lines)):
+            stripped = lines[number].strip()
+            if not stripped or stripped.startswith('#'):
+                continue
+            indent = _indent_of(lines[number])
+            if indent > entry.indent or (indent == entry.indent and not entry.value_text
+                                         and (stripped.startswith('- ') or stripped == '-')):
+                entry.end = number + 1
+            else:
+                break
+    return entries
+
+
+def _flow(value: Any) -> str:
+    text = yaml.safe_dump(value, default_flow_style=True, allow_unicode=True, width=float('inf'))
+    text = text.strip()
+    if text.endswith('\n...'):
+        text = text[:-4].rstrip()
+    elif text.endswith('...'):
+        text = text[:-3].rstrip()
+    return text
+
+
+def _value_lines(value: Any, indent: int, newline: str) -> Tuple[str, List[str]]:
+    """Returns the inline text after 'key:' and the block lines that follow it."""
+    if isinstance(value, (dict, list)) and value:
+        block = yaml.safe_dump(value, default_flow_style=False, allow_unicode=True, sort_keys=False)
+        return '', [' ' * indent + line + newline for line in block.splitlines()]
+    return _flow(value), []
+
+
+def _flatten(data: Any, prefix: Tuple = ()) -> Dict[Tuple, Any]:
+    if isinstance(data, dict) and (data or not prefix):
+        flat = {}
+        for key, value in data.items():
+            flat.update(_flatten(value, prefix + (key,)))
+        return flat
+    return {prefix: data}
+
+
+def _load_yaml(text: str) -> Dict[Tuple, Any]:
+    try:
+        data = yaml.safe_load(text)
+    except yaml.YAMLError as e:
+        raise PatchError(f"not valid YAML: {e}")
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        raise PatchError("top level is not a mapping")
+    return _flatten(data)
+
+
+def _nest(path: Tuple, value: Any) -> Any:
+    for key in reversed(path):
+        value = {key: value}
+    return value
+
+
+def _set_yaml(lines: List[str], path: Tuple, value: Any, newline: str) -> List[str]:
+    entries = _yaml_entries(lines)
+    entry = entries.get(path)
+    if entry is not None:
+        line = lines[entry.line].rstrip('\r\n')
+        match = _YAML_KEY.match(line)
+        # Keep the indent of an existing block value
+        child_indent = entry.indent + 2
+        for number in range(entry.line + 1, entry.end):
+            if lines[number].strip() and not lines[number].lstrip().startswith('#'):
+                child_indent = _indent_of(lines[number])
+                break
+        inline, block = _value_lines(value, child_indent, newline)
+        head = line[:match.start(3)].rstrip()
+        new_line = f"{head} {inline}{entry.comment}" if inline else f"{head}{entry.comment}"
+        return lines[:entry.line] + [new_line + newline] + block + lines[entry.end:]
+
+    # Insert under the deepest ancestor that exists
+    for depth in range(len(path) - 1, -1, -1):
+        parent = entries.get(path[:depth]) if depth else None
+        if depth and parent is None:
+            continue
+        if parent is not None and parent.value_text:
+            raise PatchError(f"'{'.'.join(map(str, path[:depth]))}' is not a mapping")
+
+        children = [entry for key, entry in entries.items() if len(key) == depth + 1 and key[:depth] == path[:depth]]
+        if children:
+            indent = children[0].indent
+        else:
+            indent = parent.indent + 2 if parent is not None else 0
+        if parent is not None:
+            position = parent.end
+        else:
+            position = len(lines)
+            while position > 0 and not lines[position - 1].strip():
+                position -= 1
+        if position > 0 and not lines[position - 1].endswith(('\n', '\r')):
+            lines = lines[:position - 1] + [lines[position - 1] + newline] + lines[position:]
+
+        block = yaml.safe_dump(_nest(path[depth + 1:], value) if len(path) > depth + 1 else value,
+                               default_flow_style=False, allow_unicode=True, sort_keys=False)
+        key_text = _flow(path[depth])
+        if len(path) > depth + 1 or (isinstance(value, (dict, list)) and value):
+            new_lines = [' ' * indent + f"{key_text}:" + newline]
+            new_lines += [' ' * (indent + 2) + line + newline for line in block.splitlines()]
+        else:
+            new_lines = [' ' * indent + f"{key_text}: {_flow(value)}" + newline]
+        return lines[:position] + new_lines + lines[position:]
+    raise PatchError(f"no place to insert '{'.'.join(map(str, path))}'")
+
+
+def _delete_yaml(lines: List[str], path: Tuple) -> List[str]:
+    entry = _yaml_entries(lines).get(path)
+    if entry is None:
+        raise PatchError(f"'{'.'.join(map(str, path))}' not found")
+    return lines[:entry.line] + lines[entry.end:]
+
+
+def _patch_yaml(live_text: str, changes: List[Tuple[Tuple, Any]]) -> str:
+    newline = _newline(live_text)
+    lines = live_text.splitlines(keepends=True)
+    for path, value in changes:
+        if value is _MISSING:
+            lines = _delete_yaml(lines, path)
+        else:
+            lines = _set_yaml(lines, path, value, newline)
+    return ''.join(lines)
+
+
+# --- common -----------------------------------------------------------------
+
+def parse_keys(format: str, text: str) -> Dict[str, Any]:
+    """Flat key -> value map of a structured file, in the form kept in the instance state."""
+    if format == FORMAT_PROPERTIES:
+        return {key: value for key, (_, _, value) in _properties_entries(text).items()}
+    return {json.dumps(list(path), default=str): _normalize(value) for path, value in _load_yaml(text).items()}
+
+
+def patch_text(format: str, live_text: str, rendered_text: str,
+               base_keys: Optional[Dict[str, Any]]) -> Tuple[str, List[str], Dict[str, Any]]:
+    """Applies the template's key changes to the live file.
+
+    base_keys are the keys the template rendered last time. A key is
+    written when the template changed it since then (or always, without a
+    base) and the live value differs; keys dropped by the template are
+    removed only if the live value is still the old rendered one. Everything
+    else in the live file, comments and order included, is kept.
+
+    Returns (patched text, changed keys, rendered keys). Raises PatchError
+    when the file can't be patched safely.
+    """
+    rendered_keys = parse_keys(format, rendered_text)
+    live_keys = parse_keys(format, live_text)
+
+    changes: List[Tuple[str, Any]] = []
+    for key, value in rendered_keys.items():
+        if base_keys is not None and base_keys.get(key, _MISSING) == value:
+            continue  # unchanged in the template, keep whatever the live file says
+        if live_keys.get(key, _MISSING) != value:
+            changes.append((key, value))
+    for key, value in (base_keys or {}).items():
+        if key not in rendered_keys and live_keys.get(key, _MISSING) == value:
+            changes.append((key, _MISSING))
+
+    if not changes:
+        return live_text, [], rendered_keys
+
+    if format == FORMAT_PROPERTIES:
+        patched = _patch_properties(live_text, rendered_text, changes)
+    else:
+        patched = _patch_yaml(live_text, [(tuple(json.loads(key)), value) for key, value in changes])
+
+    # Never trust the line edits blindly: the result must hold exactly the intended values
+    patched_keys = parse_keys(format, patched)
+    for key, value in changes:
+        if patched_keys.get(key, _MISSING) != value:
+            raise PatchError(f"could not patch '{_display_key(format, key)}'")
+    return patched, [_display_key(format, key) for key, _ in changes], rendered_keys
@@ -1,66 +1,150 @@
-import hashlib
 import os
 import shutil
+import threading
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Set, Tuple
 
 from core.backup_manager import BackupManager
+from core.backup_retention import RetentionPolicy
+from core.backup_scrubber import BackupScrubber
+from core.copy_engine import CopyEngine, CopyStats
+from core.file_compare import FileComparator
+from core.file_transaction import FileTransaction
+from core.io_limiter import LimitedWriter, get_io_limiter
+from core.instance_discovery import discover_instances, get_search_paths
+from core.metrics import BYTES_WRITTEN, FILE_WRITE_SECONDS, FILES_PROCESSED
+from core.scheduler import JobScheduler, checkpoint
+from core.snapshot_store import CachedDelta, SnapshotStore
+from core.sparse_copy import copy_sparse, data_size
+from core.structured_patch import UPDATE_MODE_PATCH, PatchError, parse_keys, patch_format, patch_text
+from core.tracing import span
+from core.template_registry import TemplateRegistry
+from core.variable_index import VariableIndex
 from core.variable_substitution import VariableSubstitution
+from models.file_state import InstanceFileState, compute_variables_digest
+from models.ignore_rules import SECTION_BACKUP, SECTION_OVERWRITE, IgnoreMatcher, IgnoreRules
 from models.instance import ServerInstance
 from models.result import ProvisionResult, FileResult
 from models.template import Template
-from utils.config import ConfigManager
+from utils.config import ConfigManager, get_config_manager
+from utils.logger import get_logger
 
 
-def __file_to_md5(filepath) -> str:
-    hash_md5 = hashlib.md5()
-    with open(filepath, 'rb') as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
+@dataclass
+class _UpdatePlan:
+    pending: List[Tuple[str, Any, str]] = field(default_factory=list)  # (relative path, source stat, reason)
+    renames: List[Tuple[str, str]] = field(default_factory=list)
+    removals: List[str] = field(default_factory=list)
+    directories: List[str] = field(default_factory=list)
+    unchanged: List[FileResult] = field(default_factory=list)
+    # Instance paths the [overwrite] rules keep the update away from
+    protected: IgnoreMatcher = field(default_factory=IgnoreMatcher)
+    # Structured files updated key by key: relative path -> (patched content, changed keys)
+    patches: Dict[str, Tuple[bytes, List[str]]] = field(default_factory=dict)
+    # Rendered keys to remember for structured files, when patching is on
+    keys: Dict[str, Dict[str, Any]] = field(default_factory=dict)
 
-    return hash_md5.hexdigest()
-
-
-def _check_equals(src_filepath, dest_filepath):
-    return __file_to_md5(src_filepath) == __file_to_md5(dest_filepath)
+    def has_changes(self) -> bool:
+        return bool(self.pending or self.renames or self.removals)
 
 
 class TemplateManager:
 
-    def __init__(self, templates_dir: str = "templates"):
-        self.templates_dir = templates_dir
-        self.substitution = VariableSubstitution()
-        self.config_manager = ConfigManager()
+    def __init__(self, templates_dir: Optional[str] = None, config_manager: Optional[ConfigManager] = None):
+        self.config_manager = config_manager or get_config_manager()
         self.config = self.config_manager.get_config()
-        self.backup_manager = BackupManager(self.config.backup_dir, self.config.max_backups)
+        self.logger = get_logger()
+        # Without an explicit directory the manager follows templates_dir in the config
+        self._follows_templates_dir = templates_dir is None
+        self.templates_dir = templates_dir or self.config.templates_dir
+        self.substitution = VariableSubstitution()
+        self.backup_manager = self._create_backup_manager()
+        # Shared by front ends so interactive, bulk and background work are ordered in one place
+        self.scheduler = JobScheduler(self.config.scheduler_workers)
+        # Not started here; long-running front ends (GUI, agent) start it
+        self.backup_scrubber = BackupScrubber.from_config(self.backup_manager, self.config, self.scheduler)
+        self.comparator = FileComparator(self.config.hash_algorithm)
+        self.snapshot_store = SnapshotStore(self.templates_dir, self.comparator)
+        self.template_registry = TemplateRegistry(self.templates_dir)
+        self.copy_engine = CopyEngine(self.config.copy_workers or None)
+        self._variable_index: Optional[VariableIndex] = None
+        self._variable_index_lock = threading.Lock()
+        self.config_manager.add_listener(self.on_config_changed)
+
+    def on_config_changed(self, changed: Set[str]):
+        """Rebuilds only the parts that depend on the changed keys; render caches are always kept."""
+        if any(key == 'max_backups' or key.startswith('backup_') for key in changed):
+            self.backup_manager = self._create_backup_manager()
+        if any(key.startswith(('backup_', 'scrub_')) for key in changed):
+            was_running = self.backup_scrubber.is_running
+            self.backup_scrubber.stop()
+            self.backup_scrubber = BackupScrubber.from_config(self.backup_manager, self.config, self.scheduler)
+            if was_running and self.config.scrub_enabled:
+                self.backup_scrubber.start()
+        if 'hash_algorithm' in changed:
+            self.comparator = FileComparator(self.config.hash_algorithm)
+            self.snapshot_store = SnapshotStore(self.templates_dir, self.comparator)
+        if 'templates_dir' in changed and self._follows_templates_dir:
+            self.templates_dir = self.config.templates_dir
+            self.snapshot_store = SnapshotStore(self.templates_dir, self.comparator)
+            self.template_registry = TemplateRegistry(self.templates_dir)
+        if 'copy_workers' in changed:
+            self.copy_engine = CopyEngine(self.config.copy_workers or None)
+        if changed & {'instances_dir', 'default_output_dir', 'shared_port_variables'}:
+            # Rebuilt from the new search paths on next use
+            self._variable_index = None
+
+    def _create_backup_manager(self) -> BackupManager:
+        return BackupManager(self.config.backup_dir, self.config.max_backups,
+                             RetentionPolicy.from_config(self.config))
+
+    @property
+    def variable_index(self) -> VariableIndex:
+        """Fleet-wide index of variable values, built on first use and then kept up to date."""
+        with self._variable_index_lock:
+            if self._variable_index is None:
+                index = VariableIndex(self._port_variables, self.config.shared_port_variables)
+                index.build(discover_instances(get_search_paths(self.config))[0])
+                self._variable_index = index
+            return self._variable_index
+
+    def _port_variables(self, instance: ServerInstance) -> Set[str]:
+        try:
+            template = self.get_template_by_name(instance.template_name)
+        except ValueError:
+            # Template is gone, fall back to the naming convention
+            return {name for name in instance.variables if name.endswith('port')}
+        return {var.name for var in template.variables if var.type == 'port'}
+
+    def check_conflicts(self, template: Template, variables: Dict[str, Any], instance_path: Optional[str] = None,
+                        reserved: Optional[Dict[int, str]] = None) -> List[str]:
+        return self.variable_index.find_conflicts(template, variables, instance_path, reserved)
+
+    def register_instance(self, instance: ServerInstance):
+        """Adds a newly provisioned instance to the fleet indexes."""
+        if self._variable_index is not None:
+            self._variable_index.add_instance(instance)
+
+    def forget_instance(self, instance: ServerInstance):
+        """Drops a deleted instance from the fleet indexes."""
+        if self._variable_index is not None:
+            self._variable_index.remove_instance(instance.path)
 
     def discover_templates(self) -> List[Template]:
-        templates = []
-
-        if not os.path.exists(self.templates_dir):
-            os.makedirs(self.templates_dir)
-            return templates
-
-        for item in os.listdir(self.templates_dir):
-            template_path = os.path.join(self.templates_dir, item)
-            if os.path.isdir(template_path):
-                try:
-                    template = Template.from_directory(template_path)
-                    templates.append(template)
-                except Exception as e:
-                    print(f"Failed to load template from {template_path}: {e}")
-
-        return templates
+        return self.template_registry.refresh()
 
     def get_template_by_name(self, name: str) -> Template:
-        templates = self.discover_templates()
-        for template in templates:
-            if template.name == name:
-                return template
-        raise ValueError(f"Template '{name}' not found")
+        return self.template_registry.get(name)
 
     def create_instance(self, template: Template, instance_name: str,
                         output_dir: str, variables: Dict[str, Any]) -> ServerInstance:
+        with self.logger.operation("create_instance", instance=instance_name, template=template.name), \
+                span("create_instance", instance=instance_name):
+            return self._create_instance(template, instance_name, output_dir, variables)
+
+    def _create_instance(self, template: Template, instance_name: str,
+                         output_dir: str, variables: Dict[str, Any]) -> ServerInstance:
         instance_path = os.path.join(output_dir, instance_name)
 
         if os.path.exists(instance_path):
@@ -71,17 +155,27 @@ class TemplateManager:
 
         try:
             # Copy template files and substitute variables
-            self._copy_template_files(template, instance_path, variables)
+            file_state = InstanceFileState(
+                algorithm=self.comparator.algorithm,
+                variables_digest=compute_variables_digest(variables)
+            )
+            self._copy_template_files(template, instance_path, variables, file_state)
+            file_state.save(instance_path)
+
+            # Remember which template version the instance was provisioned from
+            self.snapshot_store.record(template)
 
             # Create instance metadata
             instance = ServerInstance(
                 name=instance_name,
                 template_name=template.name,
                 path=instance_path,
-                variables=variables
+                variables=variables,
+                template_version=template.version
             )
 
             instance.save_metadata()
+            self.register_instance(instance)
             return instance
 
         except Exception as e:
@@ -90,99 +184,283 @@ class TemplateManager:
                 shutil.rmtree(instance_path)
             raise e
 
-    def _copy_template_files(self, template: Template, instance_path: str, variables: Dict[str, Any]):
-        for root, dirs, files in os.walk(template.path):
-            # Skip template config files
-            if 'template.yml' in files:
-                files.remove('template.yml')
-            if 'template.yaml' in files:
-                files.remove('template.yaml')
-            
-            # Create directory structure
-            relative_root = os.path.relpath(root, template.path)
-            if relative_root != '.':
-                target_dir = os.path.join(instance_path, relative_root)
-                os.makedirs(target_dir, exist_ok=True)
-
-            # Copy and process files
-            for file in files:
-                src_file = os.path.join(root, file)
-                relative_path = os.path.relpath(src_file, template.path)
-                dest_file = os.path.join(instance_path, relative_path)
-
-                # Ensure destination directory exists
-                os.makedirs(os.path.dirname(dest_file), exist_ok=True)
-
-                # Process file content with variable substitution
-                self.substitution.process_file(src_file, dest_file, variables)
+    def _copy_template_files(self, template: Template, instance_path: str, variables: Dict[str, Any],
+                             file_state: InstanceFileState = None) -> CopyStats:
+        directories, files = template.walk_tree()
 
-    def update_instance_from_template(self, instance: ServerInstance, is_dry_run: bool = False) -> ProvisionResult:
-        template = self.get_template_by_name(instance.template_name)
+        # Create directory structure once, workers only write files
+        with span("create_directories"):
+            self.copy_engine.create_directories(instance_path, directories, files)
 
-        if self.config.auto_backup and not is_dry_run:
-            try:
-                backup_path = self.backup_manager.create_backup(
-                    instance,
-                    f"Auto backup before template update to {template.name} v{template.version}"
-                )
-                print(f"Backup created: {backup_path}")
-            except Exception as e:
-                print(f"Warning: Failed to create backup: {e}")
-
-        processed_files: List[FileResult] = []
-        for root, dirs, files in os.walk(template.path):
-            if 'template.yml' in files:
-                files.remove('template.yml')
-            if 'template.yaml' in files:
-                files.remove('template.yaml')
-
-            relative_root = os.path.relpath(root, template.path)
-            if relative_root != '.':
-                target_dir = os.path.join(instance.path, relative_root)
-                os.makedirs(target_dir, exist_ok=True)
-
-            for file in files:
-                src_file = os.path.join(root, file)
-                relative_path = os.path.relpath(src_file, template.path)
-                dest_file = os.path.join(instance.path, relative_path)
-
-                if os.path.exists(dest_file) and _check_equals(src_file, dest_file):
-                    processed_files.append(
-                        FileResult(
-                            path=dest_file,
-                            status="Unchanged",
-                            reason="same-hash",
-                            template=template.name,
-                            variables_used={}
-                        )
-                    )
-                    continue
-
-                if is_dry_run:
-                    processed_files.append(
-                        FileResult(
-                            path=dest_file,
-                            status="Skipped",
-                            reason="dry-run",
-                            template=template.name,
-                            variables_used={}
-                        )
-                    )
-                    continue
+        source_stats = {relative_path: template.source_stat(relative_path) for relative_path in files}
+
+        patching = self.patches_structured_files(template)
+
+        def copy_file(relative_path: str):
+            dest_file = os.path.join(instance_path, relative_path)
+            # Process file content with variable substitution
+            with span("materialize_file", file=relative_path):
+                self.materialize_file(template, relative_path, dest_file, variables)
+            if file_state is None:
+                return None
+            dest_stat = os.stat(dest_file)
+            keys = self.rendered_keys(relative_path, dest_file) if patching else None
+            return self.comparator.digest(dest_file, dest_stat), dest_stat, keys
 
-                self.substitution.process_file(src_file, dest_file, instance.variables)
+        results, stats = self.copy_engine.run(
+            [(relative_path, data_size(source_stats[relative_path])) for relative_path in files], copy_file
+        )
+
+        if file_state is not None:
+            for relative_path, (digest, dest_stat, keys) in results:
+                file_state.record(relative_path, digest, dest_stat, source_stats[relative_path], keys=keys)
+
+        self.logger.info(f"Materialized {template.name}: {stats.describe()}",
+                         duration_ms=round(stats.duration * 1000, 2))
+        return stats
+
+    def materialize_file(self, template: Template, relative_path: str, dest_file: str,
+                         variables: Dict[str, Any]):
+        if template.package is None:
+            self.substitution.process_file(os.path.join(template.path, relative_path), dest_file, variables)
+            return
+
+        entry = template.package.entries[relative_path]
+        file_ext = os.path.splitext(relative_path)[1].lower()
+        if not entry.placeholders and file_ext not in self.substitution.text_extensions:
+            # Binary members are streamed straight out of the package mapping
+            limiter = get_io_limiter()
+            wrap = None if limiter.unlimited else (lambda f: LimitedWriter(f, limiter, copy=True))
+            with FILE_WRITE_SECONDS.time():
+                template.package.extract_file(relative_path, dest_file, wrap)
+            FILES_PROCESSED.labels('copied').inc()
+            BYTES_WRITTEN.inc(entry.size)
+            return
+
+        self.substitution.process_data(template.package.read(relative_path), relative_path, dest_file,
+                                       variables, cache_key=f"{template.path}:{entry.hash}")
+
+    def preload_template(self, template: Template):
+        """Compiles the template's text files once, before several instances render them in parallel."""
+        for relative_path in template.walk_tree()[1]:
+            if os.path.splitext(relative_path)[1].lower() not in self.substitution.text_extensions:
+                continue
+            if template.package is None:
+                self.substitution.preload(os.path.join(template.path, relative_path))
+            else:
+                entry = template.package.entries[relative_path]
+                self.substitution.preload_data(template.package.read(relative_path), relative_path,
+                                               cache_key=f"{template.path}:{entry.hash}")
+
+    def render_source_bytes(self, template: Template, relative_path: str,
+                            variables: Dict[str, Any]) -> Optional[bytes]:
+        """Returns what materialize_file would write for a text file, or None for verbatim copies."""
+        if template.package is None:
+            return self.substitution.render_bytes(os.path.join(template.path, relative_path), variables)
+
+        entry = template.package.entries[relative_path]
+        text = self.substitution.render_data(template.package.read(relative_path), relative_path,
+                                             variables, cache_key=f"{template.path}:{entry.hash}")
+        return None if text is None else self.substitution.encode_text(text)
+
+    def referenced_variables(self, template: Template, relative_path: str) -> Set[str]:
+        """Variables the template file renders with, so callers know which files a variable change touches."""
+        if template.package is None:
+            return self.substitution.referenced_variables(os.path.join(template.path, relative_path))
+
+        entry = template.package.entries[relative_path]
+        return self.substitution.referenced_variables_data(template.package.read(relative_path), relative_path,
+                                                           cache_key=f"{template.path}:{entry.hash}")
+
+    def source_equals(self, template: Template, relative_path: str, src_stat,
+                      dest_file: str, dest_stat: os.stat_result) -> bool:
+        if src_stat.st_size != dest_stat.st_size:
+            return False
+        src_hash = self.comparator.source_digest(template, relative_path, src_stat)
+        return src_hash == self.comparator.digest(dest_file, dest_stat)
+
+    def update_instance_from_template(self, instance: ServerInstance, is_dry_run: bool = False) -> ProvisionResult:
+        with self.logger.operation("update_instance", instance=instance.name, dry_run=is_dry_run), \
+                span("update_instance", instance=instance.name):
+            return self._update_instance_from_template(instance, is_dry_run)
+
+    def _update_instance_from_template(self, instance: ServerInstance, is_dry_run: bool) -> ProvisionResult:
+        with span("load_template"):
+            template = self.get_template_by_name(instance.template_name)
+        file_state = InstanceFileState.load_from_path(instance.path)
+        if file_state.algorithm != self.comparator.algorithm:
+            # Hashes recorded with another algorithm can't be compared, start over
+            file_state = InstanceFileState(algorithm=self.comparator.algorithm)
+        variables_digest = compute_variables_digest(instance.variables)
+        variables_changed = file_state.variables_digest != variables_digest
+
+        # Decide what needs to be written before touching the instance
+        plan = _UpdatePlan(protected=self.ignore_rules(instance, template).matcher(SECTION_OVERWRITE))
+        with span("plan_update"):
+            delta = None if variables_changed else self._get_template_delta(template, instance)
+            if delta is not None:
+                self._plan_delta_update(plan, template, instance, file_state, delta)
+            else:
+                self._plan_full_update(plan, template, instance, file_state, variables_changed)
+            if self.patches_structured_files(template):
+                self._plan_patches(plan, template, instance, file_state)
+
+        processed_files = plan.unchanged
+        FILES_PROCESSED.labels('unchanged').inc(len(plan.unchanged))
+
+        if is_dry_run:
+            planned_paths = [relative_path for relative_path, _, _ in plan.pending]
+            planned_paths += [new_path for _, new_path in plan.renames]
+            planned_paths += [old_path for old_path, _ in plan.renames] + plan.removals
+            for relative_path in planned_paths:
                 processed_files.append(
                     FileResult(
-                        path=dest_file,
-                        status="Replaced",
-                        reason="success",
+                        path=os.path.join(instance.path, relative_path),
+                        status="Skipped",
+                        reason="dry-run",
                         template=template.name,
                         variables_used={}
                     )
                 )
 
+            return ProvisionResult(
+                template=template,
+                is_dry_run=is_dry_run,
+                processed_files=processed_files,
+            )
+
+        # The manifest is (re)checked when the version moves, when it is missing and when a
+        # source changed under the instance's version, which may mean an edit without a bump
+        # The manifest is (re)checked when it is missing, and after a full update that moved the
+        # version or saw a source change under the same version, which may be an edit without a
+        # bump. Delta updates already captured the tree once for the whole rollout.
+        record_snapshot = not self.snapshot_store.exists(template) or (delta is None and (
+            instance.template_version != template.version
+            or any(reason == "template-changed" for _, _, reason in plan.pending)))
+        if not (plan.has_changes() or plan.directories or file_state.changed or variables_changed
+                or record_snapshot):
+            # Nothing to write: leave the state file and metadata alone
+            return ProvisionResult(
+                template=template,
+                is_dry_run=is_dry_run,
+                processed_files=processed_files,
+            )
+
+        if plan.has_changes() and self.config.auto_backup:
+            try:
+                with span("auto_backup"):
+                    self.backup_manager.create_backup(
+                        instance,
+                        f"Auto backup before template update to {template.name} v{template.version}",
+                        ignore=self.ignore_rules(instance, template).matcher(SECTION_BACKUP)
+                    )
+            except Exception as e:
+                self.logger.warning(f"Failed to create backup: {e}")
+
+        # Render into a staging area and swap everything in at the end
+        digests: Dict[str, str] = {}
+        transaction = FileTransaction(instance.path)
+        try:
+            for relative_path in plan.directories:
+                transaction.add_directory(relative_path)
+
+            for relative_path, src_stat, reason in plan.pending:
+                checkpoint()
+                staged_file = transaction.stage(relative_path)
+                with span("materialize_file", file=relative_path):
+                    patch = plan.patches.get(relative_path)
+                    if patch is not None:
+                        self.substitution.write_patched(staged_file, patch[0])
+                        shutil.copymode(os.path.join(instance.path, relative_path), staged_file)
+                    else:
+                        self.materialize_file(template, relative_path, staged_file, instance.variables)
+                        if self.patches_structured_files(template):
+                            plan.keys[relative_path] = self.rendered_keys(relative_path, staged_file)
+                digests[relative_path] = self.comparator.digest(staged_file)
+
+            for old_path, new_path in plan.renames:
+                staged_file = transaction.stage(new_path)
+                old_file = os.path.join(instance.path, old_path)
+                try:
+                    os.link(old_file, staged_file)
+                except OSError:
+                    copy_sparse(old_file, staged_file)
+                transaction.remove(old_path)
+
+            for relative_path in plan.removals:
+                transaction.remove(relative_path)
+
+            with span("commit"):
+                transaction.commit()
+        except Exception:
+            transaction.abort()
+            raise
+
+        for relative_path, src_stat, reason in plan.pending:
+            dest_file = os.path.join(instance.path, relative_path)
+            file_state.record(relative_path, digests[relative_path], os.stat(dest_file), src_stat,
+                              keys=plan.keys.get(relative_path))
+            if relative_path in plan.patches:
+                reason = "keys-patched"
+                self.logger.info(f"Patched {', '.join(plan.patches[relative_path][1])}",
+                                 file=relative_path)
+            self.logger.debug("File replaced", file=relative_path, reason=reason)
+            processed_files.append(
+                FileResult(
+                    path=dest_file,
+                    status="Replaced",
+                    reason=reason,
+                    template=template.name,
+                    variables_used={}
+                )
+            )
+
+        for old_path, new_path in plan.renames:
+            dest_file = os.path.join(instance.path, new_path)
+            old_state = file_state.files.pop(old_path)
+            file_state.record(new_path, old_state.hash, os.stat(dest_file), template.source_stat(new_path),
+                              keys=old_state.keys)
+            processed_files.append(
+                FileResult(
+                    path=dest_file,
+                    status="Replaced",
+                    reason="template-renamed",
+                    template=template.name,
+                    variables_used={}
+                )
+            )
+            processed_files.append(
+                FileResult(
+                    path=os.path.join(instance.path, old_path),
+                    status="Deleted",
+                    reason="template-renamed",
+                    template=template.name,
+                    variables_used={}
+                )
+            )
+
+        for relative_path in plan.removals:
+            file_state.files.pop(relative_path, None)
+            processed_files.append(
+                FileResult(
+                    path=os.path.join(instance.path, relative_path),
+                    status="Deleted",
+                    reason="template-removed",
+                    template=template.name,
+                    variables_used={}
+                )
+            )
+
+        file_state.variables_digest = variables_digest
+        file_state.save(instance.path)
+
+        if record_snapshot:
+            self.snapshot_store.record(template)
+        instance.template_version = template.version
         instance.updated_at = datetime.now()
         instance.save_metadata()
+        if self._variable_index is not None:
+            self._variable_index.update_instance(instance)
 
         return ProvisionResult(
             template=template,
@@ -190,6 +468,240 @@ class TemplateManager:
             processed_files=processed_files,
         )
 
+    def _get_template_delta(self, template: Template, instance: ServerInstance) -> Optional[CachedDelta]:
+        """Returns the files that changed since the instance's template version, or None for a full update."""
+        if not instance.template_version or instance.template_version == template.version:
+            return None
+        return self.snapshot_store.delta(template, instance.template_version)
+
+    def _plan_full_update(self, plan: '_UpdatePlan', template: Template, instance: ServerInstance,
+                          file_state: InstanceFileState, variables_changed: bool):
+        directories, files = template.walk_tree()
+        self._plan_directories(plan, instance, directories)
+
+        for relative_path in files:
+            if plan.protected.matches(relative_path):
+                self._skip_protected(plan, template, instance, relative_path)
+                continue
+            dest_file = os.path.join(instance.path, relative_path)
+            src_stat = template.source_stat(relative_path)
+
+            changed, reason = self._classify_file(
+                file_state, template, relative_path, src_stat, dest_file, variables_changed
+            )
+            if changed:
+                plan.pending.append((relative_path, src_stat, reason))
+            else:
+                plan.unchanged.append(
+                    FileResult(
+                        path=dest_file,
+                        status="Unchanged",
+                        reason=reason,
+                        template=template.name,
+                        variables_used={}
+                    )
+                )
+
+    def _plan_directories(self, plan: '_UpdatePlan', instance: ServerInstance, directories: List[str]):
+        """Template directories the instance lacks, empty ones included."""
+        plan.directories.extend(directory for directory in directories
+                                if not plan.protected.matches(directory, is_dir=True)
+                                and not os.path.isdir(os.path.join(instance.path, directory)))
+
+    def _plan_delta_update(self, plan: '_UpdatePlan', template: Template, instance: ServerInstance,
+                           file_state: InstanceFileState, cached: CachedDelta):
+        # The manifest only lists files, so directories come from the tree the delta was computed on
+        self._plan_directories(plan, instance, cached.directories)
+        delta = cached.delta
+
+        for relative_path in delta.changed + delta.added:
+            if plan.protected.matches(relative_path):
+                self._skip_protected(plan, template, instance, relative_path)
+                continue
+            reason = "template-changed" if relative_path in delta.changed else "template-added"
+            plan.pending.append((relative_path, template.source_stat(relative_path), reason))
+
+        for old_path, new_path in delta.renamed:
+            if plan.protected.matches(new_path):
+                self._skip_protected(plan, template, instance, new_path)
+                continue
+            if plan.protected.matches(old_path):
+                # The old file stays where it is, the new path still gets its copy
+                plan.pending.append((new_path, template.source_stat(new_path), "template-renamed"))
+                continue
+            if self._is_unmodified(file_state, instance, old_path):
+                plan.renames.append((old_path, new_path))
+                continue
+
+            # The old copy was edited locally, so render a fresh one and leave the old file alone
+            plan.pending.append((new_path, template.source_stat(new_path), "template-renamed"))
+            self._skip_local_edit(plan, template, instance, old_path)
+
+        for relative_path in delta.removed:
+            if plan.protected.matches(relative_path):
+                continue
+            if self._is_unmodified(file_state, instance, relative_path):
+                plan.removals.append(relative_path)
+            elif os.path.exists(os.path.join(instance.path, relative_path)):
+                self._skip_local_edit(plan, template, instance, relative_path)
+
+        # Everything outside the delta is untouched by definition
+        touched = delta.touched_paths()
+        for relative_path in cached.files:
+            if relative_path not in touched:
+                plan.unchanged.append(
+                    FileResult(
+                        path=os.path.join(instance.path, relative_path),
+                        status="Unchanged",
+                        reason="not-in-delta",
+                        template=template.name,
+                        variables_used={}
+                    )
+                )
+
+    def _is_unmodified(self, file_state: InstanceFileState, instance: ServerInstance, relative_path: str) -> bool:
+        state = file_state.files.get(relative_path)
+        if state is None:
+            return False
+        try:
+            return state.matches_stat(os.stat(os.path.join(instance.path, relative_path)))
+        except FileNotFoundError:
+            return False
+
+    def _skip_local_edit(self, plan: '_UpdatePlan', template: Template, instance: ServerInstance,
+                         relative_path: str):
+        plan.unchanged.append(
+            FileResult(
+                path=os.path.join(instance.path, relative_path),
+                status="Skipped",
+                reason="local-edit",
+                template=template.name,
+                variables_used={}
+            )
+        )
+
+    def patches_structured_files(self, template: Template) -> bool:
+        return (template.update_mode or self.config.update_mode) == UPDATE_MODE_PATCH
+
+    @staticmethod
+    def rendered_keys(relative_path: str, path: str) -> Optional[Dict[str, Any]]:
+        format = patch_format(relative_path)
+        if format is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return parse_keys(format, f.read().decode('utf-8'))
+        except (PatchError, UnicodeDecodeError):
+            return None
+
+    def _plan_patches(self, plan: '_UpdatePlan', template: Template, instance: ServerInstance,
+                      file_state: InstanceFileState):
+        """Turns pending rewrites of structured files into key-level patches of the live file.
+
+        Files where no key needs to change are dropped from the plan. Files
+        that can't be patched safely stay whole-file rewrites.
+        """
+        pending = []
+        for relative_path, src_stat, reason in plan.pending:
+            format = patch_format(relative_path)
+            dest_file = os.path.join(instance.path, relative_path)
+            if format is None or not os.path.exists(dest_file):
+                pending.append((relative_path, src_stat, reason))
+                continue
+
+            state = file_state.files.get(relative_path)
+            try:
+                rendered = self.render_source_bytes(template, relative_path, instance.variables)
+                if rendered is None:
+                    raise PatchError("not a text file")
+                with open(dest_file, 'rb') as f:
+                    live_text = f.read().decode('utf-8')
+                patched, changed_keys, rendered_keys = patch_text(
+                    format, live_text, rendered.decode('utf-8'), state.keys if state else None
+                )
+            except (PatchError, UnicodeDecodeError) as e:
+                self.logger.debug(f"Rewriting whole file: {e}", file=relative_path, reason=reason)
+                pending.append((relative_path, src_stat, reason))
+                continue
+
+            plan.keys[relative_path] = rendered_keys
+            if changed_keys:
+                plan.patches[relative_path] = (patched.encode('utf-8'), changed_keys)
+                pending.append((relative_path, src_stat, reason))
+                continue
+
+            # Every key already has the wanted value, remember that instead of writing
+            dest_stat = os.stat(dest_file)
+            file_state.record(relative_path, self.comparator.digest(dest_file, dest_stat), dest_stat,
+                              src_stat, keys=rendered_keys)
+            plan.unchanged.append(
+                FileResult(
+                    path=dest_file,
+                    status="Unchanged",
+                    reason="keys-unchanged",
+                    template=template.name,
+                    variables_used={}
+                )
+            )
+        plan.pending = pending
+
+    def _skip_protected(self, plan: '_UpdatePlan', template: Template, instance: ServerInstance,
+                        relative_path: str):
+        plan.unchanged.append(
+            FileResult(
+                path=os.path.join(instance.path, relative_path),
+                status="Skipped",
+                reason="ignored",
+                template=template.name,
+                variables_used={}
+            )
+        )
+
+    def ignore_rules(self, instance: ServerInstance, template: Optional[Template] = None) -> IgnoreRules:
+        """The template's .dotworkignore rules followed by the instance's own, which can override them."""
+        if template is None:
+            try:
+                template = self.get_template_by_name(instance.template_name)
+            except ValueError:
+                template = None
+        instance_rules = IgnoreRules.load(instance.path)
+        if template is None:
+            return instance_rules
+        return template.ignore_rules.extend(instance_rules)
+
+    def _classify_file(self, file_state: InstanceFileState, template: Template, relative_path: str,
+                       src_stat, dest_file: str, variables_changed: bool) -> Tuple[bool, str]:
+        """Returns whether the destination needs to be rewritten and why."""
+        try:
+            dest_stat = os.stat(dest_file)
+        except FileNotFoundError:
+            return True, "missing"
+
+        state = file_state.files.get(relative_path)
+        if state is None:
+            # Nothing recorded yet, fall back to comparing contents
+            if self.source_equals(template, relative_path, src_stat, dest_file, dest_stat):
+                src_hash = self.comparator.source_digest(template, relative_path, src_stat)
+                file_state.record(relative_path, src_hash, dest_stat, src_stat)
+                return False, "same-hash"
+            return True, "content-changed"
+
+        if variables_changed:
+            return True, "variables-changed"
+        if not state.matches_source(src_stat):
+            return True, "template-changed"
+        if state.matches_stat(dest_stat):
+            return False, "same-state"
+
+        # The destination was touched since we wrote it; only its content matters
+        if dest_stat.st_size != state.size:
+            return True, "local-edit"
+        dest_hash = self.comparator.digest(dest_file, dest_stat)
+        if dest_hash == state.hash:
+            file_state.record(relative_path, dest_hash, dest_stat, src_stat, keys=state.keys)
+            return False, "same-hash"
+        return True, "local-edit"
+
     def validate_variables(self, template: Template, variables: Dict[str, Any]) -> List[str]:
         errors = []
 
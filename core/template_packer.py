@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+from typing import Optional
+
+from core.file_compare import DEFAULT_ALGORITHM
+from core.variable_substitution import VariableSubstitution
+from models.ignore_rules import IGNORE_FILE
+from models.template import Template
+from models.template_package import PACKAGE_HEADER, PACKAGE_MAGIC
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def _read_ignore_text(template_path: str) -> str:
+    try:
+        with open(os.path.join(template_path, IGNORE_FILE), 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return ''
+
+
+def pack_template(template_path: str, output_path: str, algorithm: str = DEFAULT_ALGORITHM,
+                  substitution: Optional[VariableSubstitution] = None) -> str:
+    """Writes a template directory into a single indexed package file."""
+    template = Template.from_directory(template_path)
+    substitution = substitution or VariableSubstitution()
+    directories, files = template.walk_tree()
+
+    entries = []
+    temp_path = output_path + '.tmp'
+    try:
+        with open(temp_path, 'wb') as out:
+            # Reserve the header, it is filled in once the index position is known
+            out.write(b'\0' * PACKAGE_HEADER.size)
+
+            for relative_path in sorted(files):
+                src_file = os.path.join(template_path, relative_path)
+                stat = os.stat(src_file)
+                hasher = hashlib.new(algorithm)
+                offset = out.tell()
+
+                with open(src_file, 'rb') as f:
+                    for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+                        hasher.update(chunk)
+                        out.write(chunk)
+
+                file_ext = os.path.splitext(relative_path)[1].lower()
+                placeholders = (file_ext in substitution.text_extensions
+                                and bool(substitution.find_placeholders_in_file(src_file)))
+
+                entries.append({
+                    'path': relative_path.replace(os.sep, '/'),
+                    'offset': offset,
+                    'size': out.tell() - offset,
+                    'hash': hasher.hexdigest(),
+                    'placeholders': placeholders,
+                    'mode': stat.st_mode,
+                    'mtime_ns': stat.st_mtime_ns
+                })
+
+            index = json.dumps({
+                'template': Template.read_config(template_path) or {},
+                'ignore': _read_ignore_text(template_path),
+                'algorithm': algorithm,
+                'directories': [directory.replace(os.sep, '/') for directory in sorted(directories)],
+                'entries': entries
+            }, ensure_ascii=False, default=str).encode('utf-8')
+
+            index_offset = out.tell()
+            out.write(index)
+            out.seek(0)
+            out.write(PACKAGE_HEADER.pack(PACKAGE_MAGIC, index_offset, len(index)))
+            out.flush()
+            os.fsync(out.fileno())
+
+        os.replace(temp_path, output_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return output_path
@@ -0,0 +1,147 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+
+from core.metrics import record_cache
+from core.tracing import span
+from models.ignore_rules import IGNORE_FILE
+from models.template import Template
+from models.template_package import PACKAGE_EXTENSION
+from utils.logger import get_logger
+
+# (path of the file that defines the template, size, mtime_ns), None if there is none
+FileSignature = Optional[Tuple[str, int, int]]
+# A package's file signature, or a directory's config and ignore file signatures
+Signature = Union[FileSignature, Tuple[FileSignature, FileSignature]]
+
+
+def _file_signature(path: str) -> FileSignature:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return path, stat.st_size, stat.st_mtime_ns
+
+
+def template_signature(template_path: str) -> Signature:
+    """Identifies the on-disk definition of a template so edits can be noticed with a stat."""
+    if template_path.endswith(PACKAGE_EXTENSION):
+        return _file_signature(template_path)
+    ignore_signature = _file_signature(os.path.join(template_path, IGNORE_FILE))
+    for config_name in ("template.yml", "template.yaml"):
+        signature = _file_signature(os.path.join(template_path, config_name))
+        if signature is not None:
+            return signature, ignore_signature
+    return None, ignore_signature
+
+
+def _load_template(template_path: str) -> Template:
+    if template_path.endswith(PACKAGE_EXTENSION):
+        return Template.from_package(template_path)
+    return Template.from_directory(template_path)
+
+
+class TemplateRegistry:
+    """In-memory index of the templates in templates_dir.
+
+    Templates are parsed once and kept until the template.yml or .dotworkignore
+    (or the packed file) they came from changes size or mtime. Name lookups
+    are dictionary hits that only re-stat the one template's definition.
+    """
+
+    def __init__(self, templates_dir: str, max_workers: Optional[int] = None):
+        self.templates_dir = templates_dir
+        self.max_workers = max_workers or min(8, (os.cpu_count() or 1) + 2)
+        self._lock = threading.RLock()
+        # template path -> (signature, template)
+        self._entries: Dict[str, Tuple[Signature, Template]] = {}
+        self._by_name: Dict[str, str] = {}
+        self._loaded = False
+        self.logger = get_logger()
+
+    def _evict(self, path: str):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            # Packed templates keep their file mapped until closed
+            entry[1].close()
+
+    def _clear(self):
+        for path in list(self._entries):
+            self._evict(path)
+        self._by_name.clear()
+
+    def _list_template_paths(self) -> List[str]:
+        paths = []
+        for item in os.listdir(self.templates_dir):
+            if item.startswith('.'):
+                # Internal directories such as template snapshots
+                continue
+            template_path = os.path.join(self.templates_dir, item)
+            if os.path.isdir(template_path) or item.endswith(PACKAGE_EXTENSION):
+                paths.append(template_path)
+        return paths
+
+    def refresh(self) -> List[Template]:
+        """Rescans templates_dir, reparsing only templates whose definition changed."""
+        with self._lock, span("discover_templates"):
+            if not os.path.exists(self.templates_dir):
+                os.makedirs(self.templates_dir)
+                self._clear()
+                self._loaded = True
+                return []
+
+            paths = self._list_template_paths()
+            signatures = {path: template_signature(path) for path in paths}
+            stale = [path for path in paths
+                     if path not in self._entries or self._entries[path][0] != signatures[path]]
+
+            if stale:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(stale))) as executor:
+                    futures = {path: executor.submit(_load_template, path) for path in stale}
+                for path, future in futures.items():
+                    self._evict(path)
+                    try:
+                        self._entries[path] = (signatures[path], future.result())
+                    except Exception as e:
+                        self.logger.error(f"Failed to load template from {path}: {e}", file=path)
+
+            for path in set(self._entries) - set(paths):
+                self._evict(path)
+
+            self._by_name.clear()
+            templates = []
+            for path in paths:
+                if path in self._entries:
+                    template = self._entries[path][1]
+                    # The first template with a name wins, as discovery always did
+                    self._by_name.setdefault(template.name, path)
+                    templates.append(template)
+
+            self._loaded = True
+            return templates
+
+    def get(self, name: str) -> Template:
+        with self._lock:
+            if not self._loaded:
+                self.refresh()
+
+            path = self._by_name.get(name)
+            if path is not None:
+                signature, template = self._entries[path]
+                if template_signature(path) == signature:
+                    record_cache('template_registry', True)
+                    return template
+            record_cache('template_registry', False)
+
+            # Unknown name or edited definition: the template may have been added, renamed or removed
+            self.refresh()
+            path = self._by_name.get(name)
+            if path is None:
+                raise ValueError(f"Template '{name}' not found")
+            return self._entries[path][1]
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+            self._loaded = False
@@ -0,0 +1,156 @@
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from models.instance import ServerInstance
+from models.template import Template
+
+MIN_PORT = 1
+MAX_PORT = 65535
+
+# Resolves the names of an instance's port-typed variables
+PortVariableResolver = Callable[[ServerInstance], Set[str]]
+
+
+def _as_port(value: Any) -> Optional[int]:
+    try:
+        port = int(value)
+    except (TypeError, ValueError):
+        return None
+    return port if MIN_PORT <= port <= MAX_PORT else None
+
+
+def _instance_key(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path))
+
+
+class VariableIndex:
+    """Index of variable values across the fleet, kept current as instances come and go.
+
+    Ports are indexed by number, so checking a port or finding the next free
+    one never rescans instance metadata. Variables named in shared_variables
+    (e.g. the port of a database every server connects to) are indexed by
+    value but never reported as port conflicts.
+    """
+
+    def __init__(self, resolve_port_variables: PortVariableResolver, shared_variables: Iterable[str] = ()):
+        self.resolve_port_variables = resolve_port_variables
+        self.shared_variables = set(shared_variables)
+        self._lock = threading.RLock()
+        # instance key -> (instance name, variables)
+        self._instances: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        # instance key -> ports it holds
+        self._instance_ports: Dict[str, Dict[str, int]] = {}
+        # port -> {(instance key, variable name)}
+        self._ports: Dict[int, Set[Tuple[str, str]]] = {}
+        # (variable name, value) -> {instance key}
+        self._values: Dict[Tuple[str, str], Set[str]] = {}
+
+    def build(self, instances: Iterable[ServerInstance]):
+        with self._lock:
+            self._instances.clear()
+            self._instance_ports.clear()
+            self._ports.clear()
+            self._values.clear()
+            for instance in instances:
+                self.add_instance(instance)
+
+    def add_instance(self, instance: ServerInstance):
+        key = _instance_key(instance.path)
+        port_variables = self.resolve_port_variables(instance)
+        with self._lock:
+            self._remove(key)
+            self._instances[key] = (instance.name, dict(instance.variables))
+            for name, value in instance.variables.items():
+                self._values.setdefault((name, str(value)), set()).add(key)
+
+            ports = {}
+            for name in port_variables - self.shared_variables:
+                port = _as_port(instance.variables.get(name))
+                if port is not None:
+                    ports[name] = port
+                    self._ports.setdefault(port, set()).add((key, name))
+            self._instance_ports[key] = ports
+
+    def update_instance(self, instance: ServerInstance):
+        self.add_instance(instance)
+
+    def remove_instance(self, instance_path: str):
+        with self._lock:
+            self._remove(_instance_key(instance_path))
+
+    def _remove(self, key: str):
+        entry = self._instances.pop(key, None)
+        if entry is None:
+            return
+        for name, value in entry[1].items():
+            holders = self._values.get((name, str(value)))
+            if holders is not None:
+                holders.discard(key)
+                if not holders:
+                    del self._values[(name, str(value))]
+        for name, port in self._instance_ports.pop(key, {}).items():
+            holders = self._ports.get(port)
+            if holders is not None:
+                holders.discard((key, name))
+                if not holders:
+                    del self._ports[port]
+
+    def port_owners(self, port: int, exclude_path: Optional[str] = None) -> List[str]:
+        """Returns 'instance.variable' for every other instance holding the port."""
+        exclude = _instance_key(exclude_path) if exclude_path else None
+        with self._lock:
+            return sorted(f"{self._instances[key][0]}.{name}"
+                          for key, name in self._ports.get(port, ()) if key != exclude)
+
+    def is_port_used(self, port: int, exclude_path: Optional[str] = None) -> bool:
+        return bool(self.port_owners(port, exclude_path))
+
+    def used_ports(self) -> Dict[int, List[str]]:
+        with self._lock:
+            return {port: sorted(f"{self._instances[key][0]}.{name}" for key, name in holders)
+                    for port, holders in sorted(self._ports.items())}
+
+    def instances_with(self, name: str, value: Any) -> List[str]:
+        """Names of instances whose variable has the given value."""
+        with self._lock:
+            return sorted(self._instances[key][0] for key in self._values.get((name, str(value)), ()))
+
+    def next_free_port(self, start: int, reserved: Iterable[int] = ()) -> int:
+        reserved = set(reserved)
+        with self._lock:
+            for port in range(max(start, MIN_PORT), MAX_PORT + 1):
+                if port not in self._ports and port not in reserved:
+                    return port
+        raise ValueError(f"No free port at or above {start}")
+
+    def find_conflicts(self, template: Template, variables: Dict[str, Any],
+                       instance_path: Optional[str] = None, reserved: Optional[Dict[int, str]] = None) -> List[str]:
+        """Port conflicts of the given variables with the fleet, and with ports reserved by the caller.
+
+        ``reserved`` maps ports to a description of their holder, e.g. other
+        rows of a batch that are not instances yet; claimed ports are added to it.
+        """
+        errors = []
+        own_ports: Dict[int, str] = {}
+        for var in template.variables:
+            if var.type != 'port' or var.name in self.shared_variables:
+                continue
+            port = _as_port(variables.get(var.name))
+            if port is None:
+                continue
+
+            holders = self.port_owners(port, instance_path)
+            if port in own_ports:
+                holders.append(f"this instance's {own_ports[port]}")
+            if reserved is not None and port in reserved:
+                holders.append(reserved[port])
+            if holders:
+                errors.append(f"Port {port} ('{var.name}') is already used by {', '.join(holders)}")
+            own_ports[port] = var.name
+
+        if reserved is not None:
+            name = os.path.basename(instance_path) if instance_path else "new instance"
+            for port, var_name in own_ports.items():
+                reserved.setdefault(port, f"{name}.{var_name}")
+        return errors
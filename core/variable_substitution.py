@@ -1,49 +1,198 @@
 import os
 import re
-import shutil
-from typing import Dict, Any
-from jinja2 import Environment, FileSystemLoader, Template as JinjaTemplate
+import threading
+from typing import Dict, Any, Optional, Set, Tuple
+from jinja2 import Environment, FileSystemLoader, Template as JinjaTemplate, meta
+
+from core.io_limiter import get_io_limiter
+from core.metrics import BYTES_WRITTEN, FILE_RENDER_SECONDS, FILE_WRITE_SECONDS, FILES_PROCESSED, record_cache
+from core.sparse_copy import copy_sparse
+from core.tracing import span
+from models.ignore_rules import SECTION_SCAN, IgnoreMatcher, IgnoreRules
+from utils.logger import get_logger
 
 class VariableSubstitution:
     def __init__(self):
+        self.logger = get_logger()
         self.placeholder_pattern = re.compile(r'\{\{\s*(\w+)\s*\}\}')
         self.jinja_env = Environment(
             loader=FileSystemLoader('.'),
             autoescape=False
         )
 
+        # Source text and compiled template per file, keyed by stat
+        self._source_cache: Dict[str, Tuple[int, int, str, Optional[JinjaTemplate]]] = {}
+        self._data_cache: Dict[str, Tuple[str, Optional[JinjaTemplate]]] = {}
+        self._cache_lock = threading.Lock()
+
         self.text_extensions = {
             '.txt', '.yml', '.yaml', '.json', '.properties', '.conf', '.cfg', 
             '.sh', '.bat', '.cmd', '.ps1', '.xml', '.html', '.css', '.js', 
             '.py', '.java', '.cpp', '.c', '.h', '.md', '.ini', '.toml'
         }
     
-    def process_file(self, source_path: str, dest_path: str, variables: Dict[str, Any]):
+    def _load_source(self, source_path: str) -> Tuple[str, Optional[JinjaTemplate]]:
+        stat = os.stat(source_path)
+        with self._cache_lock:
+            cached = self._source_cache.get(source_path)
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            record_cache('template_source', True)
+            return cached[2], cached[3]
+        record_cache('template_source', False)
+
+        get_io_limiter().read(stat.st_size)
+        with open(source_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        compiled = None
+        if self.placeholder_pattern.search(content):
+            with span("jinja_compile", file=source_path):
+                compiled = self.jinja_env.from_string(content)
+
+        with self._cache_lock:
+            self._source_cache[source_path] = (stat.st_size, stat.st_mtime_ns, content, compiled)
+        return content, compiled
+
+    def _load_data(self, data: bytes, relative_path: str,
+                   cache_key: Optional[str]) -> Tuple[str, Optional[JinjaTemplate]]:
+        with self._cache_lock:
+            cached = self._data_cache.get(cache_key) if cache_key else None
+        if cache_key:
+            record_cache('template_data', cached is not None)
+        if cached is not None:
+            return cached
+
+        content = data.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+        compiled = None
+        if self.placeholder_pattern.search(content):
+            with span("jinja_compile", file=relative_path):
+                compiled = self.jinja_env.from_string(content)
+        if cache_key:
+            with self._cache_lock:
+                self._data_cache[cache_key] = (content, compiled)
+        return content, compiled
+
+    def preload(self, source_path: str):
+        """Reads and compiles a template file ahead of use, so parallel renders share one compile."""
+        try:
+            self._load_source(source_path)
+        except Exception:
+            # render_text reports the error when the file is actually used
+            pass
+
+    def preload_data(self, data: bytes, relative_path: str, cache_key: str):
+        try:
+            self._load_data(data, relative_path, cache_key)
+        except Exception:
+            pass
+
+    def render_text(self, source_path: str, variables: Dict[str, Any]) -> Optional[str]:
+        """Returns the rendered text of a template file, or None if it is copied verbatim."""
         file_ext = os.path.splitext(source_path)[1].lower()
-        
-        if file_ext in self.text_extensions:
-            try:
-                with open(source_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                if self.placeholder_pattern.search(content):
-                    template = self.jinja_env.from_string(content)
-                    processed_content = template.render(**variables)
-                    
-                    with open(dest_path, 'w', encoding='utf-8') as f:
-                        f.write(processed_content)
-                else:
-                    with open(dest_path, 'w', encoding='utf-8') as f:
-                        f.write(content)
-                        
-            except UnicodeDecodeError:
-                shutil.copy2(source_path, dest_path)
-            except Exception as e:
-                print(f"Warning: Could not process {source_path}: {e}")
-                shutil.copy2(source_path, dest_path)
-        else:
-            shutil.copy2(source_path, dest_path)
-    
+        if file_ext not in self.text_extensions:
+            return None
+
+        try:
+            content, compiled = self._load_source(source_path)
+            if compiled is not None:
+                with FILE_RENDER_SECONDS.time(), span("render", file=source_path):
+                    return compiled.render(**variables)
+            return content
+        except UnicodeDecodeError:
+            return None
+        except Exception as e:
+            self.logger.warning(f"Could not process {source_path}: {e}", file=source_path)
+            return None
+
+    def render_bytes(self, source_path: str, variables: Dict[str, Any]) -> Optional[bytes]:
+        """Returns exactly what process_file would write, or None if it is copied verbatim."""
+        text = self.render_text(source_path, variables)
+        if text is None:
+            return None
+        return self.encode_text(text)
+
+    def render_data(self, data: bytes, relative_path: str, variables: Dict[str, Any],
+                    cache_key: Optional[str] = None) -> Optional[str]:
+        """Like render_text, for template content that is already in memory (e.g. a packed template)."""
+        file_ext = os.path.splitext(relative_path)[1].lower()
+        if file_ext not in self.text_extensions:
+            return None
+
+        try:
+            content, compiled = self._load_data(data, relative_path, cache_key)
+            if compiled is not None:
+                with FILE_RENDER_SECONDS.time(), span("render", file=relative_path):
+                    return compiled.render(**variables)
+            return content
+        except UnicodeDecodeError:
+            return None
+        except Exception as e:
+            self.logger.warning(f"Could not process {relative_path}: {e}", file=relative_path)
+            return None
+
+    def referenced_variables(self, source_path: str) -> Set[str]:
+        """Names of the variables a template file renders with; empty for files copied verbatim."""
+        if os.path.splitext(source_path)[1].lower() not in self.text_extensions:
+            return set()
+        try:
+            content, compiled = self._load_source(source_path)
+            return self._variables_in(content, compiled)
+        except Exception:
+            return set()  # process_file copies it verbatim
+
+    def referenced_variables_data(self, data: bytes, relative_path: str, cache_key: Optional[str] = None) -> Set[str]:
+        """Like referenced_variables, for template content that is already in memory."""
+        if os.path.splitext(relative_path)[1].lower() not in self.text_extensions:
+            return set()
+        try:
+            content, compiled = self._load_data(data, relative_path, cache_key)
+            return self._variables_in(content, compiled)
+        except Exception:
+            return set()
+
+    def _variables_in(self, content: str, compiled: Optional[JinjaTemplate]) -> Set[str]:
+        if compiled is None:
+            return set()
+        return meta.find_undeclared_variables(self.jinja_env.parse(content))
+
+    def process_data(self, data: bytes, relative_path: str, dest_path: str, variables: Dict[str, Any],
+                     cache_key: Optional[str] = None):
+        text = self.render_data(data, relative_path, variables, cache_key)
+        if text is None:
+            self._write_file(dest_path, data, 'copied')
+            return
+
+        self._write_file(dest_path, self.encode_text(text), 'rendered')
+
+    def _write_file(self, dest_path: str, data: bytes, result: str):
+        get_io_limiter().write(len(data))
+        with FILE_WRITE_SECONDS.time(), span("write", file=dest_path, size=len(data)):
+            with open(dest_path, 'wb') as f:
+                f.write(data)
+        FILES_PROCESSED.labels(result).inc()
+        BYTES_WRITTEN.inc(len(data))
+
+    def write_patched(self, dest_path: str, data: bytes):
+        """Writes a structured file that was patched key by key."""
+        self._write_file(dest_path, data, 'patched')
+
+    def encode_text(self, text: str) -> bytes:
+        """Encodes rendered text the way process_file writes it."""
+        if os.linesep != '\n':
+            text = text.replace('\n', os.linesep)
+        return text.encode('utf-8')
+
+    def process_file(self, source_path: str, dest_path: str, variables: Dict[str, Any]):
+        text = self.render_text(source_path, variables)
+        if text is None:
+            with FILE_WRITE_SECONDS.time(), span("copy", file=dest_path):
+                copied = copy_sparse(source_path, dest_path)
+            FILES_PROCESSED.labels('copied').inc()
+            BYTES_WRITTEN.inc(copied)
+            return
+
+        self._write_file(dest_path, self.encode_text(text), 'rendered')
+
     def find_placeholders_in_file(self, file_path: str) -> list:
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
@@ -52,10 +201,13 @@ class VariableSubstitution:
         except (UnicodeDecodeError, IOError):
             return []
     
-    def find_all_placeholders(self, directory: str) -> Dict[str, list]:
+    def find_all_placeholders(self, directory: str, ignore: Optional[IgnoreMatcher] = None) -> Dict[str, list]:
         placeholders = {}
+        if ignore is None:
+            ignore = IgnoreRules.load(directory).matcher(SECTION_SCAN)
         
         for root, dirs, files in os.walk(directory):
+            files = ignore.prune(os.path.relpath(root, directory), dirs, files)
             for file in files:
                 file_path = os.path.join(root, file)
                 relative_path = os.path.relpath(file_path, directory)
@@ -0,0 +1,17 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from utils.config import ConfigManager
+
+
+class ConfigSignals(QObject):
+    """Re-emits config changes as a Qt signal so widgets get them on the GUI thread."""
+    # set of changed config keys
+    config_changed = pyqtSignal(object)
+    
+    def __init__(self, config_manager: ConfigManager, parent=None):
+        super().__init__(parent)
+        self.config_manager = config_manager
+        config_manager.add_listener(self.on_config_changed)
+    
+    def on_config_changed(self, changed):
+        self.config_changed.emit(changed)
@@ -1,27 +1,95 @@
+import threading
 from typing import List
 
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
                              QTableWidget, QTableWidgetItem, QLabel, QGroupBox,
-                             QHeaderView, QMessageBox, QMenu, QFileDialog)
-from PyQt5.QtCore import Qt, pyqtSignal
+                             QHeaderView, QMessageBox, QMenu, QFileDialog, QInputDialog,
+                             QProgressDialog)
+from PyQt5.QtCore import Qt, pyqtSignal, QThread
 from PyQt5.QtGui import QContextMenuEvent
 
+from gui.job_queue_widget import wait_for_job
 from gui.result_widget import FileResultWindow
 from models.instance import ServerInstance
+from core.agent_client import AgentClient, file_results_from_dict
+from core.drift_scanner import DriftScanner
+from core.instance_clone import InstanceCloner
+from core.instance_discovery import discover_instances, get_search_paths
+from core.rollout import RolloutPolicy, RolloutRunner
+from core.scheduler import PRIORITY_INTERACTIVE, PRIORITY_NAMES, PRIORITY_NORMAL
 from core.template_manager import TemplateManager
 from models.result import FileResult
-from utils.config import ConfigManager
+from utils.config import get_config_manager
 import os
 import subprocess
 import platform
 
+class RolloutWorker(QThread):
+    """Runs a rollout off the GUI thread and reports back through signals."""
+    # done, total, instance name
+    progress = pyqtSignal(int, int, str)
+    # batch index, batch count
+    batch_started = pyqtSignal(int, int)
+    # RolloutResult
+    rollout_finished = pyqtSignal(object)
+    rollout_failed = pyqtSignal(str)
+    
+    def __init__(self, runner: RolloutRunner, instances, policy: RolloutPolicy, parent=None):
+        super().__init__(parent)
+        self.runner = runner
+        self.instances = instances
+        self.policy = policy
+        self._cancelled = threading.Event()
+    
+    def cancel(self):
+        """Stops the rollout before its next batch."""
+        self._cancelled.set()
+    
+    def run(self):
+        def on_progress(done, total, instance):
+            self.progress.emit(done, total, instance.name)
+        
+        def should_continue(batch_index, batch_count):
+            self.batch_started.emit(batch_index, batch_count)
+            return not self._cancelled.is_set()
+        
+        try:
+            result = self.runner.run(self.instances, self.policy, on_progress, should_continue)
+        except Exception as e:
+            self.rollout_failed.emit(str(e))
+        else:
+            self.rollout_finished.emit(result)
+
+
+class DriftScanWorker(QThread):
+    """Runs a fleet drift scan off the GUI thread."""
+    # DriftReport
+    scan_finished = pyqtSignal(object)
+    scan_failed = pyqtSignal(str)
+    
+    def __init__(self, scanner: DriftScanner, instances, parent=None):
+        super().__init__(parent)
+        self.scanner = scanner
+        self.instances = instances
+    
+    def run(self):
+        try:
+            report = self.scanner.scan(self.instances)
+        except Exception as e:
+            self.scan_failed.emit(str(e))
+        else:
+            self.scan_finished.emit(report)
+
+
 class InstanceManagerWidget(QGroupBox):
-    def __init__(self):
+    def __init__(self, template_manager: TemplateManager = None):
         super().__init__("인스턴스 관리")
-        self.config_manager = ConfigManager()
+        self.config_manager = get_config_manager()
         self.config = self.config_manager.get_config()
-        self.template_manager = TemplateManager(self.config.templates_dir)
+        self.template_manager = template_manager or TemplateManager(config_manager=self.config_manager)
         self.instances = []
+        self.rollout_worker = None
+        self.drift_worker = None
         self.init_ui()
         self.refresh_instances()
     
@@ -44,6 +112,11 @@ class InstanceManagerWidget(QGroupBox):
         self.bulk_update_btn.setEnabled(False)  # Initially disabled
         toolbar_layout.addWidget(self.bulk_update_btn)
         
+        self.drift_scan_btn = QPushButton("드리프트 검사")
+        self.drift_scan_btn.clicked.connect(self.scan_drift)
+        self.drift_scan_btn.setEnabled(False)
+        toolbar_layout.addWidget(self.drift_scan_btn)
+        
         toolbar_layout.addStretch()
         layout.addLayout(toolbar_layout)
         
@@ -72,46 +145,17 @@ class InstanceManagerWidget(QGroupBox):
         layout.addWidget(self.info_label)
     
     def refresh_instances(self):
-        # Reload config in case it changed
-        self.config = self.config_manager.get_config()
-        
         self.instances.clear()
         self.instances_table.setRowCount(0)
         
         # Search for instances in configured locations
-        search_paths = [
-            self.config.instances_dir,
-            self.config.default_output_dir,
-            os.path.join(os.getcwd(), "instances"),
-            os.path.join(os.getcwd(), "output"),
-            os.getcwd()
-        ]
-        
-        # Remove duplicates while preserving order
-        unique_paths = []
-        for path in search_paths:
-            if path and path not in unique_paths:
-                unique_paths.append(path)
-        
-        found_instances = []
-        searched_paths = []
-        found_paths = set()  # Track unique instance paths to avoid duplicates
-        
-        for search_path in unique_paths:
-            if os.path.exists(search_path):
-                instances_in_path = self.find_instances_in_directory(search_path)
-                # Filter out duplicates based on normalized instance path
-                for instance in instances_in_path:
-                    normalized_path = os.path.normpath(os.path.abspath(instance.path))
-                    if normalized_path not in found_paths:
-                        found_instances.append(instance)
-                        found_paths.add(normalized_path)
-                searched_paths.append(search_path)
+        found_instances, searched_paths = discover_instances(get_search_paths(self.config))
         
         self.instances = found_instances
         self.populate_table()
         
-        self.bulk_update_btn.setEnabled(len(self.instances) > 0)
+        self.bulk_update_btn.setEnabled(len(self.instances) > 0 and self.rollout_worker is None)
+        self.drift_scan_btn.setEnabled(len(self.instances) > 0 and self.drift_worker is None)
         
         if self.instances:
             self.info_label.setText(
@@ -124,21 +168,6 @@ class InstanceManagerWidget(QGroupBox):
                 f"검색 경로: {', '.join(searched_paths)}"
             )
     
-    def find_instances_in_directory(self, directory):
-        instances = []
-        
-        try:
-            for item in os.listdir(directory):
-                item_path = os.path.join(directory, item)
-                if os.path.isdir(item_path):
-                    instance = ServerInstance.load_from_path(item_path)
-                    if instance:
-                        instances.append(instance)
-        except PermissionError:
-            pass
-        
-        return instances
-    
     def populate_table(self):
         self.instances_table.setRowCount(len(self.instances))
         
@@ -179,6 +208,9 @@ class InstanceManagerWidget(QGroupBox):
         dry_update_action = menu.addAction("Dry run")
         dry_update_action.triggered.connect(lambda: self.update_instance(instance, dry_run=True))
 
+        clone_action = menu.addAction("인스턴스 복제")
+        clone_action.triggered.connect(lambda: self.clone_instance(instance))
+
         menu.addSeparator()
         
         delete_action = menu.addAction("삭제")
@@ -227,13 +259,64 @@ class InstanceManagerWidget(QGroupBox):
             )
             
             if reply == QMessageBox.Yes:
-                result = self.template_manager.update_instance_from_template(instance, dry_run)
+                file_results = self.run_update(instance, dry_run)
                 self.refresh_instances()
-                FileResultWindow(result.processed_files).exec_()
+                FileResultWindow(file_results).exec_()
 
         except Exception as e:
             QMessageBox.critical(self, "오류", f"인스턴스 업데이트 중 오류가 발생했습니다:\n{str(e)}")
     
+    def run_update(self, instance: ServerInstance, dry_run: bool = False,
+                   priority: int = PRIORITY_INTERACTIVE, group: str = None) -> List[FileResult]:
+        # Hand the job to the agent when one is configured
+        if self.config.agent_url:
+            client = AgentClient.from_config(self.config)
+            data = client.run("update", {"instance": instance.name, "dry_run": dry_run,
+                                         "priority": PRIORITY_NAMES[priority]})
+            return file_results_from_dict(data)
+        
+        # Runs on the shared scheduler so it waits for, or pauses, other work on the same disk
+        job = self.template_manager.scheduler.submit(
+            "update", lambda: self.template_manager.update_instance_from_template(instance, dry_run).processed_files,
+            priority, instance.name, group)
+        return wait_for_job(job)
+    
+    def clone_instance(self, instance: ServerInstance):
+        name, ok = QInputDialog.getText(self, "인스턴스 복제", "새 인스턴스 이름:", text=f"{instance.name}-copy")
+        name = name.strip()
+        if not ok or not name:
+            return
+        
+        try:
+            output_dir = os.path.dirname(instance.path)
+            if self.config.agent_url:
+                client = AgentClient.from_config(self.config)
+                data = client.run("clone", {"instance": instance.name, "name": name, "output_dir": output_dir,
+                                            "priority": PRIORITY_NAMES[PRIORITY_INTERACTIVE]})
+                path = data['instance']['path']
+                ports = {}
+            else:
+                # The clone moves to free ports so it can run next to the source
+                cloner = InstanceCloner(self.template_manager)
+                ports = cloner.suggest_variables(instance)
+                errors = cloner.check(instance, name, output_dir, ports)
+                if errors:
+                    QMessageBox.warning(self, "복제 불가", "\n".join(errors))
+                    return
+                job = self.template_manager.scheduler.submit(
+                    "clone", lambda: cloner.clone(instance, name, output_dir, ports),
+                    PRIORITY_INTERACTIVE, instance.name)
+                clone, _ = wait_for_job(job)
+                path = clone.path
+            
+            self.refresh_instances()
+            message = f"'{name}' 인스턴스가 생성되었습니다.\n\n경로: {path}"
+            if ports:
+                message += "\n\n변경된 포트:\n" + "\n".join(f"  {key} = {value}" for key, value in sorted(ports.items()))
+            QMessageBox.information(self, "완료", message)
+        except Exception as e:
+            QMessageBox.critical(self, "오류", f"인스턴스 복제 중 오류가 발생했습니다:\n{str(e)}")
+    
     def delete_instance(self, instance: ServerInstance):
         reply = QMessageBox.question(
             self, "확인",
@@ -248,6 +331,7 @@ class InstanceManagerWidget(QGroupBox):
             try:
                 import shutil
                 shutil.rmtree(instance.path)
+                self.template_manager.forget_instance(instance)
                 self.refresh_instances()
                 QMessageBox.information(self, "완료", "인스턴스가 삭제되었습니다.")
             except Exception as e:
@@ -271,7 +355,13 @@ class InstanceManagerWidget(QGroupBox):
         message += "템플릿별 인스턴스 개수:\n"
         for template_name, instances in template_groups.items():
             message += f"  • {template_name}: {len(instances)}개\n"
-        message += "\n모든 인스턴스의 기존 파일들이 덮어쓰여집니다."
+        policy = RolloutPolicy.from_config(self.config)
+        message += (
+            f"\n카나리 {policy.canary_count}개를 먼저 업데이트한 뒤 "
+            f"{policy.batch_size}개씩 (동시 {policy.concurrency}개) 진행합니다.\n"
+            f"실패율이 {policy.max_failure_rate:.0%}를 넘으면 중단됩니다."
+        )
+        message += "\n\n모든 인스턴스의 기존 파일들이 덮어쓰여집니다."
         
         reply = QMessageBox.question(
             self, "일괄 업데이트 확인", message,
@@ -282,64 +372,104 @@ class InstanceManagerWidget(QGroupBox):
         if reply != QMessageBox.Yes:
             return
         
-        # Perform bulk update
-        updated_count = 0
-        failed_count = 0
-        failed_instances = []
-        
-        from PyQt5.QtWidgets import QProgressDialog
-        from PyQt5.QtCore import Qt
-        
         # Show progress dialog
         progress = QProgressDialog("인스턴스 업데이트 중...", "취소", 0, len(self.instances), self)
         progress.setWindowTitle("일괄 업데이트")
         progress.setWindowModality(Qt.WindowModal)
+        progress.setAutoClose(False)
+        progress.setAutoReset(False)
         progress.show()
-
-        file_results: List[FileResult] = []
-        for i, instance in enumerate(self.instances):
-            if progress.wasCanceled():
-                break
-                
-            progress.setLabelText(f"업데이트 중: {instance.name}")
-            progress.setValue(i)
-            
-            try:
-                result = self.template_manager.update_instance_from_template(instance)
-                file_results.extend(result.processed_files)
-                updated_count += 1
-            except Exception as e:
-                failed_count += 1
-                failed_instances.append(f"{instance.name}: {str(e)}")
-            
-            # Process events to keep UI responsive
-            from PyQt5.QtWidgets import QApplication
-            QApplication.processEvents()
         
-        progress.setValue(len(self.instances))
+        # Perform bulk update; its jobs share one group so another bulk update gets fair turns
+        group = f"bulk-update-{id(progress)}"
+        
+        def update(instance, dry_run):
+            return self.run_update(instance, dry_run, PRIORITY_NORMAL, group)
+        
+        # The rollout runs on a worker thread so the window keeps repainting
+        worker = RolloutWorker(RolloutRunner(update), list(self.instances), policy, self)
+        worker.progress.connect(lambda done, total, name: (
+            progress.setLabelText(f"업데이트 완료: {name}"), progress.setValue(done)))
+        worker.batch_started.connect(lambda index, count: progress.setLabelText(
+            f"배치 {index + 1}/{count} 진행 중..."))
+        progress.canceled.connect(worker.cancel)
+        worker.rollout_finished.connect(lambda result: self.on_bulk_update_finished(progress, result))
+        worker.rollout_failed.connect(lambda error: self.on_bulk_update_failed(progress, error))
+        worker.finished.connect(worker.deleteLater)
+        
+        self.bulk_update_btn.setEnabled(False)
+        self.rollout_worker = worker
+        worker.start()
+    
+    def on_bulk_update_failed(self, progress: QProgressDialog, error: str):
+        progress.close()
+        self.rollout_worker = None
+        self.refresh_instances()
+        QMessageBox.critical(self, "오류", f"일괄 업데이트 중 오류가 발생했습니다:\n{error}")
+    
+    def on_bulk_update_finished(self, progress: QProgressDialog, result):
         progress.close()
+        self.rollout_worker = None
         
         # Refresh instances list
         self.refresh_instances()
         
         # Show results
-        if failed_count == 0:
+        if not result.failed and not result.aborted:
             QMessageBox.information(
                 self, "완료", 
                 f"모든 인스턴스가 성공적으로 업데이트되었습니다.\n\n"
-                f"업데이트된 인스턴스: {updated_count}개"
+                f"업데이트된 인스턴스: {len(result.updated)}개"
             )
         else:
+            failed_instances = [f"{name}: {error}" for name, error in result.failed.items()]
             error_details = "\n".join(failed_instances[:5])  # Show first 5 errors
             if len(failed_instances) > 5:
                 error_details += f"\n... 및 {len(failed_instances) - 5}개 더"
             
+            stopped = ""
+            if result.aborted:
+                stopped = f"중단됨: {result.abort_reason} (미실행 {len(result.skipped)}개)\n\n"
+            
             QMessageBox.warning(
                 self, "일부 실패",
                 f"일괄 업데이트가 완료되었습니다.\n\n"
-                f"성공: {updated_count}개\n"
-                f"실패: {failed_count}개\n\n"
+                f"{stopped}"
+                f"성공: {len(result.updated)}개\n"
+                f"실패: {len(result.failed)}개\n\n"
                 f"실패한 인스턴스:\n{error_details}"
             )
 
-        FileResultWindow(file_results).exec_()
\ No newline at end of file
+        FileResultWindow(result.processed_files).exec_()
+
+    def scan_drift(self):
+        if not self.instances:
+            QMessageBox.information(self, "알림", "검사할 인스턴스가 없습니다.")
+            return
+        
+        # The scan reads every instance, so it runs on a worker thread to keep the window responsive
+        worker = DriftScanWorker(DriftScanner(self.template_manager), list(self.instances), self)
+        worker.scan_finished.connect(self.on_drift_scan_finished)
+        worker.scan_failed.connect(self.on_drift_scan_failed)
+        worker.finished.connect(worker.deleteLater)
+        
+        self.drift_scan_btn.setEnabled(False)
+        self.drift_scan_btn.setText("드리프트 검사 중...")
+        self.drift_worker = worker
+        worker.start()
+    
+    def _drift_scan_done(self):
+        self.drift_worker = None
+        self.drift_scan_btn.setText("드리프트 검사")
+        self.drift_scan_btn.setEnabled(len(self.instances) > 0)
+    
+    def on_drift_scan_failed(self, error: str):
+        self._drift_scan_done()
+        QMessageBox.critical(self, "오류", f"드리프트 검사 중 오류가 발생했습니다:\n{error}")
+    
+    def on_drift_scan_finished(self, report):
+        self._drift_scan_done()
+        FileResultWindow(
+            report.processed_files,
+            f"Drift Report - {len(report.drifted_instances)}/{report.scanned_instances} drifted"
+        ).exec_()
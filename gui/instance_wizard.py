@@ -6,6 +6,9 @@ from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QFont
 
 from models.template import Template, TemplateVariable
+from core.agent_client import AgentClient
+from core.batch_create import DEFAULT_START_PORT
+from core.scheduler import PRIORITY_INTERACTIVE, PRIORITY_NAMES
 from core.template_manager import TemplateManager
 import os
 
@@ -21,7 +24,7 @@ class InstanceCreationWizard(QWizard):
         
         # Add pages
         self.addPage(InstanceInfoPage(self.template, self.default_output_dir))
-        self.addPage(VariablesPage(self.template))
+        self.addPage(VariablesPage(self.template, self.template_manager))
         self.addPage(SummaryPage(self.template))
         
         # Set button texts
@@ -51,15 +54,23 @@ class InstanceCreationWizard(QWizard):
             
             # Validate variables
             errors = self.template_manager.validate_variables(self.template, variables)
+            errors += self.template_manager.check_conflicts(
+                self.template, variables, os.path.join(output_dir, instance_name)
+            )
             if errors:
                 QMessageBox.warning(self, "변수 검증 오류", 
                                    "다음 오류를 수정해주세요:\n" + "\n".join(errors))
                 return
             
-            # Create instance
-            instance = self.template_manager.create_instance(
-                self.template, instance_name, output_dir, variables
-            )
+            # Create instance, through the agent when one is configured
+            config = self.template_manager.config
+            if config.agent_url:
+                AgentClient.from_config(config).run("create", {
+                    "template": self.template.name, "name": instance_name, "output_dir": output_dir,
+                    "variables": variables, "priority": PRIORITY_NAMES[PRIORITY_INTERACTIVE]
+                })
+            else:
+                self.template_manager.create_instance(self.template, instance_name, output_dir, variables)
             
             super().accept()
             
@@ -117,9 +128,10 @@ class InstanceInfoPage(QWizardPage):
             self.output_dir_edit.setText(dir_path)
 
 class VariablesPage(QWizardPage):
-    def __init__(self, template: Template):
+    def __init__(self, template: Template, template_manager: TemplateManager = None):
         super().__init__()
         self.template = template
+        self.template_manager = template_manager
         self.variable_widgets = {}
         self.init_ui()
     
@@ -145,6 +157,13 @@ class VariablesPage(QWizardPage):
             desc_label = QLabel(f"{label_text}\n{variable.description}")
             layout.addRow(desc_label, widget)
     
+    def suggested_ports(self):
+        return {widget.value() for name, widget in self.variable_widgets.items()
+                if isinstance(widget, QSpinBox) and self.is_port_variable(name)}
+    
+    def is_port_variable(self, name: str) -> bool:
+        return any(var.name == name and var.type == "port" for var in self.template.variables)
+    
     def create_variable_widget(self, variable: TemplateVariable):
         if variable.type == "string":
             widget = QLineEdit()
@@ -161,6 +180,13 @@ class VariablesPage(QWizardPage):
                 widget.setMaximum(999999)
             if variable.default_value:
                 widget.setValue(int(variable.default_value))
+            if variable.type == "port" and self.template_manager is not None:
+                # Suggest a port nobody in the fleet uses yet
+                index = self.template_manager.variable_index
+                if variable.name not in index.shared_variables:
+                    start = widget.value() if variable.default_value else DEFAULT_START_PORT
+                    suggested = index.next_free_port(start, self.suggested_ports())
+                    widget.setValue(suggested)
             
         elif variable.type == "boolean":
             widget = QCheckBox()
@@ -0,0 +1,91 @@
+from concurrent.futures import wait
+from typing import Any
+
+from PyQt5.QtWidgets import (QGroupBox, QVBoxLayout, QTableWidget, QTableWidgetItem,
+                             QHeaderView, QApplication, QAbstractItemView)
+from PyQt5.QtCore import QEventLoop, QThread, QTimer
+from PyQt5.QtGui import QColor
+
+from core.scheduler import (JOB_DONE, JOB_FAILED, JOB_PAUSED, JOB_QUEUED, JOB_RUNNING, JobScheduler,
+                            ScheduledJob)
+
+STATUS_LABELS = {
+    JOB_QUEUED: "대기 중",
+    JOB_RUNNING: "실행 중",
+    JOB_PAUSED: "일시 정지",
+    JOB_DONE: "완료",
+    JOB_FAILED: "실패",
+}
+
+PRIORITY_LABELS = {
+    "interactive": "즉시",
+    "normal": "보통",
+    "background": "백그라운드",
+}
+
+
+def wait_for_job(job: ScheduledJob) -> Any:
+    """Waits for a scheduled job; on the GUI thread the window keeps repainting meanwhile."""
+    app = QApplication.instance()
+    if app is not None and QThread.currentThread() is app.thread():
+        while not job.future.done():
+            QApplication.processEvents(QEventLoop.AllEvents, 50)
+            wait([job.future], timeout=0.05)
+    return job.future.result()
+
+
+class JobQueueWidget(QGroupBox):
+    """Running, queued and recently finished jobs of the shared scheduler."""
+
+    def __init__(self, scheduler: JobScheduler):
+        super().__init__("작업 대기열")
+        self.scheduler = scheduler
+        self.init_ui()
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(1000)
+        self.refresh()
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+
+        self.jobs_table = QTableWidget()
+        self.jobs_table.setColumnCount(6)
+        self.jobs_table.setHorizontalHeaderLabels([
+            "작업", "인스턴스", "우선순위", "상태", "대기", "실행"
+        ])
+        self.jobs_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.jobs_table.verticalHeader().setVisible(False)
+
+        header = self.jobs_table.horizontalHeader()
+        for column in range(6):
+            header.setSectionResizeMode(column, QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(1, QHeaderView.Stretch)
+
+        layout.addWidget(self.jobs_table)
+
+    def refresh(self):
+        jobs = self.scheduler.jobs()
+        self.jobs_table.setRowCount(len(jobs))
+
+        for row, job in enumerate(jobs):
+            status = STATUS_LABELS.get(job.status, job.status)
+            if job.yields and job.status != JOB_PAUSED:
+                status += f" (양보 {job.yields}회)"
+            values = [
+                job.kind,
+                job.instance or "-",
+                PRIORITY_LABELS.get(job.priority_name, job.priority_name),
+                status,
+                f"{job.waited:.1f}초",
+                f"{job.ran:.1f}초" if job.started is not None else "-",
+            ]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if job.status == JOB_FAILED:
+                    item.setForeground(QColor("#c0392b"))
+                    item.setToolTip(job.error)
+                elif job.status == JOB_PAUSED:
+                    item.setForeground(QColor("#7f8c8d"))
+                self.jobs_table.setItem(row, column, item)
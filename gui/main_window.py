@@ -2,27 +2,44 @@ from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QPushButton, QListWidget, QLabel, QTextEdit, 
                              QSplitter, QGroupBox, QMessageBox, QFileDialog,
                              QListWidgetItem)
-from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtCore import Qt, pyqtSignal, QTimer
 from PyQt5.QtGui import QFont, QIcon
 
+from core.io_limiter import configure_io
 from core.template_manager import TemplateManager
 from gui.instance_wizard import InstanceCreationWizard
 from gui.instance_manager import InstanceManagerWidget
+from gui.job_queue_widget import JobQueueWidget
 from gui.settings_dialog import SettingsDialog
 from models.template import Template
-from utils.config import ConfigManager
+from gui.config_signals import ConfigSignals
+from utils.config import get_config_manager
+from utils.logger import get_logger
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.config_manager = ConfigManager()
+        self.config_manager = get_config_manager()
         self.config = self.config_manager.get_config()
         self.config.ensure_directories()  # Create directories if they don't exist
+        get_logger().configure(self.config)
+        configure_io(self.config)
         
-        self.template_manager = TemplateManager(self.config.templates_dir)
+        # Shared by every widget; it follows config changes itself
+        self.template_manager = TemplateManager(config_manager=self.config_manager)
         self.templates = []
+        self.config_signals = ConfigSignals(self.config_manager, self)
+        self.config_signals.config_changed.connect(self.on_config_changed)
         self.init_ui()
         self.load_templates()
+        
+        # Verify backup archives in the background and show failures in the status bar
+        if self.config.scrub_enabled:
+            self.template_manager.backup_scrubber.start()
+        self.backup_status_timer = QTimer(self)
+        self.backup_status_timer.timeout.connect(self.update_backup_status)
+        self.backup_status_timer.start(60 * 1000)
+        self.update_backup_status()
     
     def init_ui(self):
         self.setWindowTitle("Dotwork Server Bootstrapper")
@@ -52,6 +69,10 @@ class MainWindow(QMainWindow):
         
         # Status bar
         self.statusBar().showMessage("Ready")
+        self.backup_status_label = QLabel()
+        self.backup_status_label.setStyleSheet("color: #c0392b; font-weight: bold;")
+        self.backup_status_label.hide()
+        self.statusBar().addPermanentWidget(self.backup_status_label)
         
         # Menu bar
         self.create_menu_bar()
@@ -113,16 +134,21 @@ class MainWindow(QMainWindow):
         return group_box
     
     def create_instances_panel(self):
-        self.instance_manager = InstanceManagerWidget()
-        return self.instance_manager
+        panel = QSplitter(Qt.Vertical)
+        self.instance_manager = InstanceManagerWidget(self.template_manager)
+        panel.addWidget(self.instance_manager)
+        
+        # Jobs of the shared scheduler, including background backups and scrubs
+        self.job_queue = JobQueueWidget(self.template_manager.scheduler)
+        panel.addWidget(self.job_queue)
+        panel.setSizes([600, 200])
+        return panel
     
     def load_templates(self):
         self.templates_list.clear()
         self.template_info.clear()
         
         try:
-            # Update template manager with current config
-            self.template_manager = TemplateManager(self.config.templates_dir)
             self.templates = self.template_manager.discover_templates()
             
             for template in self.templates:
@@ -194,16 +220,45 @@ class MainWindow(QMainWindow):
     
     def on_settings_changed(self):
         """Handle settings changes"""
-        # Reload config
-        self.config = self.config_manager.get_config()
+        self.statusBar().showMessage("설정이 변경되었습니다.")
+    
+    def on_config_changed(self, changed):
+        """Reload only the views that depend on the changed keys"""
+        if 'templates_dir' in changed:
+            self.load_templates()
         
-        # Reload templates with new path
-        self.load_templates()
+        if changed & {'instances_dir', 'default_output_dir'}:
+            self.instance_manager.refresh_instances()
         
-        # Update instance manager
-        self.instance_manager.refresh_instances()
+        if any(key.startswith('log_') for key in changed):
+            get_logger().configure(self.config)
         
-        self.statusBar().showMessage("설정이 변경되었습니다.")
+        if any(key.startswith('io_') for key in changed):
+            configure_io(self.config)
+        
+        if 'scrub_enabled' in changed:
+            if self.config.scrub_enabled:
+                self.template_manager.backup_scrubber.start()
+            else:
+                self.template_manager.backup_scrubber.stop()
+    
+    def update_backup_status(self):
+        """Shows backups whose last verification failed"""
+        corrupt = self.template_manager.backup_manager.catalog.corrupt_entries()
+        if not corrupt:
+            self.backup_status_label.hide()
+            return
+        
+        self.backup_status_label.setText(f"손상된 백업 {len(corrupt)}개")
+        self.backup_status_label.setToolTip("\n".join(
+            f"{entry.filename}: {entry.verify_error}" for entry in corrupt[:20]
+        ))
+        self.backup_status_label.show()
+    
+    def closeEvent(self, event):
+        self.template_manager.backup_scrubber.stop()
+        self.template_manager.scheduler.shutdown(wait=False)
+        super().closeEvent(event)
     
     def show_about(self):
         QMessageBox.about(self, "정보", 
@@ -16,7 +16,7 @@ COLUMNS = [
     ("Template", "template"),
 ]
 
-STATUS_ORDER = ["Error", "Replaced", "Created", "Unchanged", "Skipped"]
+STATUS_ORDER = ["Error", "Drifted", "Replaced", "Created", "Deleted", "Unchanged", "Skipped"]
 
 
 # ----- Model -----
@@ -46,10 +46,14 @@ class ResultsTableModel(QAbstractTableModel):
         if role == Qt.ForegroundRole:
             if row.status == "Error":
                 return QColor("#d73a49")
+            if row.status == "Drifted":
+                return QColor("#b08800")
             if row.status == "Replaced":
                 return QColor("#22863a")
             if row.status == "Created":
                 return QColor("#0366d6")
+            if row.status == "Deleted":
+                return QColor("#cb2431")
             if row.status == "Skipped":
                 return QColor("#6a737d")
 
@@ -166,32 +170,45 @@ class SummaryBar(QWidget):
         self.created = QLabel("Created: 0")
         self.unchanged = QLabel("Unchanged: 0")
         self.skipped = QLabel("Skipped: 0")
+        self.drifted = QLabel("Drifted: 0")
+        self.deleted = QLabel("Deleted: 0")
+        self.missing = QLabel("Missing: 0")
         self.error = QLabel("Error: 0")
         layout.addWidget(self.total)
         layout.addWidget(self.replaced)
         layout.addWidget(self.created)
         layout.addWidget(self.unchanged)
         layout.addWidget(self.skipped)
+        layout.addWidget(self.drifted)
+        layout.addWidget(self.deleted)
+        layout.addWidget(self.missing)
         layout.addWidget(self.error)
         layout.addStretch()
 
     def update_counts(self, rows: List[FileResult]):
-        cnts = {"Total": len(rows), "Replaced": 0, "Created": 0, "Unchanged": 0, "Skipped": 0, "Error": 0}
+        cnts = {"Total": len(rows), "Replaced": 0, "Created": 0, "Unchanged": 0, "Skipped": 0, "Drifted": 0,
+                "Deleted": 0, "Missing": 0, "Error": 0}
         for r in rows:
             if r.status in cnts:
                 cnts[r.status] += 1
+            # Drift scans report files gone from the instance as drifted
+            if r.reason == "missing":
+                cnts["Missing"] += 1
         self.total.setText(f"Total: {cnts['Total']}")
         self.replaced.setText(f"Replaced: {cnts['Replaced']}")
         self.created.setText(f"Created: {cnts['Created']}")
         self.unchanged.setText(f"Unchanged: {cnts['Unchanged']}")
         self.skipped.setText(f"Skipped: {cnts['Skipped']}")
+        self.drifted.setText(f"Drifted: {cnts['Drifted']}")
+        self.deleted.setText(f"Deleted: {cnts['Deleted']}")
+        self.missing.setText(f"Missing: {cnts['Missing']}")
         self.error.setText(f"Error: {cnts['Error']}")
 
 
 class FileResultWindow(QDialog):
-    def __init__(self, rows: List[FileResult]):
+    def __init__(self, rows: List[FileResult], title: str = "Template Apply Results"):
         super().__init__()
-        self.setWindowTitle("Template Apply Results")
+        self.setWindowTitle(title)
         self.resize(1200, 720)
 
         self.model = ResultsTableModel(rows)
@@ -5,7 +5,7 @@ from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QFormLayout,
 from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QFont
 
-from utils.config import ConfigManager
+from utils.config import get_config_manager
 import os
 
 class SettingsDialog(QDialog):
@@ -13,7 +13,7 @@ class SettingsDialog(QDialog):
     
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.config_manager = ConfigManager()
+        self.config_manager = get_config_manager()
         self.config = self.config_manager.get_config()
         self.init_ui()
         self.load_settings()
@@ -147,6 +147,57 @@ class SettingsDialog(QDialog):
         backup_layout.addRow("최대 백업 개수:", self.max_backups_spin)
         
         layout.addWidget(backup_group)
+        
+        # Grandfather-father-son retention, kept on top of the newest backups
+        retention_group = QGroupBox("보존 정책 (0 = 사용 안 함)")
+        retention_layout = QFormLayout(retention_group)
+        
+        self.keep_hourly_spin = QSpinBox()
+        self.keep_hourly_spin.setRange(0, 1000)
+        retention_layout.addRow("시간별 보존 개수:", self.keep_hourly_spin)
+        
+        self.keep_daily_spin = QSpinBox()
+        self.keep_daily_spin.setRange(0, 1000)
+        retention_layout.addRow("일별 보존 개수:", self.keep_daily_spin)
+        
+        self.keep_weekly_spin = QSpinBox()
+        self.keep_weekly_spin.setRange(0, 1000)
+        retention_layout.addRow("주별 보존 개수:", self.keep_weekly_spin)
+        
+        self.keep_monthly_spin = QSpinBox()
+        self.keep_monthly_spin.setRange(0, 1000)
+        retention_layout.addRow("월별 보존 개수:", self.keep_monthly_spin)
+        
+        self.max_instance_mb_spin = QSpinBox()
+        self.max_instance_mb_spin.setRange(0, 10_000_000)
+        self.max_instance_mb_spin.setSuffix(" MB")
+        retention_layout.addRow("인스턴스별 최대 용량:", self.max_instance_mb_spin)
+        
+        self.max_total_mb_spin = QSpinBox()
+        self.max_total_mb_spin.setRange(0, 100_000_000)
+        self.max_total_mb_spin.setSuffix(" MB")
+        retention_layout.addRow("전체 최대 용량:", self.max_total_mb_spin)
+        
+        layout.addWidget(retention_group)
+        
+        # Background archive verification
+        scrub_group = QGroupBox("백업 무결성 검사")
+        scrub_layout = QFormLayout(scrub_group)
+        
+        self.scrub_enabled_check = QCheckBox("백그라운드에서 백업 파일 검사")
+        scrub_layout.addRow(self.scrub_enabled_check)
+        
+        self.scrub_interval_spin = QSpinBox()
+        self.scrub_interval_spin.setRange(1, 24 * 90)
+        self.scrub_interval_spin.setSuffix(" 시간")
+        scrub_layout.addRow("검사 주기:", self.scrub_interval_spin)
+        
+        self.scrub_rate_spin = QSpinBox()
+        self.scrub_rate_spin.setRange(1, 10000)
+        self.scrub_rate_spin.setSuffix(" MB/s")
+        scrub_layout.addRow("최대 읽기 속도:", self.scrub_rate_spin)
+        
+        layout.addWidget(scrub_group)
         layout.addStretch()
     
     def create_general_tab(self):
@@ -166,6 +217,71 @@ class SettingsDialog(QDialog):
         
         layout.addWidget(logging_group)
         
+        # Bulk update rollout
+        rollout_group = QGroupBox("일괄 업데이트")
+        rollout_layout = QFormLayout(rollout_group)
+        
+        self.rollout_canary_spin = QSpinBox()
+        self.rollout_canary_spin.setRange(0, 100)
+        rollout_layout.addRow("카나리 인스턴스 수:", self.rollout_canary_spin)
+        
+        self.rollout_batch_spin = QSpinBox()
+        self.rollout_batch_spin.setRange(1, 1000)
+        rollout_layout.addRow("배치 크기:", self.rollout_batch_spin)
+        
+        self.rollout_concurrency_spin = QSpinBox()
+        self.rollout_concurrency_spin.setRange(1, 64)
+        rollout_layout.addRow("동시 업데이트 수:", self.rollout_concurrency_spin)
+        
+        self.rollout_failure_spin = QSpinBox()
+        self.rollout_failure_spin.setRange(0, 100)
+        self.rollout_failure_spin.setSuffix(" %")
+        rollout_layout.addRow("중단 실패율:", self.rollout_failure_spin)
+        
+        self.rollout_pause_spin = QSpinBox()
+        self.rollout_pause_spin.setRange(0, 3600)
+        self.rollout_pause_spin.setSuffix(" 초")
+        rollout_layout.addRow("배치 간 대기:", self.rollout_pause_spin)
+
+        self.update_mode_combo = QComboBox()
+        self.update_mode_combo.addItem("파일 전체 덮어쓰기", "overwrite")
+        self.update_mode_combo.addItem("변경된 키만 적용 (.properties/.yml)", "patch")
+        rollout_layout.addRow("설정 파일 업데이트:", self.update_mode_combo)
+        
+        layout.addWidget(rollout_group)
+        
+        # Disk I/O limits
+        io_group = QGroupBox("디스크 I/O 제한 (0 = 무제한)")
+        io_layout = QFormLayout(io_group)
+        
+        self.io_read_spin = QSpinBox()
+        self.io_read_spin.setRange(0, 100000)
+        self.io_read_spin.setSuffix(" MB/s")
+        io_layout.addRow("최대 읽기 속도:", self.io_read_spin)
+        
+        self.io_write_spin = QSpinBox()
+        self.io_write_spin.setRange(0, 100000)
+        self.io_write_spin.setSuffix(" MB/s")
+        io_layout.addRow("최대 쓰기 속도:", self.io_write_spin)
+        
+        self.io_read_iops_spin = QSpinBox()
+        self.io_read_iops_spin.setRange(0, 1000000)
+        self.io_read_iops_spin.setSuffix(" IOPS")
+        io_layout.addRow("최대 읽기 횟수:", self.io_read_iops_spin)
+        
+        self.io_write_iops_spin = QSpinBox()
+        self.io_write_iops_spin.setRange(0, 1000000)
+        self.io_write_iops_spin.setSuffix(" IOPS")
+        io_layout.addRow("최대 쓰기 횟수:", self.io_write_iops_spin)
+        
+        self.io_priority_combo = QComboBox()
+        self.io_priority_combo.addItem("기본", "")
+        self.io_priority_combo.addItem("낮음", "low")
+        self.io_priority_combo.addItem("유휴 시에만 (idle)", "idle")
+        io_layout.addRow("I/O 우선순위 (Linux):", self.io_priority_combo)
+        
+        layout.addWidget(io_group)
+        
         # About
         about_group = QGroupBox("정보")
         about_layout = QVBoxLayout(about_group)
@@ -224,6 +340,30 @@ class SettingsDialog(QDialog):
         self.backup_dir_edit.setText(self.config.backup_dir)
         self.auto_backup_check.setChecked(self.config.auto_backup)
         self.max_backups_spin.setValue(self.config.max_backups)
+        self.keep_hourly_spin.setValue(self.config.backup_keep_hourly)
+        self.keep_daily_spin.setValue(self.config.backup_keep_daily)
+        self.keep_weekly_spin.setValue(self.config.backup_keep_weekly)
+        self.keep_monthly_spin.setValue(self.config.backup_keep_monthly)
+        self.max_instance_mb_spin.setValue(int(self.config.backup_max_instance_mb))
+        self.max_total_mb_spin.setValue(int(self.config.backup_max_total_mb))
+        self.scrub_enabled_check.setChecked(self.config.scrub_enabled)
+        self.scrub_interval_spin.setValue(int(self.config.scrub_interval_hours))
+        self.scrub_rate_spin.setValue(int(self.config.scrub_mb_per_s))
+        self.rollout_canary_spin.setValue(self.config.rollout_canary_count)
+        self.rollout_batch_spin.setValue(self.config.rollout_batch_size)
+        self.rollout_concurrency_spin.setValue(self.config.rollout_concurrency)
+        self.rollout_failure_spin.setValue(round(self.config.rollout_max_failure_rate * 100))
+        self.rollout_pause_spin.setValue(int(self.config.rollout_pause_seconds))
+        update_mode_index = self.update_mode_combo.findData(self.config.update_mode)
+        if update_mode_index >= 0:
+            self.update_mode_combo.setCurrentIndex(update_mode_index)
+        self.io_read_spin.setValue(int(self.config.io_read_mb_per_s))
+        self.io_write_spin.setValue(int(self.config.io_write_mb_per_s))
+        self.io_read_iops_spin.setValue(self.config.io_read_iops)
+        self.io_write_iops_spin.setValue(self.config.io_write_iops)
+        io_priority_index = self.io_priority_combo.findData(self.config.io_priority)
+        if io_priority_index >= 0:
+            self.io_priority_combo.setCurrentIndex(io_priority_index)
         
         # Set log level
         log_level_index = self.log_level_combo.findText(self.config.log_level)
@@ -274,6 +414,26 @@ class SettingsDialog(QDialog):
             backup_dir=self.backup_dir_edit.text().strip(),
             auto_backup=self.auto_backup_check.isChecked(),
             max_backups=self.max_backups_spin.value(),
+            backup_keep_hourly=self.keep_hourly_spin.value(),
+            backup_keep_daily=self.keep_daily_spin.value(),
+            backup_keep_weekly=self.keep_weekly_spin.value(),
+            backup_keep_monthly=self.keep_monthly_spin.value(),
+            backup_max_instance_mb=float(self.max_instance_mb_spin.value()),
+            backup_max_total_mb=float(self.max_total_mb_spin.value()),
+            scrub_enabled=self.scrub_enabled_check.isChecked(),
+            scrub_interval_hours=float(self.scrub_interval_spin.value()),
+            scrub_mb_per_s=float(self.scrub_rate_spin.value()),
+            rollout_canary_count=self.rollout_canary_spin.value(),
+            rollout_batch_size=self.rollout_batch_spin.value(),
+            rollout_concurrency=self.rollout_concurrency_spin.value(),
+            rollout_max_failure_rate=self.rollout_failure_spin.value() / 100,
+            rollout_pause_seconds=float(self.rollout_pause_spin.value()),
+            update_mode=self.update_mode_combo.currentData(),
+            io_read_mb_per_s=float(self.io_read_spin.value()),
+            io_write_mb_per_s=float(self.io_write_spin.value()),
+            io_read_iops=self.io_read_iops_spin.value(),
+            io_write_iops=self.io_write_iops_spin.value(),
+            io_priority=self.io_priority_combo.currentData(),
             log_level=self.log_level_combo.currentText()
         )
     
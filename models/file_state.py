@@ -0,0 +1,90 @@
+import os
+import json
+import hashlib
+from typing import Dict, Any, Optional
+from dataclasses import dataclass, field, asdict
+
+STATE_FILE = '.dotwork_state.json'
+
+
+def compute_variables_digest(variables: Dict[str, Any]) -> str:
+    encoded = json.dumps(variables, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.md5(encoded).hexdigest()
+
+
+@dataclass
+class FileState:
+    hash: str
+    size: int
+    mtime_ns: int
+    inode: int
+    source_size: int = -1
+    source_mtime_ns: int = -1
+    # Keys of the last render of a structured file, kept for key-level patching
+    keys: Optional[Dict[str, Any]] = None
+
+    def matches_stat(self, stat: os.stat_result) -> bool:
+        return (self.size == stat.st_size
+                and self.mtime_ns == stat.st_mtime_ns
+                and self.inode == stat.st_ino)
+
+    def matches_source(self, stat: os.stat_result) -> bool:
+        return self.source_size == stat.st_size and self.source_mtime_ns == stat.st_mtime_ns
+
+
+@dataclass
+class InstanceFileState:
+    """Rendered hash and write-time stat of every provisioned file in an instance."""
+    algorithm: str = 'md5'
+    variables_digest: str = ''
+    files: Dict[str, FileState] = field(default_factory=dict)
+    # Set once an entry is recorded, so callers can skip saving an unchanged state
+    changed: bool = field(default=False, compare=False, repr=False)
+
+    def record(self, relative_path: str, digest: str, dest_stat: os.stat_result,
+               source_stat: Optional[os.stat_result] = None, keys: Optional[Dict[str, Any]] = None):
+        self.files[relative_path] = FileState(
+            hash=digest,
+            size=dest_stat.st_size,
+            mtime_ns=dest_stat.st_mtime_ns,
+            inode=dest_stat.st_ino,
+            source_size=source_stat.st_size if source_stat else -1,
+            source_mtime_ns=source_stat.st_mtime_ns if source_stat else -1,
+            keys=keys
+        )
+        self.changed = True
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'algorithm': self.algorithm,
+            'variables_digest': self.variables_digest,
+            'files': {path: {key: value for key, value in asdict(state).items() if value is not None}
+                      for path, state in self.files.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'InstanceFileState':
+        return cls(
+            algorithm=data.get('algorithm', 'md5'),
+            variables_digest=data.get('variables_digest', ''),
+            files={path: FileState(**state) for path, state in data.get('files', {}).items()}
+        )
+
+    def save(self, instance_path: str):
+        state_file = os.path.join(instance_path, STATE_FILE)
+        temp_file = state_file + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, separators=(',', ':'))
+        os.replace(temp_file, state_file)
+
+    @classmethod
+    def load_from_path(cls, instance_path: str) -> 'InstanceFileState':
+        state_file = os.path.join(instance_path, STATE_FILE)
+        if not os.path.exists(state_file):
+            return cls()
+
+        try:
+            with open(state_file, 'r', encoding='utf-8') as f:
+                return cls.from_dict(json.load(f))
+        except (json.JSONDecodeError, KeyError, TypeError):
+            return cls()
@@ -0,0 +1,205 @@
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+IGNORE_FILE = '.dotworkignore'
+
+SECTION_BACKUP = 'backup'
+SECTION_OVERWRITE = 'overwrite'
+SECTION_SCAN = 'scan'
+SECTIONS = (SECTION_BACKUP, SECTION_OVERWRITE, SECTION_SCAN)
+
+_SECTION_HEADER = re.compile(r'^\[\s*([\w-]+)\s*\]$')
+
+
+def _translate(pattern: str) -> str:
+    """Translates the body of a gitignore-style glob to a regex over '/'-separated paths."""
+    result = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith('**/', i):
+            result.append('(?:.*/)?')
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            result.append('.*')
+            i += 2
+            continue
+        if char == '*':
+            result.append('[^/]*')
+        elif char == '?':
+            result.append('[^/]')
+        elif char == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                result.append(re.escape(char))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                result.append(f"[{body.replace(chr(92), chr(92) * 2)}]")
+                i = end
+        elif char == '\\' and i + 1 < len(pattern):
+            i += 1
+            result.append(re.escape(pattern[i]))
+        else:
+            result.append(re.escape(char))
+        i += 1
+    return ''.join(result)
+
+
+def compile_pattern(line: str) -> Optional[Tuple[str, bool, bool]]:
+    """Returns (regex, negated, directory only) for one rule line, or None for blanks and comments."""
+    line = line.rstrip('\n').rstrip()
+    if not line or line.startswith('#'):
+        return None
+
+    negated = line.startswith('!')
+    if negated:
+        line = line[1:]
+    elif line.startswith('\\'):
+        line = line[1:]  # escaped leading '!' or '#'
+
+    directory_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+
+    # Like git, a slash anywhere but the end anchors the pattern to the root
+    anchored = '/' in line
+    body = _translate(line.lstrip('/'))
+    regex = f"^{body}$" if anchored else f"^(?:.*/)?{body}$"
+    return regex, negated, directory_only
+
+
+class IgnoreMatcher:
+    """Compiled rules of one section.
+
+    Without negations every pattern is folded into one regex per kind
+    (files and directories), so a lookup is a single match. With negations
+    the patterns are tried last to first, and the last one that matches wins,
+    as in git. A path is ignored when any of its parent directories is.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, bool, bool]] = ()):
+        self.patterns = list(patterns)
+        self._ordered = [(re.compile(regex), negated, directory_only)
+                         for regex, negated, directory_only in self.patterns]
+        self._has_negation = any(negated for _, negated, _ in self.patterns)
+
+        self._any = None
+        self._file_only = None
+        if not self._has_negation and self.patterns:
+            self._any = re.compile('|'.join(f"(?:{regex})" for regex, _, _ in self.patterns))
+            file_patterns = [regex for regex, _, directory_only in self.patterns if not directory_only]
+            if file_patterns:
+                self._file_only = re.compile('|'.join(f"(?:{regex})" for regex in file_patterns))
+        self._directory_cache: Dict[str, bool] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.patterns)
+
+    def _match(self, path: str, is_dir: bool) -> bool:
+        if not self._has_negation:
+            regex = self._any if is_dir else self._file_only
+            return regex is not None and regex.match(path) is not None
+
+        for regex, negated, directory_only in reversed(self._ordered):
+            if directory_only and not is_dir:
+                continue
+            if regex.match(path):
+                return not negated
+        return False
+
+    def _directory_ignored(self, path: str) -> bool:
+        cached = self._directory_cache.get(path)
+        if cached is None:
+            parent = path.rpartition('/')[0]
+            cached = (bool(parent) and self._directory_ignored(parent)) or self._match(path, True)
+            self._directory_cache[path] = cached
+        return cached
+
+    def matches(self, relative_path: str, is_dir: bool = False) -> bool:
+        """True if the path (relative to the instance or template root) is ignored."""
+        if not self.patterns:
+            return False
+        path = relative_path.replace(os.sep, '/').strip('/')
+        if not path or path == '.':
+            return False
+        if is_dir:
+            return self._directory_ignored(path)
+        parent = path.rpartition('/')[0]
+        if parent and self._directory_ignored(parent):
+            return True
+        return self._match(path, False)
+
+    def filter(self, relative_paths: Iterable[str]) -> List[str]:
+        """The paths that are not ignored."""
+        if not self.patterns:
+            return list(relative_paths)
+        return [relative_path for relative_path in relative_paths if not self.matches(relative_path)]
+
+    def prune(self, relative_root: str, dirs: List[str], files: List[str]) -> List[str]:
+        """Drops ignored directories from an os.walk listing in place and returns the kept files."""
+        if not self.patterns:
+            return files
+        prefix = '' if relative_root in ('', '.') else relative_root + os.sep
+        dirs[:] = [d for d in dirs if not self.matches(prefix + d, is_dir=True)]
+        return [f for f in files if not self.matches(prefix + f)]
+
+
+class IgnoreRules:
+    """Rules from .dotworkignore files, split into backup, overwrite and scan sections.
+
+    The file uses gitignore syntax. Lines before the first section header
+    apply to every section; lines under ``[backup]``, ``[overwrite]`` or
+    ``[scan]`` apply to that operation only.
+    """
+
+    def __init__(self):
+        self.patterns: Dict[str, List[Tuple[str, bool, bool]]] = {section: [] for section in SECTIONS}
+        self._matchers: Dict[str, IgnoreMatcher] = {}
+
+    @classmethod
+    def parse(cls, text: str) -> 'IgnoreRules':
+        rules = cls()
+        sections = SECTIONS
+        for line in text.splitlines():
+            header = _SECTION_HEADER.match(line.strip())
+            if header:
+                name = header.group(1).lower()
+                # Rules under an unknown section are kept out of every section
+                sections = (name,) if name in SECTIONS else ()
+                continue
+            compiled = compile_pattern(line)
+            if compiled is None:
+                continue
+            for section in sections:
+                rules.patterns[section].append(compiled)
+        return rules
+
+    @classmethod
+    def load(cls, directory: str) -> 'IgnoreRules':
+        """Reads the ignore file of a template or instance directory; empty if there is none."""
+        try:
+            with open(os.path.join(directory, IGNORE_FILE), 'r', encoding='utf-8') as f:
+                return cls.parse(f.read())
+        except (FileNotFoundError, NotADirectoryError):
+            return cls()
+
+    def extend(self, other: 'IgnoreRules') -> 'IgnoreRules':
+        """Returns these rules followed by other's, so other can override them with negations."""
+        combined = IgnoreRules()
+        for section in SECTIONS:
+            combined.patterns[section] = self.patterns[section] + other.patterns[section]
+        return combined
+
+    def __bool__(self) -> bool:
+        return any(self.patterns.values())
+
+    def matcher(self, section: str) -> IgnoreMatcher:
+        matcher = self._matchers.get(section)
+        if matcher is None:
+            matcher = self._matchers[section] = IgnoreMatcher(self.patterns[section])
+        return matcher
@@ -13,6 +13,7 @@ class ServerInstance:
     created_at: datetime = field(default_factory=datetime.now)
     updated_at: datetime = field(default_factory=datetime.now)
     version: str = "1.0.0"
+    template_version: Optional[str] = None
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -22,9 +23,21 @@ class ServerInstance:
             'variables': self.variables,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
-            'version': self.version
+            'version': self.version,
+            'template_version': self.template_version
         }
     
+    def derive(self, name: str, path: str, variables: Dict[str, Any]) -> 'ServerInstance':
+        """A new instance at the same template version, e.g. a clone; its timestamps start now."""
+        return ServerInstance(
+            name=name,
+            template_name=self.template_name,
+            path=path,
+            variables=variables,
+            version=self.version,
+            template_version=self.template_version
+        )
+    
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'ServerInstance':
         return cls(
@@ -34,7 +47,8 @@ class ServerInstance:
             variables=data.get('variables', {}),
             created_at=datetime.fromisoformat(data.get('created_at', datetime.now().isoformat())),
             updated_at=datetime.fromisoformat(data.get('updated_at', datetime.now().isoformat())),
-            version=data.get('version', '1.0.0')
+            version=data.get('version', '1.0.0'),
+            template_version=data.get('template_version')
         )
     
     def save_metadata(self):
@@ -1,4 +1,5 @@
-from dataclasses import dataclass, field
+import json
+from dataclasses import dataclass, field, asdict
 from typing import Dict, Any, List
 
 from models.template import Template
@@ -7,7 +8,7 @@ from models.template import Template
 @dataclass
 class FileResult:
     path: str
-    status: str          # Replaced | Skipped | Created | Unchanged | Error
+    status: str          # Replaced | Skipped | Created | Unchanged | Deleted | Drifted | Error
     reason: str          # e.g., "same-hash", "ignore-rule", "user-skip", "permission-denied"
     template: str        # template name or ID
     variables_used: Dict[str, Any]
@@ -19,3 +20,30 @@ class ProvisionResult:
     processed_files: List[FileResult]
 
 
+@dataclass
+class DriftReport:
+    processed_files: List[FileResult] = field(default_factory=list)
+    scanned_instances: int = 0
+    drifted_instances: List[str] = field(default_factory=list)
+    duration: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'scanned_instances': self.scanned_instances,
+            'drifted_instances': self.drifted_instances,
+            'duration': self.duration,
+            'files': [asdict(result) for result in self.processed_files]
+        }
+
+    def to_json(self, indent: int = 2) -> str:
+        return json.dumps(self.to_dict(), indent=indent, ensure_ascii=False, default=str)
+
+
+@dataclass
+class RolloutResult:
+    updated: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    skipped: List[str] = field(default_factory=list)
+    processed_files: List[FileResult] = field(default_factory=list)
+    aborted: bool = False
+    abort_reason: str = ""
@@ -1,9 +1,20 @@
 import os
 import yaml
 import json
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, NamedTuple, Tuple
 from dataclasses import dataclass, field
 
+from models.ignore_rules import IGNORE_FILE, IgnoreRules
+from models.template_package import TemplatePackage
+
+# libyaml's loader parses template configs several times faster when it is available
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+class SourceStat(NamedTuple):
+    st_size: int
+    st_mtime_ns: int
+
 @dataclass
 class TemplateVariable:
     name: str
@@ -20,20 +31,18 @@ class Template:
     description: str
     variables: List[TemplateVariable] = field(default_factory=list)
     version: str = "1.0.0"
+    # Overrides the configured update_mode for this template's files
+    update_mode: Optional[str] = None
+    package: Optional[TemplatePackage] = field(default=None, repr=False, compare=False)
+    ignore_rules: IgnoreRules = field(default_factory=IgnoreRules, repr=False, compare=False)
     
     @classmethod
     def from_directory(cls, template_path: str) -> 'Template':
         if not os.path.exists(template_path):
             raise ValueError(f"Template directory not found: {template_path}")
         
-        config_file = os.path.join(template_path, "template.yml")
-        if not os.path.exists(config_file):
-            config_file = os.path.join(template_path, "template.yaml")
-        
-        if os.path.exists(config_file):
-            with open(config_file, 'r', encoding='utf-8') as f:
-                config = yaml.safe_load(f)
-        else:
+        config = cls.read_config(template_path)
+        if config is None:
             # Create default config if none exists
             config = {
                 'name': os.path.basename(template_path),
@@ -41,11 +50,56 @@ class Template:
                 'variables': []
             }
         
+        template = cls._from_config(config, template_path)
+        template.ignore_rules = IgnoreRules.load(template_path)
+        return template
+    
+    @staticmethod
+    def read_config(template_path: str) -> Optional[Dict[str, Any]]:
+        config_file = os.path.join(template_path, "template.yml")
+        if not os.path.exists(config_file):
+            config_file = os.path.join(template_path, "template.yaml")
+        
+        if not os.path.exists(config_file):
+            return None
+        
+        with open(config_file, 'r', encoding='utf-8') as f:
+            return yaml.load(f, Loader=YAML_LOADER)
+    
+    @classmethod
+    def from_package(cls, package_path: str) -> 'Template':
+        if not os.path.exists(package_path):
+            raise ValueError(f"Template package not found: {package_path}")
+        
+        package = TemplatePackage(package_path)
+        config = package.config or {
+            'name': os.path.splitext(os.path.basename(package_path))[0],
+            'description': f"Template for {os.path.basename(package_path)}",
+            'variables': []
+        }
+        
+        try:
+            template = cls._from_config(config, package_path)
+            template.ignore_rules = IgnoreRules.parse(package.ignore_text)
+        except Exception:
+            package.close()
+            raise
+        template.package = package
+        return template
+    
+    def close(self):
+        """Releases the mapped package of a packed template; directory templates hold nothing open."""
+        if self.package is not None:
+            self.package.close()
+    
+    @classmethod
+    def _from_config(cls, config: Dict[str, Any], template_path: str) -> 'Template':
         template = cls(
             name=config.get('name', os.path.basename(template_path)),
             path=template_path,
             description=config.get('description', ''),
-            version=config.get('version', '1.0.0')
+            version=config.get('version', '1.0.0'),
+            update_mode=config.get('update_mode')
         )
         
         # Parse variables
@@ -62,7 +116,16 @@ class Template:
         
         return template
     
-    def get_files(self) -> List[str]:
+    @property
+    def is_packed(self) -> bool:
+        return self.package is not None
+    
+    def walk_tree(self) -> Tuple[List[str], List[str]]:
+        """Returns the relative directories and files provisioned by this template."""
+        if self.package is not None:
+            return list(self.package.directories), list(self.package.entries)
+        
+        directories = []
         files = []
         for root, dirs, filenames in os.walk(self.path):
             # Skip template config files
@@ -71,9 +134,25 @@ class Template:
             if 'template.yaml' in filenames:
                 filenames.remove('template.yaml')
             
+            relative_root = os.path.relpath(root, self.path)
+            if relative_root == '.' and IGNORE_FILE in filenames:
+                # Template-level ignore rules are read into ignore_rules, not provisioned
+                filenames.remove(IGNORE_FILE)
+            if relative_root != '.':
+                directories.append(relative_root)
+            
             for filename in filenames:
                 file_path = os.path.join(root, filename)
                 relative_path = os.path.relpath(file_path, self.path)
                 files.append(relative_path)
         
-        return files
\ No newline at end of file
+        return directories, files
+    
+    def get_files(self) -> List[str]:
+        return self.walk_tree()[1]
+    
+    def source_stat(self, relative_path: str):
+        if self.package is not None:
+            entry = self.package.entries[relative_path]
+            return SourceStat(entry.size, entry.mtime_ns)
+        return os.stat(os.path.join(self.path, relative_path))
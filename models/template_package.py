@@ -0,0 +1,90 @@
+import os
+import json
+import mmap
+import struct
+from typing import Dict, List, Any, BinaryIO, Callable, Optional
+from dataclasses import dataclass
+
+PACKAGE_EXTENSION = '.dwt'
+PACKAGE_MAGIC = b'DWTPACK1'
+# magic, index offset, index length
+PACKAGE_HEADER = struct.Struct('<8sQQ')
+COPY_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+@dataclass
+class PackageEntry:
+    path: str
+    offset: int
+    size: int
+    hash: str
+    placeholders: bool
+    mode: int
+    mtime_ns: int
+
+
+class TemplatePackage:
+    """Read-only view of a packed template.
+
+    Layout: a fixed header, the raw member data back to back, then a JSON index
+    holding the template config, the directory list and one entry per member
+    (offset, size, hash, placeholder flag). Members are served from a single
+    mmap of the package, so nothing is extracted.
+    """
+
+    def __init__(self, package_path: str):
+        self.path = package_path
+        self._file = open(package_path, 'rb')
+        try:
+            header = self._file.read(PACKAGE_HEADER.size)
+            if len(header) != PACKAGE_HEADER.size:
+                raise ValueError(f"Not a template package: {package_path}")
+            magic, index_offset, index_length = PACKAGE_HEADER.unpack(header)
+            if magic != PACKAGE_MAGIC:
+                raise ValueError(f"Not a template package: {package_path}")
+
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            index = json.loads(self._mmap[index_offset:index_offset + index_length].decode('utf-8'))
+        except Exception:
+            self._file.close()
+            raise
+
+        self.config: Dict[str, Any] = index.get('template', {})
+        self.ignore_text: str = index.get('ignore', '')
+        self.algorithm: str = index['algorithm']
+        # Paths are stored with '/' and served with the native separator
+        self.directories: List[str] = [
+            directory.replace('/', os.sep) for directory in index.get('directories', [])
+        ]
+        self.entries: Dict[str, PackageEntry] = {}
+        for entry in index.get('entries', []):
+            relative_path = entry['path'].replace('/', os.sep)
+            self.entries[relative_path] = PackageEntry(**dict(entry, path=relative_path))
+
+    def read(self, relative_path: str) -> bytes:
+        entry = self.entries[relative_path]
+        return self._mmap[entry.offset:entry.offset + entry.size]
+
+    def copy_to(self, relative_path: str, dest: BinaryIO):
+        entry = self.entries[relative_path]
+        with memoryview(self._mmap) as view:
+            position = entry.offset
+            end = entry.offset + entry.size
+            while position < end:
+                chunk_end = min(position + COPY_CHUNK_SIZE, end)
+                dest.write(view[position:chunk_end])
+                position = chunk_end
+
+    def extract_file(self, relative_path: str, dest_path: str,
+                     wrap: Optional[Callable[[BinaryIO], BinaryIO]] = None):
+        """Writes a member to dest_path; wrap can put a file-like layer (e.g. rate limiting) over the output."""
+        entry = self.entries[relative_path]
+        with open(dest_path, 'wb') as f:
+            self.copy_to(relative_path, wrap(f) if wrap else f)
+        os.chmod(dest_path, entry.mode & 0o7777)
+        os.utime(dest_path, ns=(entry.mtime_ns, entry.mtime_ns))
+
+    def close(self):
+        """Unmaps the package and closes its file; safe to call more than once."""
+        self._mmap.close()
+        self._file.close()
@@ -0,0 +1,102 @@
+import os
+import json
+from typing import Dict, List, Tuple, Any, Optional
+from dataclasses import dataclass, field
+
+
+@dataclass
+class TemplateDelta:
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    renamed: List[Tuple[str, str]] = field(default_factory=list)  # (old path, new path)
+
+    def is_empty(self) -> bool:
+        return not (self.added or self.changed or self.removed or self.renamed)
+
+    def touched_paths(self) -> set:
+        paths = set(self.added) | set(self.changed) | set(self.removed)
+        for old_path, new_path in self.renamed:
+            paths.add(old_path)
+            paths.add(new_path)
+        return paths
+
+
+@dataclass
+class TemplateSnapshot:
+    """Manifest of a template version: relative path -> source content hash."""
+    template_name: str
+    version: str
+    algorithm: str
+    files: Dict[str, str] = field(default_factory=dict)
+    # relative path -> [size, mtime_ns] of the source when it was hashed
+    stats: Dict[str, List[int]] = field(default_factory=dict)
+    # The template changed under this version after the manifest was recorded, so
+    # instances of the version may hold either content and can't be updated by delta
+    edited: bool = False
+
+    def diff(self, newer: 'TemplateSnapshot') -> TemplateDelta:
+        delta = TemplateDelta()
+
+        for path, digest in newer.files.items():
+            old_digest = self.files.get(path)
+            if old_digest is None:
+                delta.added.append(path)
+            elif old_digest != digest:
+                delta.changed.append(path)
+
+        delta.removed = [path for path in self.files if path not in newer.files]
+
+        # Pair removed and added files with identical content as renames
+        removed_by_hash: Dict[str, List[str]] = {}
+        for path in delta.removed:
+            removed_by_hash.setdefault(self.files[path], []).append(path)
+
+        for path in list(delta.added):
+            candidates = removed_by_hash.get(newer.files[path])
+            if candidates:
+                old_path = candidates.pop()
+                delta.renamed.append((old_path, path))
+                delta.added.remove(path)
+                delta.removed.remove(old_path)
+
+        return delta
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'template_name': self.template_name,
+            'version': self.version,
+            'algorithm': self.algorithm,
+            'files': self.files,
+            'stats': self.stats,
+            'edited': self.edited
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'TemplateSnapshot':
+        return cls(
+            template_name=data['template_name'],
+            version=data['version'],
+            algorithm=data['algorithm'],
+            files=data.get('files', {}),
+            stats=data.get('stats', {}),
+            edited=data.get('edited', False)
+        )
+
+    def save(self, snapshot_file: str):
+        os.makedirs(os.path.dirname(snapshot_file), exist_ok=True)
+        temp_file = snapshot_file + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+        os.replace(temp_file, snapshot_file)
+
+    @classmethod
+    def load(cls, snapshot_file: str) -> Optional['TemplateSnapshot']:
+        if not os.path.exists(snapshot_file):
+            return None
+
+        try:
+            with open(snapshot_file, 'r', encoding='utf-8') as f:
+                return cls.from_dict(json.load(f))
+        except (json.JSONDecodeError, KeyError):
+            return None
@@ -0,0 +1,63 @@
+import os
+from typing import Dict, Iterable
+
+import pytest
+
+from core.template_manager import TemplateManager
+from utils.config import ConfigManager
+
+TEMPLATE_NAME = "paper"
+TEMPLATE_CONFIG = """name: "{name}"
+description: "Test template"
+version: "{version}"
+variables:
+  - name: "server_port"
+    type: "port"
+    description: "Server port"
+    required: true
+"""
+
+
+class Workspace:
+    """A config with its own templates, instances and backups directories under one root."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.templates_dir = os.path.join(root, "templates")
+        self.instances_dir = os.path.join(root, "instances")
+        self.template_dir = os.path.join(self.templates_dir, TEMPLATE_NAME)
+        os.makedirs(self.template_dir)
+        self.config_file = os.path.join(root, "config.yml")
+        with open(self.config_file, "w", encoding="utf-8") as f:
+            f.write(f"templates_dir: {self.templates_dir}\n"
+                    f"default_output_dir: {self.instances_dir}\n"
+                    f"instances_dir: {self.instances_dir}\n"
+                    f"backup_dir: {os.path.join(root, 'backups')}\n"
+                    "auto_backup: false\n")
+
+    def write_template(self, version: str, files: Dict[str, str], directories: Iterable[str] = ()):
+        with open(os.path.join(self.template_dir, "template.yml"), "w", encoding="utf-8") as f:
+            f.write(TEMPLATE_CONFIG.format(name=TEMPLATE_NAME, version=version))
+        for relative_path, content in files.items():
+            path = os.path.join(self.template_dir, relative_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
+        for directory in directories:
+            os.makedirs(os.path.join(self.template_dir, directory), exist_ok=True)
+
+    def manager(self) -> TemplateManager:
+        # A fresh manager, as a new process would see the tree
+        return TemplateManager(config_manager=ConfigManager(self.config_file))
+
+
+@pytest.fixture(autouse=True)
+def work_dir(tmp_path, monkeypatch):
+    # Logs and the default instance search paths are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def workspace(tmp_path) -> Workspace:
+    return Workspace(str(tmp_path / "workspace"))
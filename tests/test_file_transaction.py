@@ -0,0 +1,125 @@
+import json
+import os
+
+import pytest
+
+import core.file_transaction as file_transaction
+from core.file_transaction import JOURNAL_FILE, STAGING_DIR, FileTransaction
+from core.instance_discovery import recover_instance
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = str(tmp_path / "instance")
+    write(os.path.join(root, "server.properties"), "port=1\n")
+    write(os.path.join(root, "plugins", "old.yml"), "old")
+    return root
+
+
+def stage(transaction, relative_path, content):
+    write(transaction.stage(relative_path), content)
+
+
+def interrupted_commit(root, monkeypatch):
+    """Commits a transaction that dies after swapping in its first file, leaving the journal behind."""
+    apply_entries = file_transaction._apply_entries
+
+    def apply_first(root, new_path, entries):
+        apply_entries(root, new_path, entries[:1])
+        raise KeyboardInterrupt  # not caught by commit, like the process going away
+
+    monkeypatch.setattr(file_transaction, "_apply_entries", apply_first)
+    transaction = FileTransaction(root)
+    stage(transaction, "server.properties", "port=2\n")
+    stage(transaction, os.path.join("config", "new.yml"), "new")
+    transaction.remove(os.path.join("plugins", "old.yml"))
+    with pytest.raises(KeyboardInterrupt):
+        transaction.commit()
+    monkeypatch.setattr(file_transaction, "_apply_entries", apply_entries)
+
+
+def test_commit_swaps_files_in_and_cleans_up(root):
+    with FileTransaction(root) as transaction:
+        stage(transaction, "server.properties", "port=2\n")
+        transaction.remove(os.path.join("plugins", "old.yml"))
+        transaction.commit()
+
+    assert read(os.path.join(root, "server.properties")) == "port=2\n"
+    assert not os.path.exists(os.path.join(root, "plugins", "old.yml"))
+    assert not os.path.exists(os.path.join(root, STAGING_DIR))
+    assert not os.path.exists(os.path.join(root, JOURNAL_FILE))
+
+
+def test_exception_before_commit_leaves_instance_untouched(root):
+    with pytest.raises(RuntimeError):
+        with FileTransaction(root) as transaction:
+            stage(transaction, "server.properties", "port=2\n")
+            raise RuntimeError("render failed")
+
+    assert read(os.path.join(root, "server.properties")) == "port=1\n"
+    assert not os.path.exists(os.path.join(root, STAGING_DIR))
+
+
+def test_recover_rolls_interrupted_commit_forward(root, monkeypatch):
+    interrupted_commit(root, monkeypatch)
+    assert os.path.exists(os.path.join(root, JOURNAL_FILE))
+
+    assert FileTransaction.recover(root) == "rolled-forward"
+
+    assert read(os.path.join(root, "server.properties")) == "port=2\n"
+    assert read(os.path.join(root, "config", "new.yml")) == "new"
+    assert not os.path.exists(os.path.join(root, "plugins", "old.yml"))
+    assert not os.path.exists(os.path.join(root, JOURNAL_FILE))
+    assert not os.path.exists(os.path.join(root, STAGING_DIR))
+
+
+def test_recover_rolls_interrupted_commit_back(root, monkeypatch):
+    interrupted_commit(root, monkeypatch)
+
+    assert FileTransaction.recover(root, roll_forward=False) == "rolled-back"
+
+    assert read(os.path.join(root, "server.properties")) == "port=1\n"
+    assert read(os.path.join(root, "plugins", "old.yml")) == "old"
+    assert not os.path.exists(os.path.join(root, "config", "new.yml"))
+    assert not os.path.exists(os.path.join(root, JOURNAL_FILE))
+
+
+def test_recover_discards_journal_that_never_became_valid(root):
+    write(os.path.join(root, JOURNAL_FILE), "{truncated")
+
+    assert FileTransaction.recover(root) is None
+
+    assert read(os.path.join(root, "server.properties")) == "port=1\n"
+    assert not os.path.exists(os.path.join(root, JOURNAL_FILE))
+
+
+def test_discovery_recovers_interrupted_commit(root, monkeypatch):
+    interrupted_commit(root, monkeypatch)
+    assert not FileTransaction.is_committing(root)
+
+    recover_instance(root)
+
+    assert read(os.path.join(root, "server.properties")) == "port=2\n"
+    assert not os.path.exists(os.path.join(root, JOURNAL_FILE))
+
+
+def test_discovery_leaves_commit_of_live_process_alone(root):
+    # Journal of a commit another running process is still applying
+    write(os.path.join(root, JOURNAL_FILE),
+          json.dumps({"state": file_transaction.STATE_COMMITTING, "pid": os.getppid(), "entries": []}))
+    assert FileTransaction.is_committing(root)
+
+    recover_instance(root)
+
+    assert os.path.exists(os.path.join(root, JOURNAL_FILE))
@@ -0,0 +1,152 @@
+import threading
+import time
+
+import pytest
+
+from core.copy_engine import CopyEngine
+from core.scheduler import (JOB_DONE, JOB_PAUSED, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE,
+                            PRIORITY_NORMAL, JobScheduler, checkpoint, parse_priority)
+
+TIMEOUT = 10
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = JobScheduler(workers=1, interactive_workers=1)
+    yield scheduler
+    scheduler.shutdown()
+
+
+def wait_for(condition, timeout=TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, PRIORITY_NORMAL),
+    ("interactive", PRIORITY_INTERACTIVE),
+    (PRIORITY_BACKGROUND, PRIORITY_BACKGROUND),
+])
+def test_parse_priority(value, expected):
+    assert parse_priority(value) == expected
+
+
+def test_parse_priority_rejects_unknown_names():
+    with pytest.raises(ValueError):
+        parse_priority("urgent")
+
+
+def test_checkpoint_outside_a_job_does_nothing():
+    checkpoint()
+
+
+def test_jobs_of_one_instance_run_one_at_a_time():
+    scheduler = JobScheduler(workers=2, interactive_workers=0)
+    running = []
+    overlapped = []
+
+    def job():
+        running.append(1)
+        overlapped.append(len(running) > 1)
+        time.sleep(0.05)
+        running.pop()
+
+    try:
+        jobs = [scheduler.submit("update", job, instance="lobby") for _ in range(3)]
+        for item in jobs:
+            item.future.result(TIMEOUT)
+    finally:
+        scheduler.shutdown()
+    assert overlapped == [False, False, False]
+
+
+def test_normal_job_pauses_for_interactive_work_and_resumes(scheduler):
+    normal_started = threading.Event()
+    reach_checkpoint = threading.Event()
+    interactive_started = threading.Event()
+    finish_interactive = threading.Event()
+    order = []
+
+    def normal():
+        normal_started.set()
+        reach_checkpoint.wait(TIMEOUT)
+        checkpoint()
+        order.append("normal")
+
+    def interactive():
+        interactive_started.set()
+        finish_interactive.wait(TIMEOUT)
+        order.append("interactive")
+
+    normal_job = scheduler.submit("update", normal, PRIORITY_NORMAL)
+    assert normal_started.wait(TIMEOUT)
+    scheduler.submit("create", interactive, PRIORITY_INTERACTIVE)
+    assert interactive_started.wait(TIMEOUT)
+
+    reach_checkpoint.set()
+    wait_for(lambda: normal_job.status == JOB_PAUSED)
+    assert order == []
+
+    finish_interactive.set()
+    normal_job.future.result(TIMEOUT)
+    assert order == ["interactive", "normal"]
+    assert normal_job.yields == 1
+    assert normal_job.status == JOB_DONE
+
+
+def test_interactive_job_does_not_pause_itself(scheduler):
+    def interactive():
+        checkpoint()
+        return "done"
+
+    job = scheduler.submit("create", interactive, PRIORITY_INTERACTIVE)
+
+    assert job.future.result(TIMEOUT) == "done"
+    assert job.yields == 0
+
+
+def test_shared_copy_engine_does_not_deadlock_when_a_job_pauses(scheduler):
+    # Regression: pool threads used to pause at checkpoints on behalf of the normal job,
+    # holding every copy worker while the interactive job queued its files behind them
+    engine = CopyEngine(max_workers=2)
+    first_wave_started = threading.Event()
+    release_first_wave = threading.Event()
+    interactive_started = threading.Event()
+    copied = []
+    jobs = {}
+
+    def slow_copy(relative_path):
+        first_wave_started.set()
+        release_first_wave.wait(TIMEOUT)
+        copied.append(relative_path)
+        return relative_path
+
+    def normal():
+        files = [(f"world/region-{index}.mca", 1) for index in range(32)]
+        return engine.run(files, slow_copy)[0]
+
+    def interactive():
+        interactive_started.set()
+        # Copy only once the normal job gave way, which it does between waves
+        wait_for(lambda: jobs["normal"].status == JOB_PAUSED)
+        files = [(f"config-{index}.yml", 1) for index in range(16)]
+        return engine.run(files, lambda relative_path: relative_path)[0]
+
+    try:
+        normal_job = jobs["normal"] = scheduler.submit("update", normal, PRIORITY_NORMAL)
+        assert first_wave_started.wait(TIMEOUT)
+        interactive_job = scheduler.submit("create", interactive, PRIORITY_INTERACTIVE)
+        assert interactive_started.wait(TIMEOUT)
+        release_first_wave.set()
+
+        assert len(interactive_job.future.result(TIMEOUT)) == 16
+        assert len(normal_job.future.result(TIMEOUT)) == 32
+    finally:
+        # Stopping releases paused checkpoints, so a deadlock fails the test instead of hanging it
+        scheduler.shutdown(wait=False)
+        release_first_wave.set()
+        engine.shutdown()
+    assert normal_job.yields == 1
+    assert len(copied) == 32
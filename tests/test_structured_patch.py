@@ -0,0 +1,102 @@
+import pytest
+
+from core.structured_patch import FORMAT_PROPERTIES, FORMAT_YAML, PatchError, parse_keys, patch_format, patch_text
+
+PROPERTIES_V1 = "# Server\nserver-port=25565\nmotd=Hello\nold-key=1\n"
+PROPERTIES_V2 = "# Server\nserver-port=25570\nmotd=Hello\n"
+# Edited by an operator: comment, motd and an extra key
+PROPERTIES_LIVE = "# Server\n# tuned by ops\nserver-port=25565\nmotd=Welcome\nold-key=1\nview-distance : 12\n"
+
+YAML_V1 = "server:\n  port: 25565  # game port\n  motd: Hello\nworlds: [a, b]\n"
+YAML_V2 = "server:\n  port: 25570  # game port\n  motd: Hello\nworlds: [a, b]\n"
+YAML_LIVE = "# ops\nserver:\n  port: 25565  # game port\n  motd: Welcome\nworlds: [a, b]\n"
+
+
+@pytest.mark.parametrize("path, expected", [
+    ("server.properties", FORMAT_PROPERTIES),
+    ("plugins/Essentials/config.YML", FORMAT_YAML),
+    ("bukkit.yaml", FORMAT_YAML),
+    ("eula.txt", None),
+])
+def test_patch_format_by_extension(path, expected):
+    assert patch_format(path) == expected
+
+
+def test_parse_properties_keys():
+    text = "# comment\n! also a comment\nport=1\nmotd : Hi there\nname value\nlong=a\\\n  b\n"
+
+    assert parse_keys(FORMAT_PROPERTIES, text) == {
+        "port": "1", "motd": "Hi there", "name": "value", "long": "ab"
+    }
+
+
+def test_parse_yaml_keys_are_flattened_paths():
+    assert parse_keys(FORMAT_YAML, YAML_V1) == {
+        '["server", "port"]': 25565,
+        '["server", "motd"]': "Hello",
+        '["worlds"]': ["a", "b"],
+    }
+
+
+def test_properties_patch_keeps_local_edits():
+    patched, changed, rendered_keys = patch_text(
+        FORMAT_PROPERTIES, PROPERTIES_LIVE, PROPERTIES_V2, parse_keys(FORMAT_PROPERTIES, PROPERTIES_V1))
+
+    assert patched == ("# Server\n# tuned by ops\nserver-port=25570\nmotd=Welcome\n"
+                       "view-distance : 12\n")
+    # old-key still had the rendered value, so it goes with the template
+    assert changed == ["server-port", "old-key"]
+    assert rendered_keys == {"server-port": "25570", "motd": "Hello"}
+
+
+def test_properties_patch_keeps_removed_key_the_operator_changed():
+    live = PROPERTIES_LIVE.replace("old-key=1", "old-key=2")
+
+    patched, changed, _ = patch_text(
+        FORMAT_PROPERTIES, live, PROPERTIES_V2, parse_keys(FORMAT_PROPERTIES, PROPERTIES_V1))
+
+    assert "old-key=2\n" in patched
+    assert changed == ["server-port"]
+
+
+def test_properties_patch_without_base_writes_every_rendered_key():
+    patched, changed, _ = patch_text(FORMAT_PROPERTIES, PROPERTIES_LIVE, PROPERTIES_V2, None)
+
+    assert changed == ["server-port", "motd"]
+    assert "motd=Hello\n" in patched
+    assert "old-key=1\n" in patched
+
+
+def test_properties_patch_with_nothing_to_change_returns_live_text():
+    live = PROPERTIES_LIVE.replace("25565", "25570").replace("old-key=1", "old-key=2")
+
+    patched, changed, _ = patch_text(
+        FORMAT_PROPERTIES, live, PROPERTIES_V2, parse_keys(FORMAT_PROPERTIES, PROPERTIES_V1))
+
+    assert patched == live
+    assert changed == []
+
+
+def test_yaml_patch_keeps_comments_and_local_edits():
+    patched, changed, _ = patch_text(FORMAT_YAML, YAML_LIVE, YAML_V2, parse_keys(FORMAT_YAML, YAML_V1))
+
+    assert patched == "# ops\nserver:\n  port: 25570  # game port\n  motd: Welcome\nworlds: [a, b]\n"
+    assert changed == ["server.port"]
+
+
+def test_yaml_patch_adds_new_nested_key():
+    base = "server:\n  port: 25565\n  motd: Hello\n"
+    rendered = "server:\n  port: 25565\n  motd: Hello\n  max: 20\n"
+    live = "server:\n  port: 25565\n  motd: Hi\n"
+
+    patched, changed, _ = patch_text(FORMAT_YAML, live, rendered, parse_keys(FORMAT_YAML, base))
+
+    assert patched == "server:\n  port: 25565\n  motd: Hi\n  max: 20\n"
+    assert changed == ["server.max"]
+
+
+def test_yaml_flow_mapping_cannot_be_patched():
+    base = "server: {port: 25565, motd: Hello}\n"
+
+    with pytest.raises(PatchError):
+        patch_text(FORMAT_YAML, base, base.replace("25565", "25570"), parse_keys(FORMAT_YAML, base))
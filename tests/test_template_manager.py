@@ -0,0 +1,87 @@
+import os
+
+from models.instance import ServerInstance
+
+V1_FILES = {
+    "server.properties": "server-port={{ server_port }}\nmotd=Hello\n",
+    "eula.txt": "eula=true\n",
+    "plugins/old-name.yml": "enabled: true\n",
+    "plugins/edited.yml": "enabled: true\n",
+}
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def write(path, content):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def rename_in_template(workspace, old_path, new_path):
+    os.replace(os.path.join(workspace.template_dir, old_path), os.path.join(workspace.template_dir, new_path))
+
+
+def results_by_path(instance, result):
+    return {os.path.relpath(item.path, instance.path).replace(os.sep, "/"): (item.status, item.reason)
+            for item in result.processed_files}
+
+
+def test_create_instance_renders_variables(workspace):
+    workspace.write_template("1", V1_FILES, directories=["world"])
+    manager = workspace.manager()
+
+    instance = manager.create_instance(manager.get_template_by_name("paper"), "lobby", workspace.instances_dir,
+                                       {"server_port": 25565})
+
+    assert read(os.path.join(instance.path, "server.properties")).splitlines() == ["server-port=25565", "motd=Hello"]
+    assert os.path.isdir(os.path.join(instance.path, "world"))
+    assert ServerInstance.load_from_path(instance.path).variables == {"server_port": 25565}
+
+
+def test_delta_update_with_renames_and_local_edits(workspace):
+    workspace.write_template("1", V1_FILES)
+    manager = workspace.manager()
+    instance = manager.create_instance(manager.get_template_by_name("paper"), "lobby", workspace.instances_dir,
+                                       {"server_port": 25565})
+    # Local edits: one to a file the template leaves alone, one to a file it renames
+    write(os.path.join(instance.path, "eula.txt"), "eula=false\n")
+    write(os.path.join(instance.path, "plugins", "edited.yml"), "enabled: false\n")
+
+    rename_in_template(workspace, os.path.join("plugins", "old-name.yml"), os.path.join("plugins", "new-name.yml"))
+    rename_in_template(workspace, os.path.join("plugins", "edited.yml"), os.path.join("plugins", "renamed.yml"))
+    workspace.write_template("2", {"motd.txt": "Welcome\n"})
+
+    manager = workspace.manager()
+    instance = ServerInstance.load_from_path(instance.path)
+    result = manager.update_instance_from_template(instance)
+    results = results_by_path(instance, result)
+
+    # An unmodified copy moves with the rename
+    assert results["plugins/new-name.yml"] == ("Replaced", "template-renamed")
+    assert results["plugins/old-name.yml"] == ("Deleted", "template-renamed")
+    assert not os.path.exists(os.path.join(instance.path, "plugins", "old-name.yml"))
+    assert read(os.path.join(instance.path, "plugins", "new-name.yml")) == "enabled: true\n"
+
+    # An edited copy stays where it is and the new path gets a fresh one
+    assert results["plugins/edited.yml"] == ("Skipped", "local-edit")
+    assert read(os.path.join(instance.path, "plugins", "edited.yml")) == "enabled: false\n"
+    assert read(os.path.join(instance.path, "plugins", "renamed.yml")) == "enabled: true\n"
+
+    # Files outside the delta are not even looked at
+    assert results["eula.txt"] == ("Unchanged", "not-in-delta")
+    assert read(os.path.join(instance.path, "eula.txt")) == "eula=false\n"
+    assert results["motd.txt"][0] == "Replaced"
+
+
+def test_second_update_without_template_changes_writes_nothing(workspace):
+    workspace.write_template("1", V1_FILES)
+    manager = workspace.manager()
+    instance = manager.create_instance(manager.get_template_by_name("paper"), "lobby", workspace.instances_dir,
+                                       {"server_port": 25565})
+
+    result = workspace.manager().update_instance_from_template(ServerInstance.load_from_path(instance.path))
+
+    assert {item.status for item in result.processed_files} == {"Unchanged"}
@@ -1,8 +1,10 @@
 import os
 import json
+import threading
+import weakref
 import yaml
-from typing import Dict, Any, Optional
-from dataclasses import dataclass, asdict
+from typing import Dict, Any, Optional, Callable, List, Set
+from dataclasses import dataclass, asdict, field, fields
 from pathlib import Path
 
 @dataclass
@@ -13,7 +15,50 @@ class AppConfig:
     auto_backup: bool = True
     backup_dir: str = "backups"
     max_backups: int = 5
+    # Grandfather-father-son retention on top of max_backups; 0 disables a rule
+    backup_keep_hourly: int = 0
+    backup_keep_daily: int = 0
+    backup_keep_weekly: int = 0
+    backup_keep_monthly: int = 0
+    backup_max_instance_mb: float = 0
+    backup_max_total_mb: float = 0
+    # Background verification of backup archives
+    scrub_enabled: bool = True
+    scrub_interval_hours: float = 24
+    scrub_mb_per_s: float = 20
+    scrub_workers: int = 1
+    # Port variables that instances share on purpose (e.g. a common database) and never conflict
+    shared_port_variables: List[str] = field(default_factory=lambda: ["db_port"])
     log_level: str = "INFO"
+    log_max_bytes: int = 10 * 1024 * 1024
+    log_backup_count: int = 5
+    log_max_age_days: float = 7
+    hash_algorithm: str = "blake2b"
+    # Threads used to copy and render template files, 0 picks one from the CPU count
+    copy_workers: int = 0
+    # "patch" applies only changed keys to .properties/.yml files on update, "overwrite" rewrites them
+    update_mode: str = "overwrite"
+    # Disk I/O caps for copies, renders, backups and restores, shared by all jobs; 0 is unlimited
+    io_read_mb_per_s: float = 0
+    io_write_mb_per_s: float = 0
+    io_read_iops: int = 0
+    io_write_iops: int = 0
+    # "low" or "idle" lowers the process I/O priority on Linux, "" leaves it alone
+    io_priority: str = ""
+    # Threads that run scheduled jobs (updates, backups, scrubs); one more is kept for interactive jobs
+    scheduler_workers: int = 2
+    agent_url: str = ""
+    agent_host: str = "127.0.0.1"
+    agent_port: int = 8765
+    agent_db: str = "agent.db"
+    # Per-install secret the agent requires on its API; created by the agent on first start
+    agent_token_file: str = "agent.token"
+    metrics_textfile: str = ""
+    rollout_canary_count: int = 1
+    rollout_batch_size: int = 10
+    rollout_concurrency: int = 4
+    rollout_max_failure_rate: float = 0.2
+    rollout_pause_seconds: float = 0.0
     
     @classmethod
     def load(cls, config_file: str = "config.yml") -> 'AppConfig':
@@ -25,7 +70,8 @@ class AppConfig:
                     else:
                         data = yaml.safe_load(f) or {}
                 
-                return cls(**{k: v for k, v in data.items() if hasattr(cls, k)})
+                known = {f.name for f in fields(cls)}
+                return cls(**{k: v for k, v in data.items() if k in known})
             except Exception as e:
                 print(f"Error loading config: {e}")
         
@@ -51,23 +97,83 @@ class AppConfig:
         for dir_path in [self.templates_dir, self.instances_dir, self.backup_dir]:
             os.makedirs(dir_path, exist_ok=True)
 
+# Called with the set of config keys whose values changed
+ConfigListener = Callable[[Set[str]], None]
+
+
 class ConfigManager:
     def __init__(self, config_file: str = "config.yml"):
         self.config_file = config_file
         self.config = AppConfig.load(config_file)
+        self._listeners: List[Any] = []
+        self._lock = threading.RLock()
         
     def get_config(self) -> AppConfig:
         return self.config
     
-    def update_config(self, **kwargs):
-        for key, value in kwargs.items():
-            if hasattr(self.config, key):
+    def add_listener(self, listener: ConfigListener):
+        """Registers a change listener. Bound methods are held weakly so owners can be garbage collected."""
+        with self._lock:
+            if hasattr(listener, '__self__'):
+                self._listeners.append(weakref.WeakMethod(listener))
+            else:
+                self._listeners.append(lambda: listener)
+    
+    def remove_listener(self, listener: ConfigListener):
+        with self._lock:
+            self._listeners = [ref for ref in self._listeners if ref() not in (None, listener)]
+    
+    def _apply(self, values: Dict[str, Any]) -> Set[str]:
+        # Values are assigned in place so everyone holding this AppConfig sees them
+        changed = set()
+        for key, value in values.items():
+            if hasattr(self.config, key) and getattr(self.config, key) != value:
                 setattr(self.config, key, value)
-        self.save_config()
+                changed.add(key)
+        return changed
+    
+    def _notify(self, changed: Set[str]):
+        if not changed:
+            return
+        with self._lock:
+            listeners = [ref() for ref in self._listeners]
+            self._listeners = [ref for ref, listener in zip(self._listeners, listeners) if listener is not None]
+        for listener in listeners:
+            if listener is not None:
+                listener(set(changed))
+    
+    def update_config(self, **kwargs):
+        with self._lock:
+            changed = self._apply(kwargs)
+            self.save_config()
+        self._notify(changed)
     
     def save_config(self):
         self.config.save(self.config_file)
     
+    def reload(self):
+        """Re-reads the config file, notifying listeners of any keys that changed on disk."""
+        with self._lock:
+            changed = self._apply(asdict(AppConfig.load(self.config_file)))
+        self._notify(changed)
+    
     def reset_to_defaults(self):
-        self.config = AppConfig()
-        self.save_config()
\ No newline at end of file
+        with self._lock:
+            changed = self._apply(asdict(AppConfig()))
+            self.save_config()
+        self._notify(changed)
+
+
+_config_managers: Dict[str, ConfigManager] = {}
+_config_managers_lock = threading.Lock()
+
+
+def get_config_manager(config_file: str = "config.yml") -> ConfigManager:
+    """Returns the process-wide ConfigManager for config_file, loading it on first use."""
+    key = os.path.abspath(config_file)
+    with _config_managers_lock:
+        manager = _config_managers.get(key)
+        if manager is None:
+            manager = ConfigManager(config_file)
+            _config_managers[key] = manager
+        return manager
@@ -1,64 +1,192 @@
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, Optional
+
+# Structured fields copied from a record into its JSON line
+EVENT_FIELDS = ('operation', 'operation_id', 'instance', 'file', 'duration_ms')
+
+# Operation the current thread is working on, see Logger.operation()
+_current_operation: contextvars.ContextVar = contextvars.ContextVar('dotwork_operation', default=None)
+
+
+class OperationFilter(logging.Filter):
+    """Stamps records with the id and fields of the operation they were logged in."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        operation = _current_operation.get()
+        if operation is not None:
+            fields = dict(getattr(record, 'fields', None) or {})
+            for key, value in operation.items():
+                if key in EVENT_FIELDS:
+                    if getattr(record, key, None) is None:
+                        setattr(record, key, value)
+                else:
+                    fields.setdefault(key, value)
+            record.fields = fields
+        return True
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for key in EVENT_FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                event[key] = value
+        event.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            event['exception'] = self.formatException(record.exc_info)
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+class SizeAndAgeRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotates when the file grows past max_bytes or gets older than max_age_seconds."""
+
+    def __init__(self, filename: str, max_bytes: int, backup_count: int, max_age_seconds: float):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.max_age_seconds = max_age_seconds
+        self.opened_at = self._file_created_at()
+
+    def _file_created_at(self) -> float:
+        # The first event in the file tells how old it is, even across restarts
+        try:
+            with open(self.baseFilename, 'r', encoding='utf-8') as f:
+                first_line = f.readline()
+            if first_line:
+                return datetime.fromisoformat(json.loads(first_line)['time']).timestamp()
+        except (OSError, ValueError, KeyError):
+            pass
+        return time.time()
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.max_age_seconds and time.time() - self.opened_at >= self.max_age_seconds:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        self.opened_at = time.time()
+
 
 class Logger:
     _instance: Optional['Logger'] = None
-    
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
         return cls._instance
-    
+
     def __init__(self):
         if not hasattr(self, 'initialized'):
             self.logger = logging.getLogger('DotworkBootstrapper')
+            self.logger.propagate = False
+            self.listener: Optional[logging.handlers.QueueListener] = None
             self.setup_logger()
+            atexit.register(self.shutdown)
             self.initialized = True
-    
-    def setup_logger(self, log_level: str = "INFO", log_file: str = None):
+
+    def setup_logger(self, log_level: str = "INFO", log_file: str = None, max_bytes: int = 10 * 1024 * 1024,
+                     backup_count: int = 5, max_age_days: float = 7):
         self.logger.setLevel(getattr(logging, log_level.upper(), logging.INFO))
-        
+
         # Clear existing handlers
+        self.shutdown()
         self.logger.handlers.clear()
-        
+        self.logger.filters.clear()
+
         # Console handler
         console_handler = logging.StreamHandler()
         console_formatter = logging.Formatter(
             '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
         )
         console_handler.setFormatter(console_formatter)
-        self.logger.addHandler(console_handler)
-        
-        # File handler
+
+        # File handler, one JSON event per line
         if log_file is None:
             log_dir = "logs"
             os.makedirs(log_dir, exist_ok=True)
-            log_file = os.path.join(log_dir, f"dotwork_{datetime.now().strftime('%Y%m%d')}.log")
-        
-        file_handler = logging.FileHandler(log_file, encoding='utf-8')
-        file_formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(funcName)s:%(lineno)d - %(message)s'
+            log_file = os.path.join(log_dir, "dotwork.jsonl")
+
+        file_handler = SizeAndAgeRotatingFileHandler(log_file, max_bytes, backup_count, max_age_days * 86400)
+        file_handler.setFormatter(JsonLinesFormatter())
+
+        # Callers only enqueue records; a background thread does the formatting and I/O
+        log_queue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(OperationFilter())
+        self.logger.addHandler(queue_handler)
+        self.listener = logging.handlers.QueueListener(
+            log_queue, console_handler, file_handler, respect_handler_level=True
         )
-        file_handler.setFormatter(file_formatter)
-        self.logger.addHandler(file_handler)
-    
-    def info(self, message: str):
-        self.logger.info(message)
-    
-    def warning(self, message: str):
-        self.logger.warning(message)
-    
-    def error(self, message: str):
-        self.logger.error(message)
-    
-    def debug(self, message: str):
-        self.logger.debug(message)
-    
-    def critical(self, message: str):
-        self.logger.critical(message)
+        self.listener.start()
+
+    def configure(self, config):
+        """Applies the log_* settings of an AppConfig."""
+        self.setup_logger(config.log_level, max_bytes=config.log_max_bytes,
+                          backup_count=config.log_backup_count, max_age_days=config.log_max_age_days)
+
+    def shutdown(self):
+        """Flushes queued records and stops the writer thread."""
+        if self.listener is not None:
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
+
+    def log(self, level: int, message: str, exc_info: bool = False, **fields: Any):
+        if self.logger.isEnabledFor(level):
+            extra = {key: fields.pop(key) for key in EVENT_FIELDS if key in fields}
+            extra['fields'] = fields
+            self.logger.log(level, message, exc_info=exc_info, extra=extra)
+
+    def info(self, message: str, **fields: Any):
+        self.log(logging.INFO, message, **fields)
+
+    def warning(self, message: str, **fields: Any):
+        self.log(logging.WARNING, message, **fields)
+
+    def error(self, message: str, **fields: Any):
+        self.log(logging.ERROR, message, **fields)
+
+    def debug(self, message: str, **fields: Any):
+        self.log(logging.DEBUG, message, **fields)
+
+    def critical(self, message: str, **fields: Any):
+        self.log(logging.CRITICAL, message, **fields)
+
+    @contextmanager
+    def operation(self, name: str, **fields: Any):
+        """Tags everything logged inside with a fresh operation id and logs the duration at the end."""
+        context: Dict[str, Any] = dict(_current_operation.get() or {})
+        context.update(fields)
+        context['operation'] = name
+        context['operation_id'] = uuid.uuid4().hex[:12]
+        token = _current_operation.set(context)
+        started = time.perf_counter()
+        try:
+            yield context['operation_id']
+        except Exception as e:
+            self.error(f"{name} failed: {e}", duration_ms=round((time.perf_counter() - started) * 1000, 2))
+            raise
+        else:
+            self.info(f"{name} finished", duration_ms=round((time.perf_counter() - started) * 1000, 2))
+        finally:
+            _current_operation.reset(token)
 
 # Convenience function to get logger instance
 def get_logger() -> Logger:
-    return Logger()
\ No newline at end of file
+    return Logger()